@@ -0,0 +1,365 @@
+"""
+Single entry point for the altos_one utilities.
+
+    python altos.py <command> [options]       run a command
+    python altos.py serve                     start the long-lived worker
+    python altos.py --worker <command> ...    run a command inside the worker
+
+Each command imports its module only when it runs, so lightweight commands
+(check, recent, address, delete-week) use plain sqlite3 and never load pandas.
+The worker keeps pandas, the report modules and the zip_to_metro mapping
+loaded and serves commands over a local Unix socket, so repeated scheduled
+reports skip the import and mapping cost entirely.
+"""
+import sys
+
+DB_NAME = 'altos_one.db'
+SOCKET_PATH = 'altos_worker.sock'
+
+
+# --- commands ---------------------------------------------------------------
+# Every command imports what it needs inside the function.
+
+def cmd_check(args):
+    from check_data import check_table_counts
+    check_table_counts(args.db)
+
+
+def cmd_recent(args):
+    from check_data import check_most_recent_dates
+    check_most_recent_dates(args.db)
+
+
+def cmd_address(args):
+    from find_address import search_address
+    search_address(args.query, args.db)
+
+
+def cmd_delete_week(args):
+    from delete_week_data import delete_rows_for_week
+    if not args.yes:
+        print(f"Refusing to delete '{args.table}' rows for {args.by} {args.date} without --yes.")
+        return 1
+    delete_rows_for_week(args.table, args.date, args.db, column=args.by,
+                         batch_size=args.batch_size, vacuum=args.vacuum)
+    if not args.no_snapshot:
+        from snapshot import publish_snapshot
+        publish_snapshot(args.db)
+
+
+def cmd_solds_summary(args):
+    from analyze_solds_summary import summarize_by_market_parallel, summarize_solds
+    from report_cache import cached_report
+    if args.rollup:
+        from solds_rollup import refresh_rollup, summary_from_rollup
+        refresh_rollup(args.db)
+        compute = lambda: summary_from_rollup(args.db, args.ratio, args.top50)
+    elif args.parallel:
+        compute = lambda: summarize_by_market_parallel(args.db, args.ratio, args.top50)
+    else:
+        compute = lambda: summarize_solds(args.db, args.ratio, args.top50)
+    weeks_count, summary = cached_report(
+        'solds_summary', {'calc_ratio': args.ratio, 'top50': args.top50, 'rollup': args.rollup}, compute,
+        args.db, tables=['solds', 'zip_to_metro']
+    )
+    weeks_count.to_csv(args.weeks_out, index=False)
+    summary.to_csv(args.out, index=False)
+    print(f"✅ Exported weekly sold counts to '{args.weeks_out}' and summary to '{args.out}' with {len(summary)} rows")
+
+
+def cmd_extract_metro(args):
+    from extract_solds_by_metro import extract_solds_by_metro, extract_solds_by_metro_parallel
+    from report_cache import cached_report
+    if args.parallel:
+        compute = lambda: extract_solds_by_metro_parallel(args.db, args.metro)
+    else:
+        compute = lambda: extract_solds_by_metro(args.db, args.metro)
+    df = cached_report('solds_by_metro', {'metro': args.metro.lower()}, compute,
+                       args.db, tables=['solds', 'zip_to_metro'])
+    output_file = f"sold_properties_{args.metro.replace(' ', '_')}.csv"
+    df.to_csv(output_file, index=False)
+    print(f"Extracted {len(df)} sold records for metro matching '{args.metro}' into {output_file}")
+
+
+def cmd_missing_parcels(args):
+    from analyze_listings_missing_parcel import analyze_missing_parcels
+    analyze_missing_parcels(args.db)
+
+
+def cmd_comps(args):
+    from comps import run_comps
+    comps = run_comps(args.date, args.db, n_comps=args.n, new_only=not args.all_listings)
+    print(f"✅ Wrote {len(comps)} comps for listings dated {args.date} to the 'comps' table.")
+
+
+def cmd_archive(args):
+    from archive_weeks import archive_weeks
+    if not args.yes:
+        print(f"Refusing to archive weeks older than {args.months} months without --yes.")
+        return 1
+    archive_weeks(args.months, args.db, cold_months=args.cold_months)
+
+
+def cmd_watch(args):
+    from ingest_watcher import watch
+    watch(args.db, args.drop_dir, poll_seconds=args.poll, stable_seconds=args.stable)
+
+
+def cmd_profile(args):
+    from profile_tables import PROFILE_TABLES, profile_tables
+    profile_tables(args.db, args.tables or PROFILE_TABLES, args.sample, seed=args.seed, analyze=args.analyze)
+
+
+def cmd_diff(args):
+    from snapshot_diff import export_diff
+    if export_diff(args.table, args.old, args.new, key=args.key, db_name=args.db) is None:
+        return 1
+
+
+def cmd_cluster(args):
+    from cluster_tables import cluster_tables
+    cluster_tables(args.tables or ['solds'], args.order, args.db, vacuum=args.vacuum, bench=not args.no_benchmark)
+
+
+def cmd_compare_reports(args):
+    from compare_report_outputs import print_results, run_comparison
+    results = run_comparison(args.dir, args.properties, args.weeks, args.seed, args.repeat, args.case)
+    if print_results(results):
+        return 1
+
+
+def cmd_snapshot(args):
+    from snapshot import publish_snapshot
+    publish_snapshot(args.db, keep=args.keep)
+
+
+# Prompt-driven scripts, run as-is (not available through the worker).
+INTERACTIVE = {
+    'load': 'insert_weekly_data',
+    'withdrawals': 'find_withdrawals',
+    'common': 'find_common_properties',
+    'duplicates': 'find_listing_duplicates',
+    'import-zips': 'import_zip_to_metro',
+    'initialize': 'initialize_database',
+    'partition': 'week_partitions',
+    'cohorts': 'solds_cohorts',
+}
+
+
+def run_tracked(args):
+    """Run a parsed command, recording its time in run_metrics (load_metrics.py)."""
+    if args.command in ('serve', 'watch'):
+        return args.func(args) or 0
+    from load_metrics import track_run
+    with track_run('command', args.command, args.db):
+        return args.func(args) or 0
+
+
+def run_interactive(module_name):
+    import importlib
+    importlib.import_module(module_name).main()
+
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog='altos.py', description="altos_one data utilities")
+    parser.add_argument('--db', default=DB_NAME, help="SQLite database (default altos_one.db)")
+    parser.add_argument('--worker', action='store_true', help="run the command in the long-lived worker")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('check', help="row counts per table and date").set_defaults(func=cmd_check)
+    sub.add_parser('recent', help="most recent date per table").set_defaults(func=cmd_recent)
+
+    p = sub.add_parser('address', help="search all tables for a partial street address")
+    p.add_argument('query')
+    p.set_defaults(func=cmd_address)
+
+    p = sub.add_parser('delete-week', help="delete one snapshot date from a table")
+    p.add_argument('table', choices=['listings', 'pendings', 'solds'])
+    p.add_argument('date')
+    p.add_argument('--by', choices=['date', 'load_date'], default='date', help="match the snapshot date or the load_date")
+    p.add_argument('--batch-size', type=int, default=50000)
+    p.add_argument('--vacuum', action='store_true', help="run incremental vacuum afterwards")
+    p.add_argument('--yes', action='store_true')
+    p.add_argument('--no-snapshot', action='store_true', help="don't republish the read-only snapshot")
+    p.set_defaults(func=cmd_delete_week)
+
+    p = sub.add_parser('solds-summary', help="monthly solds summary by market and type")
+    p.add_argument('--top50', action='store_true')
+    p.add_argument('--ratio', action='store_true')
+    p.add_argument('--parallel', action='store_true')
+    p.add_argument('--rollup', action='store_true', help="use the incremental rollup (sketch medians)")
+    p.add_argument('--weeks-out', default='sold_weeks_count.csv')
+    p.add_argument('--out', default='solds_summary_by_date.csv')
+    p.set_defaults(func=cmd_solds_summary)
+
+    p = sub.add_parser('extract-metro', help="export solds for metros matching a name")
+    p.add_argument('metro')
+    p.add_argument('--parallel', action='store_true')
+    p.set_defaults(func=cmd_extract_metro)
+
+    sub.add_parser('missing-parcels', help="listings missing parcel_number by week and metro").set_defaults(func=cmd_missing_parcels)
+
+    p = sub.add_parser('comps', help="batch comparable sales for a listings week")
+    p.add_argument('date')
+    p.add_argument('--n', type=int, default=5)
+    p.add_argument('--all-listings', action='store_true')
+    p.set_defaults(func=cmd_comps)
+
+    p = sub.add_parser('archive', help="move old weeks into the archive tier")
+    p.add_argument('--months', type=int, default=12)
+    p.add_argument('--cold-months', type=int, default=24,
+                   help="compress archived months older than this into per-month files")
+    p.add_argument('--yes', action='store_true')
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('profile', help="constant-time schema, stats and spread sample per table")
+    p.add_argument('tables', nargs='*', metavar='table', help="listings, pendings, solds, zip_to_metro (default all)")
+    p.add_argument('--sample', type=int, default=200, help="rows to sample per table")
+    p.add_argument('--seed', type=int, help="randomize the sample positions")
+    p.add_argument('--analyze', action='store_true', help="run a bounded ANALYZE on the live database first")
+    p.set_defaults(func=cmd_profile)
+
+    p = sub.add_parser('diff', help="added/removed/changed rows between two snapshot dates")
+    p.add_argument('table', choices=['listings', 'pendings'])
+    p.add_argument('--old', help="older date (default the second newest)")
+    p.add_argument('--new', help="newer date (default the newest)")
+    p.add_argument('--key', help="match rows on this column (default listing_id/pending_id)")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser('cluster', help="rewrite tables in regional order so metro/state reads hit contiguous pages")
+    p.add_argument('tables', nargs='*', metavar='table', help="solds, listings, pendings (default solds)")
+    p.add_argument('--order', choices=['metro', 'zip'], default='metro',
+                   help="metro: (metro_key, date); zip: (state, zip, date)")
+    p.add_argument('--vacuum', action='store_true', help="full VACUUM afterwards to shrink the file")
+    p.add_argument('--no-benchmark', action='store_true', help="skip the before/after page-spread benchmark")
+    p.set_defaults(func=cmd_cluster)
+
+    p = sub.add_parser('compare-reports', help="check the fast report paths against the original implementations")
+    p.add_argument('--dir', default='report_comparison', help="empty scratch directory for the dataset and outputs")
+    p.add_argument('--properties', type=int, default=2000)
+    p.add_argument('--weeks', type=int, default=6)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=3, help="time each path as the best of this many runs")
+    p.add_argument('--case', action='append', help="only this case (repeatable)")
+    p.set_defaults(func=cmd_compare_reports)
+
+    p = sub.add_parser('snapshot', help="publish a read-only snapshot for the reports")
+    p.add_argument('--keep', type=int, default=2)
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser('watch', help="load CSVs dropped into a folder as they arrive")
+    p.add_argument('--drop-dir', default='incoming')
+    p.add_argument('--poll', type=float, default=5, help="seconds between folder scans")
+    p.add_argument('--stable', type=float, default=10, help="seconds a file must be unchanged before loading")
+    p.set_defaults(func=cmd_watch)
+
+    sub.add_parser('serve', help="start the long-lived worker").set_defaults(func=lambda args: serve(db_name=args.db))
+
+    for name, module_name in INTERACTIVE.items():
+        sub.add_parser(name, help=f"run {module_name}.py (prompts)").set_defaults(func=None, interactive=module_name)
+    return parser
+
+
+def run_command(argv):
+    """Parse argv and run the command in this process. Returns an exit status."""
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'interactive', None):
+        run_interactive(args.interactive)
+        return 0
+    return run_tracked(args)
+
+
+# --- worker -----------------------------------------------------------------
+
+def serve(socket_path=SOCKET_PATH, db_name=DB_NAME):
+    """Serve commands over a Unix socket with pandas and the mapping kept warm."""
+    import contextlib
+    import io
+    import json
+    import os
+    import signal
+    import socketserver
+    import load_metrics
+
+    # This process's peak RSS would be the all-time peak, not the run's
+    load_metrics.RECORD_PEAK_RSS = False
+
+    # Warm everything the report commands use.
+    import pandas  # noqa: F401
+    import analyze_solds_summary
+    import extract_solds_by_metro  # noqa: F401
+    import analyze_listings_missing_parcel  # noqa: F401
+    if os.path.exists(db_name):
+        analyze_solds_summary.load_zip_to_metro(db_name)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            output = io.StringIO()
+            status = 0
+            cwd = os.getcwd()
+            try:
+                os.chdir(request.get('cwd', cwd))
+                with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                    args = build_parser().parse_args(request['argv'])
+                    if getattr(args, 'interactive', None) or args.command in ('serve', 'watch'):
+                        print(f"'{args.command}' can't run in the worker; run it directly.")
+                        status = 2
+                    else:
+                        status = run_tracked(args)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 2
+            except Exception as e:
+                output.write(f"❌ {type(e).__name__}: {e}\n")
+                status = 1
+            finally:
+                os.chdir(cwd)
+            self.wfile.write(json.dumps({'status': status, 'output': output.getvalue()}).encode() + b'\n')
+
+    # Treat `kill` like Ctrl-C so the socket file is cleaned up.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # One request at a time: commands share this process's cwd and the single SQLite writer.
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        print(f"✅ Worker listening on '{socket_path}' (Ctrl-C to stop).")
+        try:
+            server.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def send_to_worker(argv, socket_path=SOCKET_PATH):
+    """Run a command in the worker and print its output. Returns None if no worker is running."""
+    import json
+    import os
+    import socket
+    if not os.path.exists(socket_path):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+        sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+        response = json.loads(sock.makefile('rb').readline())
+    sys.stdout.write(response['output'])
+    return response['status']
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if '--worker' in argv:
+        argv.remove('--worker')
+        status = send_to_worker(argv)
+        if status is not None:
+            return status
+        print("No worker running; running the command directly.", file=sys.stderr)
+    return run_command(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
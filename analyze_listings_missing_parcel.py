@@ -1,55 +1,36 @@
-import sqlite3
 import pandas as pd
 import os
+from db import reader
+from archive_weeks import attach_archives
 
 def analyze_missing_parcels(db_name='altos_one.db', output_file="listings_missing_parcel_by_week_and_metro.csv"):
+    """Write (and return) the missing-parcel counts per week and metro; None if it failed."""
     try:
-        conn = sqlite3.connect(db_name)
+        with reader(db_name) as conn:
+            attach_archives(conn, tables=['listings'])
+            # 1) Count listings missing parcel_number per week and metro. A zip
+            # listed under several metros counts in each of them, so this joins
+            # zip_to_metro on zip rather than grouping by the single metro_key.
+            try:
+                result = pd.read_sql_query("""
+                    SELECT l.date, COALESCE(z.metro, 'UNKNOWN') AS metro, COUNT(*) AS missing_parcel_count
+                    FROM listings l
+                    LEFT JOIN zip_to_metro z ON z.zipcode = l.zip
+                    WHERE l.parcel_number IS NULL OR TRIM(l.parcel_number) = ''
+                    GROUP BY l.date, COALESCE(z.metro, 'UNKNOWN')
+                    ORDER BY 1, 2
+                """, conn)
+                missing = conn.execute(
+                    "SELECT COUNT(*) FROM listings WHERE parcel_number IS NULL OR TRIM(parcel_number) = ''"
+                ).fetchone()[0]
+                print(f"Found {missing} listings with missing parcel_number.")
+            except Exception as e:
+                print(f"❌ Error querying listings table: {e}")
+                return
     except Exception as e:
         print(f"❌ Failed to connect to database '{db_name}': {e}")
         return
 
-    # 1) Load listings data
-    try:
-        listings = pd.read_sql_query("SELECT date, zip, parcel_number FROM listings", conn)
-        print(f"Loaded {len(listings)} rows from listings.")
-    except Exception as e:
-        print(f"❌ Error querying listings table: {e}")
-        conn.close()
-        return
-
-    # 2) Load zip_to_metro mapping
-    try:
-        zip_to_metro = pd.read_sql_query("SELECT zipcode, metro FROM zip_to_metro", conn)
-        print(f"Loaded {len(zip_to_metro)} rows from zip_to_metro.")
-    except Exception as e:
-        print(f"❌ Error querying zip_to_metro table: {e}")
-        conn.close()
-        return
-    finally:
-        conn.close()
-
-    # 3) Merge to get metro
-    df = pd.merge(listings, zip_to_metro,
-                  left_on='zip', right_on='zipcode',
-                  how='left')
-    df.drop(columns=['zipcode'], inplace=True)
-    df['metro'] = df['metro'].fillna('UNKNOWN')
-
-    # 4) Filter missing parcel_number
-    missing = df[
-        df['parcel_number'].isnull() |
-        (df['parcel_number'].astype(str).str.strip() == "")
-    ]
-    print(f"Found {len(missing)} listings with missing parcel_number.")
-
-    # 5) Group by date & metro
-    result = (
-        missing
-        .groupby(['date', 'metro'])
-        .size()
-        .reset_index(name='missing_parcel_count')
-    )
     print(f"Result has {len(result)} rows (date × metro combinations).")
 
     # 6) Write CSV
@@ -64,6 +45,7 @@ def analyze_missing_parcels(db_name='altos_one.db', output_file="listings_missin
         print(f"✅ Exported missing-parcel summary to '{output_file}'")
     else:
         print(f"❌ Expected output file '{output_file}' not found!")
+    return result
 
 def main():
     analyze_missing_parcels()
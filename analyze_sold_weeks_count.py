@@ -1,11 +1,10 @@
-import sqlite3
 import pandas as pd
+from db import reader
 
 def analyze_solds_weeks_count(db_name='altos_one.db', target_date=None, output_file=None):
     # Connect to the database and load the solds table.
-    conn = sqlite3.connect(db_name)
-    df = pd.read_sql_query("SELECT * FROM solds", conn)
-    conn.close()
+    with reader(db_name) as conn:
+        df = pd.read_sql_query("SELECT * FROM solds", conn)
     
     # Group by the 'date' column and count non-null entries for 'listed_on' and 'pending_on'
     grouped = df.groupby('date').agg(
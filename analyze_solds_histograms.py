@@ -1,11 +1,10 @@
-import sqlite3
 import pandas as pd
+from db import reader
 
 def analyze_solds_histograms(db_name='altos_one.db'):
     # Connect to the SQLite database and read the entire solds table.
-    conn = sqlite3.connect(db_name)
-    df = pd.read_sql_query("SELECT * FROM solds", conn)
-    conn.close()
+    with reader(db_name) as conn:
+        df = pd.read_sql_query("SELECT * FROM solds", conn)
     
     # --- Group by the listed_on column ---
     # We first filter out any null or blank values.
@@ -1,12 +1,14 @@
-import sqlite3
 import pandas as pd
+from db import reader
+from parallel_reports import UNKNOWN_METRO, list_market_names, run_partitioned
+from report_cache import cached_report
+from data_versions import data_version_token
 
 ## this script is for calculating the list-to-sale ratio and aggregating solds data
 def load_solds(db_path='altos_one.db'):
     """Load the solds table into a DataFrame."""
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM solds", conn)
-    conn.close()
+    with reader(db_path) as conn:
+        df = pd.read_sql_query("SELECT * FROM solds", conn)
     return df
 
 
@@ -19,12 +21,21 @@ def process_solds(df):
     return df
 
 
+# In-process copy of zip_to_metro per database, reused while its data version
+# is unchanged (keeps the mapping warm in the long-lived altos.py worker).
+_zip_to_metro_cache = {}
+
+
 def load_zip_to_metro(db_path='altos_one.db'):
     """Load the zip_to_metro mapping (zipcode, metro, display_name)."""
-    conn = sqlite3.connect(db_path)
-    mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
-    conn.close()
-    return mapping
+    with reader(db_path) as conn:
+        token = data_version_token(conn, ['zip_to_metro'])
+        cached = _zip_to_metro_cache.get(db_path)
+        if cached is not None and cached[0] == token:
+            return cached[1].copy()
+        mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
+    _zip_to_metro_cache[db_path] = (token, mapping)
+    return mapping.copy()
 
 
 def join_metro(df, mapping):
@@ -49,9 +60,14 @@ def calculate_ratio(df):
     return df
 
 
+def weekly_counts(df):
+    """Sold counts by sold_month."""
+    return df.groupby('sold_month').size().reset_index(name='sold_count')
+
+
 def export_weekly_counts(df, output_file='sold_weeks_count.csv'):
     """Export CSV of sold counts by sold_month."""
-    weeks_count = df.groupby('sold_month').size().reset_index(name='sold_count')
+    weeks_count = weekly_counts(df)
     weeks_count.to_csv(output_file, index=False)
     print(f"✅ Exported weekly sold counts to '{output_file}'")
 
@@ -74,14 +90,58 @@ def aggregate_summary(df, calc_ratio=False):
     return summary
 
 
-def main():
-    db_path = 'altos_one.db'
-    # User options
-    top50_choice = input("Include only top50 metros? (y/n, default n): ").strip().lower()
-    filter_top50 = (top50_choice == 'y')
-    calc_choice = input("Calculate list-to-sale ratio? (y/n, default n): ").strip().lower()
-    calc_ratio = (calc_choice == 'y')
-
+def load_solds_for_market(conn, market_name):
+    """Load the solds (already joined to metro/display_name) for one market partition."""
+    if market_name == UNKNOWN_METRO:
+        query = """
+        SELECT s.*, 'UNKNOWN' AS metro, '' AS display_name
+        FROM solds s
+        WHERE NOT EXISTS (SELECT 1 FROM zip_to_metro z WHERE z.zipcode = s.zip)
+        """
+        return pd.read_sql_query(query, conn)
+    query = """
+    SELECT s.*, z.metro, COALESCE(z.display_name, '') AS display_name
+    FROM solds s
+    JOIN zip_to_metro z ON s.zip = z.zipcode
+    WHERE COALESCE(NULLIF(z.display_name, ''), z.metro) = ?
+    """
+    return pd.read_sql_query(query, conn, params=(market_name,))
+
+
+def summarize_market(conn, market_name, calc_ratio=False, filter_top50=False):
+    """Partition task: monthly counts and summary for a single market."""
+    df = process_solds(load_solds_for_market(conn, market_name))
+    if filter_top50:
+        df = df[df['display_name'] != '']
+    weeks_count = weekly_counts(df)
+    if calc_ratio:
+        df = calculate_ratio(df)
+    if df.empty:
+        return weeks_count, None
+    return weeks_count, aggregate_summary(df, calc_ratio)
+
+
+def summarize_by_market_parallel(db_path='altos_one.db', calc_ratio=False, filter_top50=False, max_workers=None):
+    """
+    Same output as the serial export_weekly_counts/aggregate_summary pipeline,
+    computed one market per worker process and concatenated in a fixed order.
+    """
+    with reader(db_path) as conn:
+        markets = list_market_names(conn, include_unknown=not filter_top50)
+    results = run_partitioned(summarize_market, markets, db_path,
+                              args=(calc_ratio, filter_top50), max_workers=max_workers)
+
+    weeks_count = pd.concat([wc for _, (wc, _) in results], ignore_index=True)
+    weeks_count = weeks_count.groupby('sold_month', as_index=False)['sold_count'].sum()
+    summaries = [s for _, (_, s) in results if s is not None]
+    summary = pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame()
+    if not summary.empty:
+        summary = summary.sort_values(['sold_month', 'market_name', 'type'], ignore_index=True)
+    return weeks_count, summary
+
+
+def summarize_solds(db_path='altos_one.db', calc_ratio=False, filter_top50=False):
+    """Serial pipeline: returns (weekly sold counts, summary) over the whole solds table."""
     # Load and process data
     df = load_solds(db_path)
     df = process_solds(df)
@@ -92,17 +152,41 @@ def main():
     if filter_top50:
         df = df[df['display_name'] != '']
 
-    # Export weekly counts
-    default_weeks = 'sold_weeks_count.csv'
-    weeks_file = input(f"Enter filename for sold weeks count (default {default_weeks}): ").strip() or default_weeks
-    export_weekly_counts(df, weeks_file)
+    weeks_count = weekly_counts(df)
 
     # Calculate ratio if requested
     if calc_ratio:
         df = calculate_ratio(df)
 
-    # Aggregate and export summary
-    summary = aggregate_summary(df, calc_ratio)
+    return weeks_count, aggregate_summary(df, calc_ratio)
+
+
+def main():
+    db_path = 'altos_one.db'
+    # User options
+    top50_choice = input("Include only top50 metros? (y/n, default n): ").strip().lower()
+    filter_top50 = (top50_choice == 'y')
+    calc_choice = input("Calculate list-to-sale ratio? (y/n, default n): ").strip().lower()
+    calc_ratio = (calc_choice == 'y')
+    parallel_choice = input("Run in parallel by metro? (y/n, default n): ").strip().lower()
+
+    if parallel_choice == 'y':
+        compute = lambda: summarize_by_market_parallel(db_path, calc_ratio, filter_top50)
+    else:
+        compute = lambda: summarize_solds(db_path, calc_ratio, filter_top50)
+    # Reuse the last result until solds or zip_to_metro change
+    weeks_count, summary = cached_report(
+        'solds_summary', {'calc_ratio': calc_ratio, 'top50': filter_top50}, compute,
+        db_path, tables=['solds', 'zip_to_metro']
+    )
+
+    # Export weekly counts
+    default_weeks = 'sold_weeks_count.csv'
+    weeks_file = input(f"Enter filename for sold weeks count (default {default_weeks}): ").strip() or default_weeks
+    weeks_count.to_csv(weeks_file, index=False)
+    print(f"✅ Exported weekly sold counts to '{weeks_file}'")
+
+    # Export summary
     default_summary = 'solds_summary_by_date.csv'
     summary_file = input(f"Enter filename for summary (default {default_summary}): ").strip() or default_summary
     summary.to_csv(summary_file, index=False)
@@ -0,0 +1,380 @@
+import glob
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+from db import connect, file_uri
+from data_versions import bump_data_version
+from week_partitions import delete_date, is_partitioned
+from column_stats import forget_dates
+
+# Archival tier for old weekly snapshots.
+#
+# archive_weeks() moves whole weeks older than N months out of listings and
+# pendings into two archive tiers:
+#  - warm: one SQLite file per table (archive/listings.db), without the hot
+#    table's extra indexes. One file keeps a connection well under SQLite's
+#    limit of 10 attached databases however many months are archived.
+#  - cold: months older than COLD_MONTHS leave the warm file for one
+#    gzip-compressed SQLite file per month (archive/listings/2023-01.db.gz).
+# attach_archives() attaches the warm file and a thawed copy of the cold months
+# (archive/.thawed/listings.db, rebuilt whenever a cold file changes) to a
+# connection and creates TEMP views named after the tables, which SQLite
+# resolves before main.<table>; existing queries then see hot and archived rows
+# together without any change. The thawed copy is only a cache: deleting it
+# costs the next report the decompression. Maintenance that rewrites archived
+# rows goes through editable_archives(), which decompresses the cold months and
+# compresses them again afterwards.
+#
+# Yearly files written by earlier versions (archive/listings_2024.db) are
+# merged into the warm file on the next archive_weeks() run; until then they
+# are attached too, within the limit.
+
+ARCHIVE_DIR = 'archive'
+ARCHIVE_TABLES = ['listings', 'pendings']
+DEFAULT_MONTHS = 12
+COLD_MONTHS = 24         # archived months older than this are compressed
+THAWED_DIR = '.thawed'
+MAX_ATTACHED = 10        # SQLite's default SQLITE_MAX_ATTACHED
+
+
+def archive_path(table, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"{table}.db")
+
+
+def legacy_archive_files(table, archive_dir=ARCHIVE_DIR):
+    """{year: path} of the per-year archive files written by earlier versions."""
+    files = {}
+    for path in glob.glob(os.path.join(archive_dir, f"{table}_*.db")):
+        m = re.fullmatch(rf"{table}_(\d{{4}})\.db", os.path.basename(path))
+        if m:
+            files[m.group(1)] = path
+    return dict(sorted(files.items()))
+
+
+def cold_month_files(table, archive_dir=ARCHIVE_DIR):
+    """{YYYY-MM: path} of the compressed per-month files for table."""
+    files = {}
+    for path in glob.glob(os.path.join(archive_dir, table, "*.db.gz")):
+        m = re.fullmatch(r"(\d{4}-\d{2})\.db\.gz", os.path.basename(path))
+        if m:
+            files[m.group(1)] = path
+    return dict(sorted(files.items()))
+
+
+def _gzip(src, dest):
+    """Compress src into dest (replacing it in one step) and remove src."""
+    tmp = f"{dest}.tmp"
+    with open(src, 'rb') as f_in, gzip.open(tmp, 'wb', compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.replace(tmp, dest)
+    os.remove(src)
+
+
+def _gunzip(src, dest):
+    with gzip.open(src, 'rb') as f_in, open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+
+def _archive_schemas(table, archive_dir=ARCHIVE_DIR):
+    """[(schema name to attach as, path)] of the existing archive files for table."""
+    path = archive_path(table, archive_dir)
+    schemas = [(f"arch_{table}", path)] if os.path.exists(path) else []
+    return schemas + [(f"arch_{table}_{year}", p) for year, p in legacy_archive_files(table, archive_dir).items()]
+
+
+def archive_files(table, archive_dir=ARCHIVE_DIR):
+    """Paths of the existing uncompressed archive files for table (its warm file plus any yearly leftovers)."""
+    return [path for _, path in _archive_schemas(table, archive_dir)]
+
+
+@contextmanager
+def editable_archives(table, archive_dir=ARCHIVE_DIR):
+    """
+    Paths of every archive file of table, for rewriting archived rows: the
+    warm file, any yearly leftovers and each cold month decompressed. The cold
+    months are compressed again on exit, or left as they were on an error.
+    """
+    opened = {}
+    try:
+        for gz in cold_month_files(table, archive_dir).values():
+            work = gz[:-len('.gz')]
+            _gunzip(gz, work)
+            opened[work] = gz
+        yield archive_files(table, archive_dir) + list(opened)
+        for work, gz in opened.items():
+            _gzip(work, gz)
+    finally:
+        for work in opened:
+            if os.path.exists(work):
+                os.remove(work)
+
+
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def cutoff_date(months, today=None):
+    """First day of the month `months` months before today, as YYYY-MM-DD."""
+    today = today or date.today()
+    month_index = today.year * 12 + (today.month - 1) - months
+    return date(month_index // 12, month_index % 12 + 1, 1).strftime('%Y-%m-%d')
+
+
+def month_bounds(month):
+    """(first day, first day of the next month) of a YYYY-MM month, as YYYY-MM-DD."""
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{month}-01", date(year + mon // 12, mon % 12 + 1, 1).strftime('%Y-%m-%d')
+
+
+def _prepare_archive_table(conn, table, source='main', target='arch'):
+    """Create target.<table> (or add columns `source` gained since) and return source's columns."""
+    hot_cols = _columns(conn, source, table)
+    arch_cols = _columns(conn, target, table)
+    if not arch_cols:
+        conn.execute(f"CREATE TABLE {target}.{table} AS SELECT * FROM {source}.{table} WHERE 0")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {target}.idx_{table}_date ON {table} (date)")
+    else:
+        for col in hot_cols:
+            if col not in arch_cols:
+                conn.execute(f"ALTER TABLE {target}.{table} ADD COLUMN {col}")
+    return hot_cols
+
+
+def _merge_legacy(conn, table, archive_dir):
+    """Fold the yearly archive files of table into arch (attached) and delete them."""
+    for year, path in legacy_archive_files(table, archive_dir).items():
+        conn.execute("ATTACH DATABASE ? AS legacy", (path,))
+        try:
+            cols = ",".join(_prepare_archive_table(conn, table, 'legacy'))
+            # Replace rather than append, so a merge interrupted before the delete can be re-run
+            conn.execute(f"DELETE FROM arch.{table} WHERE date IN (SELECT DISTINCT date FROM legacy.{table})")
+            conn.execute(f"INSERT INTO arch.{table} ({cols}) SELECT {cols} FROM legacy.{table}")
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+        os.remove(path)
+        print(f"Merged '{path}' into '{archive_path(table, archive_dir)}'.")
+
+
+def _compress_cold(conn, table, cutoff, archive_dir):
+    """Move the months of arch.<table> before cutoff into compressed per-month files."""
+    months = [r[0] for r in conn.execute(
+        f"SELECT DISTINCT substr(date, 1, 7) FROM arch.{table} WHERE date < ? ORDER BY 1", (cutoff,)
+    )]
+    if months:
+        os.makedirs(os.path.join(archive_dir, table), exist_ok=True)
+    for month in months:
+        path = os.path.join(archive_dir, table, f"{month}.db.gz")
+        work = path[:-len('.gz')]
+        if os.path.exists(path):
+            # More weeks of a month that is already cold: add them to its file
+            _gunzip(path, work)
+        bounds = month_bounds(month)
+        conn.execute("ATTACH DATABASE ? AS cold", (work,))
+        try:
+            cols = ",".join(_prepare_archive_table(conn, table, 'arch', 'cold'))
+            # Replace rather than append, so a run interrupted before the delete can be re-run
+            conn.execute(f"DELETE FROM cold.{table} WHERE date IN "
+                         f"(SELECT DISTINCT date FROM arch.{table} WHERE date >= ? AND date < ?)", bounds)
+            moved = conn.execute(f"INSERT INTO cold.{table} ({cols}) SELECT {cols} FROM arch.{table} "
+                                 "WHERE date >= ? AND date < ?", bounds).rowcount
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE cold")
+        _gzip(work, path)
+        conn.execute(f"DELETE FROM arch.{table} WHERE date >= ? AND date < ?", bounds)
+        conn.commit()
+        print(f"Compressed {moved} archived rows of '{table}' for {month} into '{path}'.")
+
+
+def archive_weeks(months=DEFAULT_MONTHS, db_name='altos_one.db', archive_dir=ARCHIVE_DIR, tables=ARCHIVE_TABLES,
+                  cold_months=COLD_MONTHS):
+    """
+    Move every week older than `months` months from the hot tables into the
+    warm archive files, then every archived month older than `cold_months`
+    months into compressed per-month files (cold_months=None keeps them warm).
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = cutoff_date(months)
+    cold_cutoff = cutoff_date(cold_months) if cold_months is not None else None
+    conn = connect(db_name)
+    touched = set()
+
+    for table in tables:
+        dates = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT date FROM {table} WHERE date < ? ORDER BY date", (cutoff,)
+        )]
+        legacy = legacy_archive_files(table, archive_dir)
+        path = archive_path(table, archive_dir)
+        if not dates and not legacy and (cold_cutoff is None or not os.path.exists(path)):
+            print(f"No weeks in '{table}' older than {cutoff}.")
+            continue
+
+        conn.execute("ATTACH DATABASE ? AS arch", (path,))
+        try:
+            cols = ",".join(_prepare_archive_table(conn, table))
+            conn.commit()
+            _merge_legacy(conn, table, archive_dir)
+            for d in dates:
+                # Copy first and commit, then delete from the hot table. Re-running
+                # after a crash in between just replaces the archived copy.
+                conn.execute(f"DELETE FROM arch.{table} WHERE date = ?", (d,))
+                cursor = conn.execute(
+                    f"INSERT INTO arch.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE date = ?", (d,)
+                )
+                conn.commit()
+                moved = cursor.rowcount
+                if is_partitioned(conn, table):
+                    # Drop the week's partition rather than deleting its rows
+                    delete_date(conn, table, d)
+                else:
+                    conn.execute(f"DELETE FROM main.{table} WHERE date = ?", (d,))
+                forget_dates(conn, table, [d])
+                # The week left the hot table: reports that don't attach archives change
+                bump_data_version(conn, table, [d])
+                conn.commit()
+                print(f"Archived {moved} rows of '{table}' for {d} into '{path}'.")
+            if cold_cutoff is not None:
+                _compress_cold(conn, table, cold_cutoff, archive_dir)
+        finally:
+            conn.execute("DETACH DATABASE arch")
+        touched.add(path)
+
+    conn.close()
+
+    for path in sorted(touched):
+        arch = sqlite3.connect(path)
+        # Free pages come from re-archived weeks and from months moved out to the cold tier
+        if arch.execute("PRAGMA freelist_count").fetchone()[0]:
+            arch.execute("VACUUM")
+        arch.close()
+    cold = f"; months before {cold_cutoff} are compressed" if cold_cutoff else ""
+    print(f"✅ Archived weeks older than {cutoff} into {len(touched)} archive file(s){cold}.")
+
+
+def _attach_limit(conn):
+    if hasattr(conn, 'getlimit'):    # Python 3.11+
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    return MAX_ATTACHED
+
+
+def thaw(table, archive_dir=ARCHIVE_DIR):
+    """
+    Path of one SQLite file holding every cold month of table decompressed,
+    rebuilt when a cold file has changed since; None if table has no cold months.
+    """
+    files = cold_month_files(table, archive_dir)
+    if not files:
+        return None
+    signature = sorted((month, os.stat(p).st_size, os.stat(p).st_mtime_ns) for month, p in files.items())
+    path = os.path.join(archive_dir, THAWED_DIR, f"{table}.db")
+    if os.path.exists(path):
+        try:
+            conn = sqlite3.connect(f"{file_uri(path)}?mode=ro", uri=True)
+            try:
+                built = sorted(tuple(r) for r in conn.execute("SELECT month, size, mtime_ns FROM thawed_months"))
+            finally:
+                conn.close()
+            if built == signature:
+                return path
+        except sqlite3.Error:
+            pass    # Unreadable or half-built: build it again
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Built under a private name and renamed, so readers never see a partial copy
+    tmp = f"{path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("CREATE TABLE thawed_months (month TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        for month, gz in files.items():
+            work = f"{tmp}.{month}"
+            _gunzip(gz, work)
+            try:
+                conn.execute("ATTACH DATABASE ? AS cold", (work,))
+                cols = ",".join(_prepare_archive_table(conn, table, 'cold', 'main'))
+                conn.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM cold.{table}")
+                conn.commit()
+                conn.execute("DETACH DATABASE cold")
+            finally:
+                os.remove(work)
+        conn.executemany("INSERT INTO thawed_months VALUES (?, ?, ?)", signature)
+        conn.commit()
+        conn.close()
+        os.replace(tmp, path)
+    except BaseException:
+        conn.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def thaw_archives(tables=ARCHIVE_TABLES, archive_dir=ARCHIVE_DIR):
+    """Bring every table's thawed cold months up to date (once, before several processes attach them)."""
+    for table in tables:
+        thaw(table, archive_dir)
+
+
+def attach_archives(conn, tables=ARCHIVE_TABLES, archive_dir=ARCHIVE_DIR):
+    """
+    Attach the archive files (read-only) to a connection from db.reader /
+    db.connect_read_only and shadow each table with a TEMP view that unions
+    the hot, warm and cold (thawed) rows. Safe to call repeatedly; db.reader
+    detaches and drops the views again when the connection goes back to the
+    pool. Returns the number of archive files attached.
+    """
+    attached = {r[1] for r in conn.execute("PRAGMA database_list")}
+    files = {}
+    for table in tables:
+        thawed = thaw(table, archive_dir)
+        files[table] = _archive_schemas(table, archive_dir) + ([(f"cold_{table}", thawed)] if thawed else [])
+    needed = sum(1 for schemas in files.values() for schema, _ in schemas if schema not in attached)
+    in_use = len(attached - {'main', 'temp'})
+    if in_use + needed > _attach_limit(conn):
+        raise RuntimeError(f"Attaching {needed} archive files would exceed SQLite's limit of "
+                           f"{_attach_limit(conn)} attached databases; run archive_weeks.py once to merge "
+                           f"the yearly archive files into one file per table.")
+    count = 0
+    for table in tables:
+        hot_cols = _columns(conn, 'main', table)
+        selects = [f"SELECT {','.join(hot_cols)} FROM main.{table}"]
+        for schema, path in files[table]:
+            if schema not in attached:
+                uri = f"{file_uri(path)}?mode=ro"
+                conn.execute("ATTACH DATABASE ? AS " + schema, (uri,))
+                attached.add(schema)
+            arch_cols = set(_columns(conn, schema, table))
+            cols = [c if c in arch_cols else f"NULL AS {c}" for c in hot_cols]
+            selects.append(f"SELECT {','.join(cols)} FROM {schema}.{table}")
+            count += 1
+        conn.execute(f"DROP VIEW IF EXISTS temp.{table}")
+        if len(selects) > 1:
+            conn.execute(f"CREATE TEMP VIEW {table} AS " + " UNION ALL ".join(selects))
+    return count
+
+
+def has_archives(conn):
+    """True if attach_archives has shadowed a table on this connection."""
+    return conn.execute("SELECT 1 FROM temp.sqlite_master WHERE type = 'view' AND name IN "
+                        f"({','.join('?' for _ in ARCHIVE_TABLES)})", ARCHIVE_TABLES).fetchone() is not None
+
+
+def main():
+    months_input = input(f"Archive weeks older than how many months? (default {DEFAULT_MONTHS}): ").strip()
+    months = int(months_input) if months_input else DEFAULT_MONTHS
+    cold_input = input(f"Compress archived months older than how many months? (default {COLD_MONTHS}): ").strip()
+    cold_months = int(cold_input) if cold_input else COLD_MONTHS
+    cutoff = cutoff_date(months)
+    confirm = input(f"Move all listings/pendings weeks before {cutoff} into '{ARCHIVE_DIR}/'? (y/n): ").strip().lower()
+    if confirm == 'y':
+        archive_weeks(months, cold_months=cold_months)
+    else:
+        print("Archiving canceled.")
+
+
+if __name__ == "__main__":
+    main()
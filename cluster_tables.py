@@ -0,0 +1,199 @@
+import re
+import sqlite3
+import time
+import numpy as np
+from db import connect
+from snapshot import publish_snapshot
+from week_partitions import data_tables, is_partitioned
+
+# Physically cluster fact tables so regional reads hit contiguous pages.
+#
+# Rows are stored in rowid order, and rowids are handed out in load order, so
+# one metro's solds are spread over every page of the table. cluster_table
+# rebuilds a table as a copy inserted ORDER BY (metro_key, date) or
+# (state, zip, date): new rowids follow that order, and so do the table's
+# pages. An index lookup on metro_key then reads a few neighbouring pages
+# instead of one page per row. Indexes and triggers are recreated from their
+# original SQL, and the R*Tree (keyed by rowid) is rebuilt.
+#
+# Solds keep appending in load order, so re-run this after a batch of weeks.
+# A week partition of listings (week_partitions.py) is written once, so
+# clustering it is permanent. A new snapshot is published afterwards; VACUUM
+# INTO keeps the rowid order, so the reports read the clustered layout.
+#
+# benchmark() maps each key's rows to the leaf pages that hold them (dbstat)
+# and reports pages touched, contiguous page runs (≈ seeks) and query time,
+# before and after.
+
+CLUSTER_ORDERS = {
+    'metro': ('metro_key', 'date'),
+    'zip': ('state', 'zip', 'date'),
+}
+# The regional filter each order is meant for
+BENCHMARK_KEYS = {'metro': 'metro_key', 'zip': 'state'}
+CLUSTER_TABLES = ['solds', 'listings', 'pendings']
+BENCHMARK_VALUES = 5
+
+
+def cluster_table(conn, name, columns):
+    """Rebuild one physical table ordered by columns, keeping its schema, indexes and triggers."""
+    table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()[0]
+    # Indexes and triggers go with the dropped table; recreate them from their own SQL
+    extra_sql = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL "
+        "ORDER BY type", (name,)
+    )]
+    cols = ",".join(r[1] for r in conn.execute(f"PRAGMA table_info({name})"))
+    copy = f"{name}_clustered"
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {copy}")
+        conn.execute(re.sub(r'^CREATE TABLE\s+(?:IF NOT EXISTS\s+)?("?)[\w]+\1', f'CREATE TABLE {copy}',
+                            table_sql, count=1))
+        conn.execute(f"INSERT INTO {copy} ({cols}) SELECT {cols} FROM {name} ORDER BY {', '.join(columns)}, rowid")
+        conn.execute(f"DROP TABLE {name}")
+        # Legacy rename leaves views (the partitioned UNION ALL view) pointing at the name untouched
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        conn.execute(f"ALTER TABLE {copy} RENAME TO {name}")
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        for sql in extra_sql:
+            conn.execute(sql)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{name}_geo",)).fetchone():
+            # Rowids changed: rebuild the R*Tree from the new rows
+            conn.execute(f"DELETE FROM {name}_geo")
+            conn.execute(f"INSERT INTO {name}_geo SELECT rowid, geo_lat, geo_lat, geo_long, geo_long FROM {name} "
+                         "WHERE geo_lat IS NOT NULL AND geo_long IS NOT NULL")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        raise
+
+
+# --- benchmark ----------------------------------------------------------------------
+
+def _leaf_pages(conn, name):
+    """(page numbers, cumulative row counts) of a table's leaf pages in b-tree order."""
+    leaves = conn.execute(
+        "SELECT pageno, ncell FROM dbstat WHERE name = ? AND pagetype = 'leaf' ORDER BY path", (name,)
+    ).fetchall()
+    if not leaves:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pages, cells = np.array(leaves, dtype=np.int64).T
+    return pages, np.cumsum(cells)
+
+
+def page_spread(conn, name, key, value, layout=None):
+    """
+    (rows, leaf pages holding them, contiguous page runs) for the rows of name
+    where key = value. layout is (rowids, leaf pages, bounds), reused across values.
+    """
+    rowids, pages, bounds = layout or table_layout(conn, name)
+    hits = np.fromiter((r[0] for r in conn.execute(f"SELECT rowid FROM {name} WHERE {key} = ?", (value,))),
+                       dtype=np.int64)
+    if not len(hits) or not len(pages):
+        return len(hits), 0, 0
+    # Rank of each row in rowid order -> the leaf page holding that rank
+    leaf = np.searchsorted(bounds, np.searchsorted(rowids, hits), side='right')
+    touched = np.unique(pages[np.minimum(leaf, len(pages) - 1)])
+    return len(hits), len(touched), int(1 + (np.diff(touched) != 1).sum())
+
+
+def table_layout(conn, name):
+    """Sorted rowids of a table plus its leaf pages, for page_spread."""
+    rowids = np.fromiter((r[0] for r in conn.execute(f"SELECT rowid FROM {name} ORDER BY rowid")), dtype=np.int64)
+    return (rowids,) + _leaf_pages(conn, name)
+
+
+def benchmark(db_name, table, order, values=None):
+    """
+    Page spread and query time of the regional filter for `order` on table,
+    for the given key values (default the BENCHMARK_VALUES largest).
+    Returns [{value, rows, pages, runs, seconds}].
+    """
+    key = BENCHMARK_KEYS[order]
+    conn = sqlite3.connect(db_name)
+    try:
+        layouts = {name: table_layout(conn, name) for name in data_tables(conn, table)}
+        if values is None:
+            values = [r[0] for r in conn.execute(
+                f"SELECT {key} FROM {table} WHERE {key} IS NOT NULL GROUP BY {key} ORDER BY COUNT(*) DESC LIMIT ?",
+                (BENCHMARK_VALUES,)
+            )]
+        results = []
+        for value in values:
+            rows = pages = runs = 0
+            for name, layout in layouts.items():
+                r, p, n = page_spread(conn, name, key, value, layout)
+                rows, pages, runs = rows + r, pages + p, runs + n
+            # A fresh connection with a small page cache, so each query reads its pages
+            timed = sqlite3.connect(db_name)
+            timed.execute("PRAGMA cache_size = -256")
+            t = time.perf_counter()
+            timed.execute(f"SELECT * FROM {table} WHERE {key} = ?", (value,)).fetchall()
+            seconds = time.perf_counter() - t
+            timed.close()
+            results.append({'value': value, 'rows': rows, 'pages': pages, 'runs': runs, 'seconds': seconds})
+        return results
+    finally:
+        conn.close()
+
+
+def _print_benchmark(label, results):
+    print(f"{label}:")
+    for r in results:
+        print(f"  {r['value']}: {r['rows']} rows on {r['pages']} pages in {r['runs']} runs, {r['seconds'] * 1000:.1f} ms")
+
+
+def cluster_tables(tables=('solds',), order='metro', db_name='altos_one.db', vacuum=False, bench=True):
+    """
+    Cluster each table (each of its partitions when partitioned) by CLUSTER_ORDERS[order],
+    printing the benchmark before and after. vacuum=True also runs a full VACUUM
+    to return the old pages to the filesystem.
+    """
+    if order not in CLUSTER_ORDERS:
+        raise ValueError(f"order must be one of {list(CLUSTER_ORDERS)}")
+    conn = connect(db_name)
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    tables = [t for t in tables if t in existing]
+    before = {t: benchmark(db_name, t, order) for t in tables} if bench else {}
+    for table in tables:
+        names = data_tables(conn, table)
+        for name in names:
+            cluster_table(conn, name, CLUSTER_ORDERS[order])
+        layout = f"{len(names)} partitions" if is_partitioned(conn, table) else "1 table"
+        print(f"Clustered '{table}' ({layout}) by {', '.join(CLUSTER_ORDERS[order])}.")
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+    for table in tables if bench else []:
+        values = [r['value'] for r in before[table]]
+        _print_benchmark(f"'{table}' before", before[table])
+        after = benchmark(db_name, table, order, values)
+        _print_benchmark(f"'{table}' after", after)
+        pages_before = sum(r['pages'] for r in before[table])
+        pages_after = sum(r['pages'] for r in after)
+        if pages_after:
+            print(f"  {pages_before / pages_after:.1f}x fewer pages read for the largest {len(values)} "
+                  f"{BENCHMARK_KEYS[order]} values.")
+    # The snapshot copy keeps the rowid order, so the reports read clustered pages too
+    publish_snapshot(db_name)
+    print("✅ Clustering complete.")
+
+
+def main():
+    tables = input("Tables to cluster (solds, listings, pendings; comma-separated, Enter for solds): ").strip().lower()
+    tables = [t.strip() for t in tables.split(',') if t.strip()] or ['solds']
+    if any(t not in CLUSTER_TABLES for t in tables):
+        print("Invalid table name. Please choose from solds, listings and pendings.")
+        return
+    order = input("Order by metro (metro_key, date) or zip (state, zip, date)? [metro]: ").strip().lower() or 'metro'
+    if order not in CLUSTER_ORDERS:
+        print("Invalid order. Please enter 'metro' or 'zip'.")
+        return
+    vacuum = input("Run a full VACUUM afterwards to shrink the file? (y/n): ").strip().lower() == 'y'
+    cluster_tables(tables, order, vacuum=vacuum)
+
+
+if __name__ == "__main__":
+    main()
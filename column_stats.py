@@ -0,0 +1,209 @@
+from datetime import datetime
+
+# Per-column statistics gathered at ingest, one row per (table, snapshot date,
+# column): row and null counts, min/max, and a KMV distinct-count sketch (the
+# SKETCH_SIZE smallest 64-bit hashes of the column's values). Sketches of
+# several dates merge by keeping the smallest hashes of their union, so
+# profile_tables.py can estimate whole-table distinct counts from a few KB
+# per week instead of scanning the rows.
+#
+# A reload of a date replaces that date's stats (INSERT OR REPLACE, like the
+# rows themselves); deleting or archiving a date forgets them. Row counts are
+# exact: the loader saves each date's stored row count (one date-index count),
+# since rows replaced within a load are read, and folded in, more than once.
+#
+# numpy is imported inside the sketch functions: archive_weeks and
+# delete_week_data import forget_dates, and altos.py's light commands import
+# those without loading numpy.
+
+SKETCH_SIZE = 256        # hashes kept per column and date (~6% distinct-count error)
+MAX_HASH = float(2 ** 64)
+
+
+def create_column_stats_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS column_stats (
+        table_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        column_name TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        null_count INTEGER NOT NULL,
+        min_value,
+        max_value,
+        sketch BLOB,
+        updated_at TEXT,
+        PRIMARY KEY (table_name, date, column_name)
+    )
+    """)
+
+
+def merge_sketches(sketches):
+    """Smallest SKETCH_SIZE distinct hashes of the union of several sketches."""
+    import numpy as np
+    parts = [s for s in sketches if s is not None and len(s)]
+    if not parts:
+        return np.empty(0, dtype=np.uint64)
+    return np.unique(np.concatenate(parts))[:SKETCH_SIZE]
+
+
+def estimate_distinct(sketch):
+    """Distinct-value estimate from a KMV sketch (exact below SKETCH_SIZE values)."""
+    if len(sketch) < SKETCH_SIZE:
+        return len(sketch)
+    return int(round((SKETCH_SIZE - 1) * MAX_HASH / (float(sketch[-1]) + 1)))
+
+
+def _scalar(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _merge_bound(old, new, pick):
+    if old is None:
+        return new
+    try:
+        return pick(old, new)
+    except TypeError:
+        # Mixed types in one column: keep what we had
+        return old
+
+
+def update_stats(stats, chunk):
+    """Fold one ingest chunk into stats: {(date, column): {...}}."""
+    # Imported here so delete_week_data (forget_dates) stays free of pandas and numpy
+    import numpy as np
+    import pandas as pd
+    if 'date' not in chunk.columns:
+        return stats
+    for date, rows in chunk.groupby('date', sort=False):
+        for col in rows.columns:
+            entry = stats.setdefault((str(date), col), {'rows': 0, 'nulls': 0, 'min': None, 'max': None,
+                                                        'sketch': np.empty(0, dtype=np.uint64)})
+            values = rows[col].dropna()
+            entry['rows'] += len(rows)
+            entry['nulls'] += len(rows) - len(values)
+            if values.empty:
+                continue
+            try:
+                lo, hi = _scalar(values.min()), _scalar(values.max())
+            except TypeError:
+                lo = hi = None
+            if lo is not None:
+                entry['min'] = _merge_bound(entry['min'], lo, min)
+                entry['max'] = _merge_bound(entry['max'], hi, max)
+            if values.dtype.kind == 'f' and (values % 1 == 0).all():
+                # Whole-number floats (an integer column with NULLs) hash like the integers
+                values = values.astype('int64')
+            hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+            entry['sketch'] = merge_sketches([entry['sketch'], hashes])
+    return stats
+
+
+def missing_stats(conn, table_name):
+    """True when table_name has rows but no column_stats at all (loaded before they were tracked)."""
+    try:
+        if conn.execute("SELECT 1 FROM column_stats WHERE table_name = ? LIMIT 1", (table_name,)).fetchone():
+            return False
+    except Exception:
+        # No column_stats table yet
+        pass
+    return conn.execute(f"SELECT 1 FROM {table_name} LIMIT 1").fetchone() is not None
+
+
+def stored_row_counts(conn, table_name, dates):
+    """{date: rows stored} for the given dates, counted on the date index."""
+    from week_partitions import route
+    return {d: conn.execute(f"SELECT COUNT(*) FROM {route(conn, table_name, d)} WHERE date = ?", (d,)).fetchone()[0]
+            for d in dates}
+
+
+def save_stats(conn, table_name, stats, row_counts=None):
+    """
+    Write (replace) the stats of the dates in `stats`, with row_counts
+    ({date: rows stored}) as their row counts where given. The caller commits.
+    """
+    create_column_stats_table(conn)
+    now = datetime.now().isoformat(timespec='seconds')
+    counts = row_counts or {}
+    rows = []
+    for (date, col), e in stats.items():
+        row_count = counts.get(date, e['rows'])
+        rows.append((table_name, date, col, row_count, min(e['nulls'], row_count), e['min'], e['max'],
+                     e['sketch'].astype('<u8').tobytes(), now))
+    conn.executemany("INSERT OR REPLACE INTO column_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def forget_dates(conn, table_name, dates):
+    """Drop the stats of deleted or archived dates. The caller commits."""
+    try:
+        conn.executemany("DELETE FROM column_stats WHERE table_name = ? AND date = ?",
+                         [(table_name, str(d)) for d in dates])
+    except Exception:
+        # No column_stats table yet: nothing to forget.
+        pass
+
+
+def table_stats(conn, table_name):
+    """
+    Whole-table stats per column from the per-date rows: {column: {rows, nulls,
+    min, max, distinct, dates}}. Reads one row per column and date, never the table.
+    """
+    try:
+        rows = conn.execute(
+            "SELECT column_name, row_count, null_count, min_value, max_value, sketch "
+            "FROM column_stats WHERE table_name = ?", (table_name,)
+        ).fetchall()
+    except Exception:
+        return {}
+    import numpy as np
+    merged = {}
+    for col, row_count, null_count, lo, hi, sketch in rows:
+        entry = merged.setdefault(col, {'rows': 0, 'nulls': 0, 'min': None, 'max': None, 'sketches': [], 'dates': 0})
+        entry['rows'] += row_count
+        entry['nulls'] += null_count
+        entry['dates'] += 1
+        if lo is not None:
+            entry['min'] = _merge_bound(entry['min'], lo, min)
+            entry['max'] = _merge_bound(entry['max'], hi, max)
+        if sketch:
+            entry['sketches'].append(np.frombuffer(sketch, dtype='<u8'))
+    for entry in merged.values():
+        entry['distinct'] = estimate_distinct(merge_sketches(entry.pop('sketches')))
+    return merged
+
+
+def backfill(db_name='altos_one.db', tables=('listings', 'pendings', 'solds'), chunksize=50000):
+    """One-time stats for the dates loaded before column_stats existed (reads those dates once)."""
+    import pandas as pd
+    from db import connect
+    conn = connect(db_name)
+    create_column_stats_table(conn)
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    for table in tables:
+        if table not in existing:
+            continue
+        done = {r[0] for r in conn.execute("SELECT DISTINCT date FROM column_stats WHERE table_name = ?", (table,))}
+        dates = [r[0] for r in conn.execute(f"SELECT DISTINCT date FROM {table} ORDER BY date")]
+        for date in dates:
+            if date in done:
+                continue
+            stats = {}
+            for chunk in pd.read_sql_query(f"SELECT * FROM {table} WHERE date = ?", conn,
+                                           params=(date,), chunksize=chunksize):
+                update_stats(stats, chunk)
+            save_stats(conn, table, stats)
+            conn.commit()
+            print(f"Collected column stats for '{table}' {date}.")
+    conn.close()
+    print("✅ Column stats backfill complete.")
+
+
+def main():
+    confirm = input("Collect column stats for dates loaded before they were tracked? (y/n): ").strip().lower()
+    if confirm == 'y':
+        backfill()
+    else:
+        print("Backfill canceled.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+import contextlib
+import io
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+
+# Golden-output harness for the report rewrites.
+#
+# Generates a synthetic dataset (listings, pendings and solds weeks plus a
+# zip-to-metro mapping) with the awkward cases the reports have to handle:
+# zips that lost their leading zero, unknown zips, a zip listed under two
+# metros, blank parcel numbers, missing types and prices, zero list prices,
+# extreme sale-to-list ratios, blank property_ids, properties listed (or sold)
+# twice in a week and IDs repeated within a file. The dataset is loaded into
+# two scratch databases: 'fresh' through the real ingest path, and 'upgraded'
+# with the original schema and loader for the first weeks and the current
+# ingest path for the rest (which upgrades the schema and backfills the old
+# rows). Then each report runs twice on each database: the original
+# implementation (reference_reports.py, with null_safe=True for the two NULL
+# property_id fixes) and the current fast path. Both outputs are written as
+# CSV, read back and compared.
+#
+# Row order is ignored, and column names and order must match. ID and code
+# columns (*_id, *_key, zip, county_fips_code) are compared as exact strings,
+# and an ID written as a float (4.6e+18, 123.0) fails on either side: a float
+# has already rounded a 64-bit ID. Other integer-like values must match
+# exactly, other numbers within a tolerance (RTOL/ATOL, or the case's own,
+# e.g. the rollup's sketch error for medians), and text must match exactly. Each path is timed as the best of `repeat` runs. The scratch
+# directory keeps the dataset, the database and both CSVs of every output.
+
+DEFAULT_DIR = 'report_comparison'
+RTOL = 1e-9
+ATOL = 1e-6
+SINGLE_FAMILY = "AND type = 'single_family'"
+
+METROS = [
+    # (market_area, state, lat, long, zips, MSA name for the top-50 display mapping)
+    ('Dallas-Fort Worth-Arlington, TX', 'TX', 32.8, -96.8, ['75001', '75002', '75003', '75004'], 'Dallas'),
+    ('Boston-Cambridge-Newton, MA-NH', 'MA', 42.4, -71.1, ['02101', '02102', '03811'], 'Boston'),
+    ('Houston-The Woodlands-Sugar Land, TX', 'TX', 29.8, -95.4, ['77001', '77002'], None),
+    ('Opelika, AL', 'AL', 32.6, -85.4, ['36801', '36802'], None),
+    # 03811 is in both Boston and Manchester: reports count its rows under each
+    ('Manchester-Nashua, NH', 'NH', 43.0, -71.5, ['03811', '03101'], None),
+]
+TYPES = ['single_family', 'single_family', 'condo', 'townhouse', 'land_lot', '']
+
+LISTINGS_COLUMNS = ['date', 'property_id', 'listing_id', 'parcel_number', 'county_fips_code', 'street_address',
+                    'city', 'state', 'zip', 'price', 'type', 'beds', 'baths', 'floor_size', 'lot_size', 'built_in',
+                    'geo_lat', 'geo_long']
+PENDINGS_COLUMNS = LISTINGS_COLUMNS[:2] + ['pending_id'] + LISTINGS_COLUMNS[3:] + [
+    'days_on_market', 'agent_name', 'agent_email', 'agent_phone', 'agent_office', 'days_in_contract']
+SOLDS_COLUMNS = ['date', 'property_id', 'county_fips_code', 'parcel_number', 'street_address', 'city', 'state',
+                 'zip', 'county', 'type', 'beds', 'baths', 'floor_size', 'lot_size', 'built_in', 'geo_lat',
+                 'geo_long', 'estimated_value', 'sold_date', 'sold_price', 'listed_price', 'pending_price',
+                 'listed_on', 'pending_on', 'agent_name', 'agent_email', 'agent_phone', 'agent_office']
+
+
+# --- synthetic data ---------------------------------------------------------------
+
+def _awkward_ids(df, rng, id_col=None, blank=False):
+    """
+    ~3% of the properties twice (relisted under a second id, or sold twice),
+    one id repeated within the file (the load keeps the last row) and, with
+    blank=True, ~3% of the rows without a property_id.
+    """
+    price = 'price' if 'price' in df.columns else 'sold_price'
+    extra = df.sample(frac=0.03, random_state=rng.integers(2 ** 31))
+    parts = [df, extra.assign(**{price: extra[price] + 5000})]
+    if id_col:
+        parts[1][id_col] = extra[id_col] ^ 0x9999
+        parts.append(df.iloc[:1].assign(**{price: df[price].iloc[:1] + 1000}))
+    df = pd.concat(parts, ignore_index=True)
+    if blank:
+        df['property_id'] = df['property_id'].astype(object).where(rng.random(len(df)) >= 0.03, None)
+    return df
+
+
+def generate_dataset(directory, properties=2000, weeks=6, seed=0, exact_weeks=0):
+    """
+    Write zips.csv, metros_msa.csv and {listings,pendings,solds}_{date}.csv;
+    returns the dates. The first `exact_weeks` weeks have no blank property_ids.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    zips = [(m[0], z) for m in METROS for z in m[4]]
+    pd.DataFrame(zips, columns=['market_area', 'zipcode']).to_csv(os.path.join(directory, 'zips.csv'), index=False)
+    pd.DataFrame([(m[5], m[5]) for m in METROS if m[5]], columns=['MSA name', 'display name']).to_csv(
+        os.path.join(directory, 'metros_msa.csv'), index=False)
+
+    metro = rng.integers(0, len(METROS), properties)
+    props = pd.DataFrame({
+        'property_id': rng.choice(2 ** 62, properties, replace=False) + 1,
+        'state': [METROS[m][1] for m in metro],
+        'zip': [rng.choice(METROS[m][4] + ['99999']) for m in metro],
+        'type': rng.choice(TYPES, properties),
+        'beds': rng.choice([np.nan, 2, 3, 4, 5], properties),
+        'baths': rng.choice([np.nan, 1.0, 2.0, 2.5], properties),
+        'floor_size': rng.choice([np.nan, 1200, 1850, 2400, 3100], properties),
+        'built_in': rng.choice([np.nan, 1978, 1995, 2012, 2023], properties),
+        'geo_lat': [METROS[m][2] for m in metro] + rng.uniform(-0.3, 0.3, properties),
+        'geo_long': [METROS[m][3] for m in metro] + rng.uniform(-0.3, 0.3, properties),
+        'county_fips_code': rng.choice(['48113', '25025', '1081', '33015.0'], properties),
+        'street_address': [f"{i} Main St" for i in range(properties)],
+        'city': 'CITY',
+    })
+    base_price = rng.integers(150, 900, properties) * 1000
+
+    dates = [(pd.Timestamp('2025-01-03') + pd.Timedelta(weeks=w)).strftime('%Y-%m-%d') for w in range(weeks)]
+    for week, d in enumerate(dates):
+        blank = week >= exact_weeks
+        # Listings: most properties stay listed week to week, some come and go
+        rows = props.sample(frac=0.6, random_state=rng.integers(2 ** 31))
+        listings = rows.assign(date=d, listing_id=rows['property_id'] ^ 0x5555,
+                               parcel_number=rng.choice(['', ' ', 'P-1', 'P-2', None], len(rows)),
+                               price=base_price[rows.index] + rng.integers(-2, 3, len(rows)) * 5000,
+                               lot_size=0)
+        # Some zips arrive without their leading zero (normalized at ingest)
+        listings['zip'] = np.where(rng.random(len(rows)) < 0.3, listings['zip'].str.lstrip('0'), listings['zip'])
+        listings = _awkward_ids(listings, rng, 'listing_id', blank)
+        listings[LISTINGS_COLUMNS].to_csv(os.path.join(directory, f"listings_{d}.csv"), index=False)
+
+        rows = props.sample(frac=0.15, random_state=rng.integers(2 ** 31))
+        pendings = rows.assign(date=d, pending_id=rows['property_id'] ^ 0x7777, parcel_number='',
+                               price=base_price[rows.index], lot_size=0, days_on_market=rng.integers(1, 120, len(rows)),
+                               agent_name='A', agent_email='', agent_phone='', agent_office='',
+                               days_in_contract=rng.integers(1, 60, len(rows)))
+        pendings = _awkward_ids(pendings, rng, 'pending_id', blank)
+        pendings[PENDINGS_COLUMNS].to_csv(os.path.join(directory, f"pendings_{d}.csv"), index=False)
+
+        rows = props.sample(frac=0.08, random_state=rng.integers(2 ** 31))
+        n = len(rows)
+        list_price = base_price[rows.index].astype(float)
+        list_price[rng.random(n) < 0.03] = 0                       # no ratio
+        sold_price = list_price * rng.uniform(0.85, 1.15, n)
+        sold_price[rng.random(n) < 0.03] *= 3                      # outside the 0.5-2.0 ratio band
+        sold_price = pd.Series(np.round(sold_price)).where(rng.random(n) >= 0.03)  # missing prices
+        sold_day = pd.Timestamp(d) - pd.to_timedelta(rng.integers(1, 90, n), unit='D')
+        sold_date = pd.Series(sold_day.strftime('%Y-%m-%d')).where(rng.random(n) >= 0.02, '')
+        listed_on = (sold_day - pd.to_timedelta(rng.integers(20, 200, n), unit='D')).strftime('%Y-%m-%d')
+        pending_on = (sold_day - pd.to_timedelta(rng.integers(5, 19, n), unit='D')).strftime('%Y-%m-%d')
+        solds = rows.assign(date=d, parcel_number='', county='C', estimated_value='', lot_size=0,
+                            sold_date=sold_date.to_numpy(), sold_price=sold_price.to_numpy(),
+                            listed_price=list_price, pending_price=list_price,
+                            listed_on=listed_on, pending_on=pending_on,
+                            agent_name='A', agent_email='', agent_phone='', agent_office='')
+        solds = _awkward_ids(solds, rng, blank=blank)
+        solds[SOLDS_COLUMNS].to_csv(os.path.join(directory, f"solds_{d}.csv"), index=False)
+    return dates
+
+
+def build_database(dates, db_name='altos_one.db'):
+    """Load the generated CSVs (in the current directory) through the real ingest path."""
+    from initialize_database import initialize_database
+    from create_solds_table import create_solds_table
+    from import_zip_to_metro import create_zip_to_metro_table, import_zip_to_metro
+    from update_metro_display import update_metro_display
+    from insert_weekly_data import insert_csv_to_table
+    from solds_rollup import refresh_rollup
+
+    initialize_database(db_name)
+    create_solds_table(db_name)
+    create_zip_to_metro_table(db_name)
+    import_zip_to_metro('zips.csv', db_name)
+    update_metro_display(db_name, 'metros_msa.csv')
+    for d in dates:
+        for table in ('listings', 'pendings', 'solds'):
+            insert_csv_to_table(f"{table}_{d}.csv", table, db_name)
+    refresh_rollup(db_name)
+
+
+def build_upgraded_database(dates, old_weeks, db_name='altos_one.db'):
+    """
+    Load the first `old_weeks` weeks with the original schema and loader, then
+    the rest through the real ingest path, which upgrades the schema and
+    backfills the old rows on the way.
+    """
+    import reference_reports as ref
+    from insert_weekly_data import insert_csv_to_table
+    from solds_rollup import refresh_rollup
+
+    ref.create_baseline_schema(db_name)
+    ref.import_zip_to_metro('zips.csv', db_name)
+    ref.update_metro_display(db_name, 'metros_msa.csv')
+    for i, d in enumerate(dates):
+        load = ref.insert_csv_to_table if i < old_weeks else insert_csv_to_table
+        for table in ('listings', 'pendings', 'solds'):
+            load(f"{table}_{d}.csv", table, db_name)
+    refresh_rollup(db_name)
+
+
+# --- the cases ------------------------------------------------------------------------
+
+def _current_withdrawal_history(db_name):
+    from db import reader
+    from archive_weeks import attach_archives
+    from find_withdrawals import withdrawal_history
+    with reader(db_name) as conn:
+        attach_archives(conn)
+        return {'history': withdrawal_history(conn, SINGLE_FAMILY, cached=False)}
+
+
+def _current_withdrawal_report(db_name, week, market, parallel=False):
+    from db import reader
+    from find_withdrawals import withdrawal_report
+    with reader(db_name) as conn:
+        listings, states, metros = withdrawal_report(conn, week, SINGLE_FAMILY, market, parallel, db_name,
+                                                     cached=False)
+    return {'listings': listings, 'state_stats': states, 'metro_stats': metros}
+
+
+def _reference_withdrawal_report(db_name, week, market):
+    import reference_reports
+    listings, states, metros = reference_reports.withdrawal_report(db_name, week, SINGLE_FAMILY, market,
+                                                                   null_safe=True)
+    return {'listings': listings, 'state_stats': states, 'metro_stats': metros}
+
+
+def _solds_summary(weeks_count, summary):
+    return {'weeks_count': weeks_count, 'summary': summary}
+
+
+def _current_common_properties(db_name, date, check_solds):
+    from db import reader
+    from find_common_properties import find_common_properties
+    with reader(db_name) as conn:
+        return {'common': find_common_properties(conn, date, check_solds=check_solds)}
+
+
+def _current_missing_parcels(db_name):
+    from analyze_listings_missing_parcel import analyze_missing_parcels
+    return {'missing': analyze_missing_parcels(db_name, output_file='current_missing_parcels.csv')}
+
+
+def report_cases(dates, db_name='altos_one.db', week=None):
+    """
+    [(case, reference(), current(), {output: (rtol, atol)})] for the generated
+    dates; the single-week reports look at `week` (default the last).
+    """
+    import reference_reports as ref
+    from analyze_solds_summary import summarize_by_market_parallel, summarize_solds
+    from extract_solds_by_metro import extract_solds_by_metro, extract_solds_by_metro_parallel
+    from solds_rollup import RELATIVE_ERROR, summary_from_rollup
+    from sold_summary_by_date import summarize_by_date
+
+    week = week or dates[-1]
+    prior = dates[dates.index(week) - 1]
+    # The rollup's medians come from a sketch with a known relative error
+    sketch_tolerance = {'summary': (RELATIVE_ERROR, ATOL)}
+    cases = [
+        ('withdrawals_history',
+         lambda: {'history': ref.withdrawal_history(db_name, SINGLE_FAMILY, null_safe=True)},
+         lambda: _current_withdrawal_history(db_name), {}),
+    ]
+    for market in ('', 'TX', 'top50', 'Houston'):
+        label = market.lower() or 'all'
+        cases.append((f"withdrawals_{label}",
+                      lambda m=market: _reference_withdrawal_report(db_name, week, m),
+                      lambda m=market: _current_withdrawal_report(db_name, week, m), {}))
+    cases.append(('withdrawals_all_parallel',
+                  lambda: _reference_withdrawal_report(db_name, week, ''),
+                  lambda: _current_withdrawal_report(db_name, week, '', parallel=True), {}))
+    for calc_ratio, top50 in ((True, False), (False, True)):
+        label = f"{'ratio' if calc_ratio else 'noratio'}_{'top50' if top50 else 'all'}"
+        reference = lambda r=calc_ratio, t=top50: _solds_summary(*ref.solds_summary(db_name, r, t))
+        cases += [
+            (f"solds_summary_{label}", reference,
+             lambda r=calc_ratio, t=top50: _solds_summary(*summarize_solds(db_name, r, t)), {}),
+            (f"solds_summary_{label}_parallel", reference,
+             lambda r=calc_ratio, t=top50: _solds_summary(*summarize_by_market_parallel(db_name, r, t)), {}),
+            (f"solds_summary_{label}_rollup", reference,
+             lambda r=calc_ratio, t=top50: _solds_summary(*summary_from_rollup(db_name, r, t)), sketch_tolerance),
+        ]
+    # '' takes every mapped metro; Manchester shares a zip with Boston
+    for metro in ('', 'Manchester'):
+        label = metro.lower() or 'all'
+        reference = lambda m=metro: {'solds': ref.solds_by_metro(db_name, m)}
+        cases += [
+            (f"solds_by_metro_{label}", reference,
+             lambda m=metro: {'solds': extract_solds_by_metro(db_name, m)}, {}),
+            (f"solds_by_metro_{label}_parallel", reference,
+             lambda m=metro: {'solds': extract_solds_by_metro_parallel(db_name, m)}, {}),
+        ]
+    cases += [
+        ('sold_summary_by_date',
+         lambda: {'summary': ref.sold_summary_by_date(db_name)},
+         lambda: {'summary': summarize_by_date(db_name)}, {}),
+        ('common_properties',
+         lambda: {'common': ref.common_properties(db_name, prior, null_safe=True)},
+         lambda: _current_common_properties(db_name, prior, False), {}),
+        ('common_properties_in_solds',
+         lambda: {'common': ref.common_properties(db_name, prior, check_solds=True, null_safe=True)},
+         lambda: _current_common_properties(db_name, prior, True), {}),
+        ('missing_parcels',
+         lambda: {'missing': ref.missing_parcels(db_name)},
+         lambda: _current_missing_parcels(db_name), {}),
+    ]
+    return cases
+
+
+# --- comparison -------------------------------------------------------------------
+
+INTEGER = re.compile(r'^-?\d+$')
+EXACT_COLUMNS = re.compile(r'(_id|_key)$|^(zip|zipcode|county_fips_code)$')
+ID_COLUMNS = re.compile(r'(_id|_key)$')
+
+
+def _float_ids(frame):
+    """'column (e.g. value)' for the first ID column holding a non-integer value, or None."""
+    for col in frame.columns:
+        if ID_COLUMNS.search(col):
+            text = frame[col].fillna('').astype(str).str.strip()
+            bad = (text != '') & ~text.str.match(INTEGER)
+            if bad.any():
+                return f"{col} (e.g. {text[bad].iloc[0]!r})"
+    return None
+
+
+def internal_columns(db_name):
+    """
+    Columns the tables have gained since the original schema (metro_key,
+    property_key, row_hash, the *_day numbers): no report output may carry them.
+    """
+    import sqlite3
+    from reference_reports import BASELINE_TABLES, baseline_columns
+    conn = sqlite3.connect(db_name)
+    try:
+        return {row[1] for table in BASELINE_TABLES
+                for row in conn.execute(f"PRAGMA table_info({table})")
+                if row[1] not in baseline_columns(table)}
+    finally:
+        conn.close()
+
+
+def _canonical(values, name=''):
+    """('int', exact strings), ('float', floats) or ('str', strings) for one CSV column."""
+    text = values.fillna('').astype(str).str.strip()
+    if EXACT_COLUMNS.search(name):
+        return 'str', text
+    present = text != ''
+    integral = text.str.replace(r'\.0+$', '', regex=True)
+    if present.any() and integral[present].str.match(INTEGER).all():
+        return 'int', integral
+    numbers = pd.to_numeric(text.where(present), errors='coerce')
+    if present.any() and numbers[present].notna().all():
+        return 'float', numbers
+    return 'str', text
+
+
+def compare_frames(reference, current, rtol=RTOL, atol=ATOL, internal=()):
+    """(match, detail) for two CSV-read frames, ignoring row order."""
+    for side, frame in (('reference', reference), ('current', current)):
+        leaked = [c for c in frame.columns if c in internal]
+        if leaked:
+            return False, f"{side} output carries internal columns {leaked}"
+    if list(reference.columns) != list(current.columns):
+        missing = [c for c in reference.columns if c not in current.columns]
+        extra = [c for c in current.columns if c not in reference.columns]
+        detail = f"missing {missing} extra {extra}" if missing or extra else "column order differs"
+        return False, detail
+    for side, frame in (('reference', reference), ('current', current)):
+        bad = _float_ids(frame)
+        if bad:
+            return False, f"{side} output writes IDs as floats: {bad}"
+    if len(reference) != len(current):
+        return False, f"{len(reference)} reference rows vs {len(current)} current rows"
+    if reference.empty:
+        return True, ""
+
+    ref_cols = {c: _canonical(reference[c], c) for c in reference.columns}
+    cur_cols = {c: _canonical(current[c], c) for c in current.columns}
+    # Sort on the exact (non-float) columns so both sides line up row by row
+    keys = [c for c in reference.columns if ref_cols[c][0] != 'float' and cur_cols[c][0] != 'float']
+    floats = [c for c in reference.columns if c not in keys]
+    ref_sorted = pd.DataFrame({c: ref_cols[c][1] for c in reference.columns})
+    cur_sorted = pd.DataFrame({c: cur_cols[c][1] for c in current.columns})
+    ref_sorted = ref_sorted.astype({c: str for c in keys}).sort_values(keys + floats, ignore_index=True, kind='stable')
+    cur_sorted = cur_sorted.astype({c: str for c in keys}).sort_values(keys + floats, ignore_index=True, kind='stable')
+
+    for col in keys:
+        differs = ref_sorted[col] != cur_sorted[col]
+        if differs.any():
+            i = int(np.flatnonzero(differs)[0])
+            return False, f"{col}: {int(differs.sum())} rows differ (e.g. {ref_sorted[col][i]!r} vs {cur_sorted[col][i]!r})"
+    worst = 0.0
+    for col in floats:
+        r = pd.to_numeric(ref_sorted[col], errors='coerce').to_numpy(dtype=float)
+        c = pd.to_numeric(cur_sorted[col], errors='coerce').to_numpy(dtype=float)
+        close = np.isclose(r, c, rtol=rtol, atol=atol, equal_nan=True)
+        if not close.all():
+            i = int(np.flatnonzero(~close)[0])
+            return False, f"{col}: {int((~close).sum())} values outside tolerance (e.g. {r[i]} vs {c[i]})"
+        both = ~np.isnan(r) & ~np.isnan(c)
+        if both.any():
+            worst = max(worst, float(np.max(np.abs(r[both] - c[both]))))
+    return True, f"max abs diff {worst:.3g}" if floats else ""
+
+
+def _timed(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _compare_cases(cases, repeat, only=None, internal=()):
+    """Run and compare the cases against the database in the current directory; one row per output."""
+    os.makedirs('golden', exist_ok=True)
+    os.makedirs('current', exist_ok=True)
+    rows = []
+    for case, reference, current, tolerances in cases:
+        if only and case not in only:
+            continue
+        ref_out, ref_seconds = _timed(reference, repeat)
+        cur_out, cur_seconds = _timed(current, repeat)
+        for output, ref_df in ref_out.items():
+            ref_file = os.path.join('golden', f"{case}_{output}.csv")
+            cur_file = os.path.join('current', f"{case}_{output}.csv")
+            ref_df.to_csv(ref_file, index=False)
+            cur_df = cur_out.get(output)
+            if cur_df is None:
+                match, detail = False, "no current output"
+            else:
+                cur_df.to_csv(cur_file, index=False)
+                rtol, atol = tolerances.get(output, (RTOL, ATOL))
+                match, detail = compare_frames(_read_csv(ref_file), _read_csv(cur_file), rtol, atol, internal)
+            rows.append({'case': case, 'output': output, 'rows': len(ref_df), 'match': match, 'detail': detail,
+                         'reference_seconds': round(ref_seconds, 4), 'current_seconds': round(cur_seconds, 4),
+                         'speedup': round(ref_seconds / cur_seconds, 2) if cur_seconds else None})
+    return rows
+
+
+def check_comps(db_name, week, repeat):
+    """
+    comps has no original implementation, so check its invariants instead:
+    one row per (listing, rank) even for zips listed under two metros, and
+    IDs written exactly (each one matches its listings/solds row).
+    Returns a row shaped like _compare_cases'.
+    """
+    import sqlite3
+    from comps import run_comps
+    try:
+        comps, seconds = _timed(lambda: run_comps(week, db_name, new_only=False, max_workers=1), repeat)
+    except sqlite3.Error as e:
+        comps, seconds, problems = pd.DataFrame(), None, [f"{type(e).__name__}: {e}"]
+    else:
+        conn = sqlite3.connect(db_name)
+        try:
+            duplicates, listing_ids, sold_ids = conn.execute("""
+                SELECT (SELECT COUNT(*) - COUNT(DISTINCT listing_id || '/' || comp_rank) FROM comps c
+                        WHERE c.listing_date = :week),
+                       (SELECT COUNT(*) FROM comps c WHERE c.listing_date = :week AND NOT EXISTS (
+                            SELECT 1 FROM listings l WHERE l.date = c.listing_date AND l.listing_id = c.listing_id
+                              AND l.property_id IS c.property_id)),
+                       (SELECT COUNT(*) FROM comps c WHERE c.listing_date = :week AND NOT EXISTS (
+                            SELECT 1 FROM solds s WHERE s.property_id IS c.sold_property_id))
+            """, {'week': week}).fetchone()
+        finally:
+            conn.close()
+        problems = [f"{n} {what}" for n, what in ((duplicates, "duplicate (listing, rank) rows"),
+                                                  (listing_ids, "listing/property IDs not in listings"),
+                                                  (sold_ids, "sold property IDs not in solds")) if n]
+        if comps.empty:
+            problems.append("no comps")
+    return {'case': 'comps_invariants', 'output': 'comps', 'rows': len(comps), 'match': not problems,
+            'detail': "; ".join(problems), 'reference_seconds': None,
+            'current_seconds': round(seconds, 4) if seconds is not None else None, 'speedup': None}
+
+
+def run_comparison(directory=DEFAULT_DIR, properties=2000, weeks=6, seed=0, repeat=3, cases=None):
+    """
+    Generate a dataset in `directory`, load it fresh and as an upgraded
+    database (in directory/upgraded), and compare every report case on both.
+    Returns one row per (database, case, output): match, detail and both
+    timings. Writes report_comparison.csv there as well.
+    """
+    if not os.path.isabs(directory):
+        directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    previous = os.getcwd()
+    # Work inside the scratch directory: its database, report cache and metrics files stay there
+    os.chdir(directory)
+    try:
+        if os.path.exists('altos_one.db'):
+            raise FileExistsError(f"'{directory}' already holds a database; use an empty directory.")
+        dates = generate_dataset('.', properties, weeks, seed)
+        print(f"Generated {weeks} weeks for {properties} properties; loading...")
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_database(dates)
+        # Absolute path: in-process caches keyed by path never mix it up with a live altos_one.db
+        rows = [dict(database='fresh', **r)
+                for r in _compare_cases(report_cases(dates, os.path.abspath('altos_one.db')), repeat, cases,
+                                        internal_columns('altos_one.db'))]
+        if not cases or 'comps_invariants' in cases:
+            rows.append(dict(database='fresh', **check_comps(os.path.abspath('altos_one.db'), dates[-1], repeat)))
+
+        # Half the weeks loaded before the upgrade; the single-week reports look
+        # at the first week loaded after it. Those weeks have no blank
+        # property_ids: the original loader read such a file's IDs as float64,
+        # storing them with their low bits lost, and no later code can undo that
+        old_weeks = max(1, weeks // 2)
+        os.makedirs('upgraded', exist_ok=True)
+        os.chdir('upgraded')
+        generate_dataset('.', properties, weeks, seed, exact_weeks=old_weeks)
+        print(f"Loading {old_weeks} weeks with the original loader, then upgrading...")
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_upgraded_database(dates, old_weeks)
+        upgraded = report_cases(dates, os.path.abspath('altos_one.db'), week=dates[min(old_weeks, weeks - 1)])
+        rows += [dict(database='upgraded', **r)
+                 for r in _compare_cases(upgraded, repeat, cases, internal_columns('altos_one.db'))]
+        if not cases or 'comps_invariants' in cases:
+            rows.append(dict(database='upgraded', **check_comps(os.path.abspath('altos_one.db'), dates[-1], repeat)))
+        os.chdir(directory)
+
+        results = pd.DataFrame(rows)
+        results.to_csv('report_comparison.csv', index=False)
+        return results
+    finally:
+        os.chdir(previous)
+
+
+def _read_csv(path):
+    # Everything as text: _canonical decides how each column is compared
+    try:
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def print_results(results):
+    for r in results.itertuples():
+        mark = '✅' if r.match else '❌'
+        if pd.isna(r.reference_seconds):
+            # An invariant check (check_comps): no reference run
+            print(f"{mark} {r.database} {r.case}/{r.output}: {r.rows} rows, current {r.current_seconds:.3f}s {r.detail}")
+            continue
+        print(f"{mark} {r.database} {r.case}/{r.output}: {r.rows} rows, reference {r.reference_seconds:.3f}s, "
+              f"current {r.current_seconds:.3f}s ({r.speedup}x) {r.detail}")
+    failed = int((~results['match']).sum())
+    if failed:
+        print(f"❌ {failed} of {len(results)} outputs differ from the reference.")
+    else:
+        print(f"✅ All {len(results)} outputs match the reference.")
+    return failed
+
+
+def main():
+    directory = input(f"Scratch directory (default {DEFAULT_DIR}): ").strip() or DEFAULT_DIR
+    properties = int(input("Number of properties (default 2000): ").strip() or 2000)
+    weeks = int(input("Number of weeks (default 6): ").strip() or 6)
+    results = run_comparison(directory, properties, weeks)
+    print_results(results)
+    print(f"Outputs and report_comparison.csv are in '{directory}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from db import connect, reader
+from normalize import normalize_ids
+from parallel_reports import list_metro_keys, run_partitioned
+from spatial_index import MILES_PER_DEGREE_LAT, haversine_miles
+
+# Batch comparable-sales engine.
+#
+# For every listing in a weekly snapshot, find the N most similar recent solds
+# in the same metro. Solds are partitioned by metro_key (one worker per metro),
+# each partition is indexed by latitude in NumPy arrays, and listings are
+# scored a chunk at a time against the candidate solds in their latitude band:
+# one (chunk x candidates) score matrix instead of one query per listing.
+# metro_key is the zip's primary metro (normalize.py), so a listing in a zip
+# that zip_to_metro lists under two metros is still scored exactly once.
+# IDs are read as text and restored to Int64, so 64-bit IDs stay exact.
+
+N_COMPS = 5
+LOOKBACK_DAYS = 180
+MAX_MILES = 2.0
+CHUNK_SIZE = 512
+
+# Score = sum of weighted, roughly unit-scaled differences (lower is better).
+WEIGHTS = {
+    'distance': 1.0,    # per MAX_MILES
+    'beds': 0.5,        # per bedroom
+    'baths': 0.5,       # per bathroom
+    'floor_size': 2.0,  # per unit of |log(size ratio)|
+    'built_in': 0.05,   # per year
+}
+MISSING_PENALTY = 0.5   # added for each attribute missing on either side
+
+FEATURES = ['beds', 'baths', 'floor_size', 'built_in']
+
+
+def create_comps_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS comps (
+        listing_date TEXT NOT NULL,
+        listing_id INTEGER NOT NULL,
+        property_id INTEGER,
+        comp_rank INTEGER NOT NULL,
+        sold_property_id INTEGER,
+        sold_date TEXT,
+        sold_price INTEGER,
+        distance_miles REAL,
+        score REAL,
+        UNIQUE(listing_date, listing_id, comp_rank)
+    )
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_comps_listing_date ON comps (listing_date)')
+    conn.commit()
+
+
+def _metro_filter(alias, metro_key):
+    """SQL restricting rows to one metro_key partition (None: zips with no metro)."""
+    if metro_key is None:
+        return f"{alias}.metro_key IS NULL", ()
+    return f"{alias}.metro_key = ?", (metro_key,)
+
+
+def _exact_ids(df, cols):
+    # The IDs were selected as text: back to Int64 without a float round trip
+    for col in cols:
+        df[col] = normalize_ids(df[col])
+    return df
+
+
+def load_partition_solds(conn, metro_key, sold_since, sold_until):
+    where, params = _metro_filter('s', metro_key)
+    query = f"""
+    SELECT CAST(s.property_id AS TEXT) AS property_id, s.sold_date, s.sold_price, s.type,
+           s.beds, s.baths, s.floor_size, s.built_in, s.geo_lat, s.geo_long
+    FROM solds s
+    WHERE {where}
+      AND s.sold_date BETWEEN ? AND ?
+      AND s.geo_lat IS NOT NULL AND s.geo_long IS NOT NULL
+    """
+    return _exact_ids(pd.read_sql_query(query, conn, params=params + (sold_since, sold_until)), ['property_id'])
+
+
+def load_partition_listings(conn, metro_key, listing_date, new_only=True):
+    where, params = _metro_filter('l', metro_key)
+    new_clause = ""
+    if new_only:
+        prior = (datetime.strptime(listing_date, '%Y-%m-%d') - timedelta(days=7)).strftime('%Y-%m-%d')
+        new_clause = "AND NOT EXISTS (SELECT 1 FROM listings p WHERE p.date = ? AND p.listing_id = l.listing_id)"
+        params = params + (prior,)
+    query = f"""
+    SELECT CAST(l.listing_id AS TEXT) AS listing_id, CAST(l.property_id AS TEXT) AS property_id, l.type,
+           l.beds, l.baths, l.floor_size, l.built_in, l.geo_lat, l.geo_long
+    FROM listings l
+    WHERE l.date = ? AND {where}
+      AND l.geo_lat IS NOT NULL AND l.geo_long IS NOT NULL
+      {new_clause}
+    """
+    df = pd.read_sql_query(query, conn, params=(listing_date,) + params)
+    return _exact_ids(df, ['listing_id', 'property_id'])
+
+
+class SoldsIndex:
+    """
+    NumPy nearest-neighbour index over one partition of solds: feature arrays
+    sorted by latitude so candidates for a latitude band are a contiguous slice.
+    """
+
+    def __init__(self, solds, type_codes):
+        solds = solds.sort_values('geo_lat', kind='stable', ignore_index=True)
+        self.solds = solds
+        self.lat = solds['geo_lat'].to_numpy(float)
+        self.lon = solds['geo_long'].to_numpy(float)
+        self.type = solds['type'].map(type_codes).fillna(-1).to_numpy(int)
+        self.features = {f: pd.to_numeric(solds[f], errors='coerce').to_numpy(float) for f in FEATURES}
+
+    def band(self, min_lat, max_lat):
+        lo = np.searchsorted(self.lat, min_lat, side='left')
+        hi = np.searchsorted(self.lat, max_lat, side='right')
+        return slice(lo, hi)
+
+
+def _feature_cost(a, b, feature):
+    """Weighted |difference| matrix between listing values a (m,1) and sold values b (1,n)."""
+    if feature == 'floor_size':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff = np.abs(np.log(a) - np.log(b))
+    else:
+        diff = np.abs(a - b)
+    cost = WEIGHTS[feature] * diff
+    return np.where(np.isfinite(cost), cost, MISSING_PENALTY)
+
+
+def score_chunk(listings, index, type_codes, n_comps=N_COMPS, max_miles=MAX_MILES):
+    """
+    Score every listing in the chunk against the candidate solds in its
+    latitude band at once and return the top n_comps per listing.
+    """
+    lat = listings['geo_lat'].to_numpy(float)
+    lon = listings['geo_long'].to_numpy(float)
+    min_lat = lat.min() - max_miles / MILES_PER_DEGREE_LAT
+    max_lat = lat.max() + max_miles / MILES_PER_DEGREE_LAT
+    band = index.band(min_lat, max_lat)
+    if band.stop <= band.start:
+        return None
+
+    dist = haversine_miles(lat[:, None], lon[:, None], index.lat[None, band], index.lon[None, band])
+    score = WEIGHTS['distance'] * dist / max_miles
+    for f in FEATURES:
+        a = pd.to_numeric(listings[f], errors='coerce').to_numpy(float)[:, None]
+        score += _feature_cost(a, index.features[f][None, band], f)
+
+    listing_type = listings['type'].map(type_codes).fillna(-2).to_numpy(int)[:, None]
+    score[(dist > max_miles) | (listing_type != index.type[None, band])] = np.inf
+
+    k = min(n_comps, score.shape[1])
+    top = np.argpartition(score, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(score, top, axis=1)
+    order = np.argsort(top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    rows, ranks = np.nonzero(np.isfinite(top_scores))
+    if len(rows) == 0:
+        return None
+    sold_pos = band.start + top[rows, ranks]
+    sold = index.solds.iloc[sold_pos]
+    return pd.DataFrame({
+        'listing_id': listings['listing_id'].array[rows],
+        'property_id': listings['property_id'].array[rows],
+        'comp_rank': ranks + 1,
+        'sold_property_id': sold['property_id'].array,
+        'sold_date': sold['sold_date'].to_numpy(),
+        'sold_price': sold['sold_price'].to_numpy(),
+        'distance_miles': dist[rows, top[rows, ranks]],
+        'score': top_scores[rows, ranks],
+    })
+
+
+def comps_for_metro(conn, metro_key, listing_date, n_comps=N_COMPS, lookback_days=LOOKBACK_DAYS,
+                    max_miles=MAX_MILES, chunk_size=CHUNK_SIZE, new_only=True):
+    """Partition task: comps for all listings of one metro_key."""
+    listings = load_partition_listings(conn, metro_key, listing_date, new_only)
+    if listings.empty:
+        return None
+    since = (datetime.strptime(listing_date, '%Y-%m-%d') - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    solds = load_partition_solds(conn, metro_key, since, listing_date)
+    if solds.empty:
+        return None
+
+    types = sorted(set(solds['type'].dropna()))
+    type_codes = {t: i for i, t in enumerate(types)}
+    index = SoldsIndex(solds, type_codes)
+
+    # Sorting listings by latitude keeps each chunk's latitude band narrow.
+    listings = listings.sort_values('geo_lat', kind='stable', ignore_index=True)
+    results = []
+    for start in range(0, len(listings), chunk_size):
+        chunk = score_chunk(listings.iloc[start:start + chunk_size], index, type_codes, n_comps, max_miles)
+        if chunk is not None:
+            results.append(chunk)
+    if not results:
+        return None
+    return pd.concat(results, ignore_index=True)
+
+
+def run_comps(listing_date, db_name='altos_one.db', n_comps=N_COMPS, lookback_days=LOOKBACK_DAYS,
+              max_miles=MAX_MILES, new_only=True, max_workers=None):
+    """Compute comps for every (new) listing on listing_date and write them to the comps table."""
+    with reader(db_name) as conn:
+        metro_keys = list_metro_keys(conn)
+    results = run_partitioned(comps_for_metro, metro_keys, db_name,
+                              args=(listing_date, n_comps, lookback_days, max_miles, CHUNK_SIZE, new_only),
+                              max_workers=max_workers)
+    frames = [df for _, df in results if df is not None]
+    comps = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    conn = connect(db_name)
+    create_comps_table(conn)
+    conn.execute("DELETE FROM comps WHERE listing_date = ?", (listing_date,))
+    if not comps.empty:
+        comps.insert(0, 'listing_date', listing_date)
+        cols = comps.columns.tolist()
+        conn.executemany(
+            f"INSERT INTO comps ({','.join(cols)}) VALUES ({','.join('?' for _ in cols)})",
+            comps.astype(object).where(comps.notnull(), None).itertuples(index=False, name=None)
+        )
+    conn.commit()
+    conn.close()
+    return comps
+
+
+def main():
+    listing_date = input("Enter the listings week date (YYYY-MM-DD): ").strip()
+    try:
+        datetime.strptime(listing_date, '%Y-%m-%d')
+    except ValueError:
+        print("Invalid date format. Please use YYYY-MM-DD.")
+        return
+    n_input = input(f"Number of comps per listing (default {N_COMPS}): ").strip()
+    n_comps = int(n_input) if n_input else N_COMPS
+    new_only = input("Only new listings (not in the prior week)? (y/n, default y): ").strip().lower() != 'n'
+
+    comps = run_comps(listing_date, n_comps=n_comps, new_only=new_only)
+    listings = comps['listing_id'].nunique() if not comps.empty else 0
+    print(f"✅ Wrote {len(comps)} comps for {listings} listings dated {listing_date} to the 'comps' table.")
+
+
+if __name__ == "__main__":
+    main()
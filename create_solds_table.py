@@ -1,7 +1,10 @@
-import sqlite3
+from db import connect
+from data_versions import bump_data_version
+from spatial_index import create_spatial_index
+from property_keys import create_property_keys_table
 
 def create_solds_table(db_name='altos_one.db'):
-    conn = sqlite3.connect(db_name)
+    conn = connect(db_name)
     cursor = conn.cursor()
     
     # Drop the solds table if it exists
@@ -38,15 +41,29 @@ def create_solds_table(db_name='altos_one.db'):
         agent_email TEXT,
         agent_phone TEXT,
         agent_office TEXT,
-        load_date TEXT
+        load_date TEXT,
+        metro_key INTEGER,
+        property_key INTEGER,
+        listed_on_day INTEGER,
+        pending_on_day INTEGER,
+        sold_day INTEGER
     )
     """)
     
     # Create indexes for faster lookup similar to listings and pendings
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_property_id ON solds(property_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_property_key ON solds(property_key)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_date ON solds(date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_zip ON solds(zip)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_street_address ON solds(street_address)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_metro_key ON solds(metro_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_solds_load_date ON solds(load_date)')
+    
+    # R*Tree index on geo_lat/geo_long, maintained by triggers at insert time
+    create_spatial_index(conn, 'solds')
+    create_property_keys_table(conn)
+    
+    # Every cached report over the old table is stale now
+    bump_data_version(conn, 'solds')
     
     conn.commit()
     conn.close()
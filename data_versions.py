@@ -0,0 +1,56 @@
+import hashlib
+import sqlite3
+from datetime import datetime
+
+# Per-table, per-snapshot-date version counters. Every script that changes
+# data bumps the (table, date) pairs it touched; cached report results are
+# keyed by a token built from the versions they depend on, so a load only
+# invalidates the reports that read the affected table/dates.
+
+ALL_DATES = ''  # version row for changes that aren't tied to one snapshot date
+
+
+def create_data_versions_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        table_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY (table_name, date)
+    )
+    """)
+
+
+def bump_data_version(conn, table_name, dates=(ALL_DATES,)):
+    """Increment the version of table_name for each of `dates`. The caller commits."""
+    create_data_versions_table(conn)
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.executemany(
+        """
+        INSERT INTO data_versions (table_name, date, version, updated_at) VALUES (?, ?, 1, ?)
+        ON CONFLICT (table_name, date) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+        """,
+        [(table_name, str(d), now) for d in set(dates)]
+    )
+
+
+def data_version_token(conn, tables, dates=None):
+    """
+    Hash of the versions of `tables` (restricted to `dates` if given, plus the
+    table-wide ALL_DATES row). Changes whenever any of those is bumped.
+    """
+    tables = sorted(tables)
+    query = f"SELECT table_name, date, version FROM data_versions WHERE table_name IN ({','.join('?' for _ in tables)})"
+    params = list(tables)
+    if dates is not None:
+        dates = sorted({str(d) for d in dates} | {ALL_DATES})
+        query += f" AND date IN ({','.join('?' for _ in dates)})"
+        params += dates
+    query += " ORDER BY table_name, date"
+    try:
+        rows = conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError:
+        # Nothing has been versioned yet.
+        rows = []
+    return hashlib.sha256(repr(rows).encode()).hexdigest()[:16]
@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Shared database layer used by the loaders and the reports.
+#  - Writers open the database in WAL mode so a long report no longer blocks
+#    the weekly load (and vice versa).
+#  - Reports use read-only URI connections (mode=ro, optionally immutable=1)
+#    handed out by a small per-database connection pool.
+#  - Every connection gets a tuned page cache and memory-mapped I/O.
+#  - When snapshot.py has published a copy of the database that is still
+#    current, reader() serves reports from that copy opened immutable, so they
+#    take no locks and never see a half-loaded week.
+
+DB_NAME = 'altos_one.db'
+
+CACHE_SIZE_KB = 256 * 1024        # page cache per connection (256 MB)
+MMAP_SIZE = 2 * 1024 ** 3         # memory-map up to 2 GB of the database file
+BUSY_TIMEOUT = 60                 # seconds to wait on a locked database
+POOL_SIZE = 4
+
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_MMAP_SIZE = 64 * 1024 ** 3   # map the whole snapshot (SQLite caps this at its compile-time limit)
+
+
+def _tune(conn, cache_size_kb=CACHE_SIZE_KB, mmap_size=MMAP_SIZE):
+    """Apply the per-connection cache and mmap settings."""
+    # A negative cache_size is interpreted by SQLite as KiB instead of pages.
+    conn.execute(f"PRAGMA cache_size = -{int(cache_size_kb)}")
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def connect(db_name=DB_NAME, cache_size_kb=CACHE_SIZE_KB, mmap_size=MMAP_SIZE):
+    """
+    Open a read/write connection in WAL mode. Used by the loaders and any
+    script that modifies the database.
+    """
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT)
+    # New files are created with incremental auto-vacuum so deletes can shrink
+    # them (delete_week_data.incremental_vacuum). Must come before the WAL
+    # switch; on an existing file it changes nothing without a full VACUUM.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # journal_mode is persistent, so this only does real work the first time.
+    conn.execute("PRAGMA journal_mode = WAL")
+    # NORMAL is durable across application crashes in WAL mode and avoids an
+    # fsync on every commit.
+    conn.execute("PRAGMA synchronous = NORMAL")
+    # Let the delete half of INSERT OR REPLACE fire AFTER DELETE triggers
+    # (used to keep the spatial index in sync).
+    conn.execute("PRAGMA recursive_triggers = ON")
+    return _tune(conn, cache_size_kb, mmap_size)
+
+
+def file_uri(path):
+    """SQLite URI (file:///...) for a filesystem path."""
+    return Path(os.path.abspath(path)).as_uri()
+
+
+def connect_read_only(db_name=DB_NAME, immutable=False,
+                      cache_size_kb=CACHE_SIZE_KB, mmap_size=MMAP_SIZE):
+    """
+    Open a read-only URI connection for reports.
+
+    immutable=True tells SQLite the file cannot change while it is open, so it
+    skips all locking and change detection. Only use it on files nothing else
+    writes to (e.g. a published snapshot); on the live database use the
+    default WAL reader instead.
+    """
+    uri = f"{file_uri(db_name)}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    return _tune(conn, cache_size_kb, mmap_size)
+
+
+def enable_wal(db_name=DB_NAME):
+    """Switch an existing database to WAL journaling."""
+    conn = sqlite3.connect(db_name)
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    conn.close()
+    return mode
+
+
+class ConnectionPool:
+    """
+    A small pool of read-only connections to one database file. Connections
+    are created lazily up to `size` and reused between calls, so back-to-back
+    report queries don't pay for a new connection (and a cold page cache) each
+    time.
+    """
+
+    def __init__(self, db_name=DB_NAME, size=POOL_SIZE, immutable=False, mmap_size=MMAP_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect_read_only(self.db_name, immutable=self.immutable, mmap_size=self.mmap_size)
+        # Pool exhausted: wait for another thread to hand one back.
+        return self._idle.get()
+
+    @staticmethod
+    def _reset(conn):
+        """
+        Drop the TEMP views/tables and detach the databases a borrower added
+        (e.g. archive_weeks.attach_archives). Returns False if that failed.
+        """
+        try:
+            for kind, name in conn.execute(
+                "SELECT type, name FROM temp.sqlite_master WHERE type IN ('view', 'table')"
+            ).fetchall():
+                conn.execute(f'DROP {kind.upper()} IF EXISTS temp."{name}"')
+            for _, schema, _ in conn.execute("PRAGMA database_list").fetchall():
+                if schema not in ('main', 'temp'):
+                    conn.execute(f'DETACH DATABASE "{schema}"')
+            return True
+        except sqlite3.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            # End any implicit read transaction so the WAL can be checkpointed.
+            conn.rollback()
+            # The next borrower gets a connection that sees only this database
+            if not self._closed and self._reset(conn):
+                self._idle.put(conn)
+            else:
+                conn.close()
+                if not self._closed:
+                    with self._lock:
+                        self._created -= 1
+
+    def close(self):
+        """Close idle connections; connections still in use are closed when returned."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name=DB_NAME, immutable=False):
+    """Return the shared read-only pool for db_name, creating it on first use."""
+    key = (os.path.abspath(db_name), immutable)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_name, immutable=immutable)
+    return pool
+
+
+def snapshot_dir(db_name=DB_NAME):
+    return os.path.join(os.path.dirname(os.path.abspath(db_name)), SNAPSHOT_DIR)
+
+
+def snapshot_pointer(db_name=DB_NAME):
+    """The pointer file naming the current snapshot of db_name."""
+    return os.path.join(snapshot_dir(db_name), f"{Path(db_name).stem}.current.json")
+
+
+def source_stamp(db_name=DB_NAME):
+    """
+    Cheap fingerprint of the live database files. Any committed write changes
+    the -wal file (or, after a checkpoint, the main file), so a snapshot is
+    current only while the stamp it was published with still matches.
+    """
+    st = os.stat(db_name)
+    try:
+        wal = os.stat(db_name + '-wal')
+        wal_mtime = wal.st_mtime_ns if wal.st_size else 0
+    except FileNotFoundError:
+        wal_mtime = 0
+    return [st.st_mtime_ns, st.st_size, wal_mtime]
+
+
+def current_snapshot(db_name=DB_NAME):
+    """Path of the published snapshot of db_name, or None if there is none or it is out of date."""
+    try:
+        with open(snapshot_pointer(db_name)) as f:
+            pointer = json.load(f)
+        path = os.path.join(snapshot_dir(db_name), pointer['snapshot'])
+        if pointer['source'] == source_stamp(db_name) and os.path.exists(path):
+            return path
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return None
+
+
+_snapshot_pools = {}
+
+
+def _snapshot_pool(db_name, path):
+    """Pool on the current snapshot of db_name; retires the pool on the previous one."""
+    key = os.path.abspath(db_name)
+    with _pools_lock:
+        pool = _snapshot_pools.get(key)
+        if pool is None or pool.db_name != path:
+            if pool is not None:
+                pool.close()
+            pool = _snapshot_pools[key] = ConnectionPool(path, immutable=True, mmap_size=SNAPSHOT_MMAP_SIZE)
+    return pool
+
+
+def open_reader(db_name=DB_NAME, use_snapshot=True):
+    """Unpooled read-only connection, on the current snapshot if there is one."""
+    snapshot = current_snapshot(db_name) if use_snapshot else None
+    if snapshot:
+        return connect_read_only(snapshot, immutable=True, mmap_size=SNAPSHOT_MMAP_SIZE)
+    return connect_read_only(db_name)
+
+
+@contextmanager
+def reader(db_name=DB_NAME, use_snapshot=True):
+    """
+    Borrow a pooled read-only connection: `with reader(db) as conn: ...`
+
+    Served from the current snapshot when one is published and nothing has
+    been written to db_name since; otherwise from the live database.
+    """
+    snapshot = current_snapshot(db_name) if use_snapshot else None
+    pool = _snapshot_pool(db_name, snapshot) if snapshot else get_pool(db_name)
+    with pool.connection() as conn:
+        yield conn
+
+
+@contextmanager
+def writer(db_name=DB_NAME):
+    """Open a WAL write connection, commit on success and always close it."""
+    conn = connect(db_name)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -1,32 +1,150 @@
-import sqlite3
 from datetime import datetime
+from db import connect
+from data_versions import bump_data_version
+from snapshot import publish_snapshot
+import week_partitions
+from column_stats import forget_dates
 
-def delete_rows_for_week(table_name, delete_date, db_name='altos_one.db'):
-    conn = sqlite3.connect(db_name)
+# Week removal in bounded batches: each batch deletes at most DELETE_BATCH rows
+# (and their index / spatial index entries) in its own short transaction, so
+# the write lock is released between batches and the WAL stays small.
+
+DELETE_TABLES = ['listings', 'pendings', 'solds']
+DELETE_BATCH = 50000
+VACUUM_PAGES = 10000     # pages released per incremental_vacuum step
+
+
+def delete_rows_for_week(table_name, delete_date, db_name='altos_one.db', column='date',
+                         batch_size=DELETE_BATCH, vacuum=False):
+    """
+    Delete every row of table_name where `column` (date, or load_date for
+    solds) equals delete_date, batch_size rows per transaction. Returns the
+    number of rows deleted.
+    """
+    if table_name not in DELETE_TABLES or column not in ('date', 'load_date'):
+        raise ValueError(f"Can't delete from '{table_name}' by '{column}'.")
+    conn = connect(db_name)
     cursor = conn.cursor()
-    
-    # Count the rows that will be deleted
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE date = ?", (delete_date,))
-    count = cursor.fetchone()[0]
-    print(f"Found {count} rows in '{table_name}' with date = {delete_date}.")
-    
-    if count > 0:
-        # Delete the rows
-        cursor.execute(f"DELETE FROM {table_name} WHERE date = ?", (delete_date,))
+    if column == 'load_date':
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_load_date ON {table_name} (load_date)")
+        conn.commit()
+
+    # Snapshot dates touched (for solds by load_date this can be several). No
+    # up-front count: the deletes below report how many rows they removed.
+    if column == 'date':
+        found = cursor.execute(f"SELECT 1 FROM {table_name} WHERE date = ? LIMIT 1", (delete_date,)).fetchone()
+        dates = [delete_date] if found else []
+    else:
+        dates = [r[0] for r in cursor.execute(f"SELECT DISTINCT date FROM {table_name} WHERE {column} = ?",
+                                              (delete_date,))]
+    if not dates:
+        print(f"No rows in '{table_name}' with {column} = {delete_date}.")
+        conn.close()
+        return 0
+    if table_name == 'solds':
+        # Take these dates out of the solds rollup and cohort histograms while
+        # their rows still exist; the refreshes fold back in whatever is left.
+        from solds_rollup import remove_date
+        from solds_cohorts import remove_date as remove_cohort_date
+        for d in dates:
+            remove_date(conn, d, db_name)
+            remove_cohort_date(conn, d)
+        bump_data_version(conn, table_name, dates)
+        conn.commit()
+
+    deleted = 0
+    if column == 'date' and week_partitions.is_partitioned(conn, table_name):
+        # A partitioned week goes in one DROP TABLE instead of row deletes
+        deleted = week_partitions.delete_date(conn, table_name, delete_date)
+        bump_data_version(conn, table_name, dates)
         conn.commit()
-        print(f"Deleted {cursor.rowcount} rows from '{table_name}'.")
+        print(f"Dropped {deleted} rows of '{table_name}' for {delete_date} with its partition.")
     else:
-        print("No rows to delete.")
-    
+        while True:
+            cursor.execute(
+                f"DELETE FROM {table_name} WHERE rowid IN "
+                f"(SELECT rowid FROM {table_name} WHERE {column} = ? LIMIT ?)",
+                (delete_date, batch_size)
+            )
+            if cursor.rowcount <= 0:
+                conn.commit()
+                break
+            deleted += cursor.rowcount
+            # Versioned in the batch's own transaction, so cached reports never
+            # outlive a committed batch even if a later one fails
+            bump_data_version(conn, table_name, dates)
+            conn.commit()
+            print(f"Deleted {deleted} rows from '{table_name}' so far.")
+
+    forget_dates(conn, table_name, dates)
+    conn.commit()
+    # Fold the deletes back into the main file and shrink the WAL
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
     conn.close()
+    print(f"Deleted {deleted} rows from '{table_name}'.")
+
+    if table_name == 'solds':
+        from solds_rollup import refresh_rollup
+        from solds_cohorts import refresh_cohorts
+        refresh_rollup(db_name)
+        refresh_cohorts(db_name)
+    if vacuum:
+        incremental_vacuum(db_name)
+    return deleted
+
+
+def enable_incremental_vacuum(db_name='altos_one.db'):
+    """Switch the database to auto_vacuum = INCREMENTAL (a one-time full VACUUM)."""
+    conn = connect(db_name)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    conn.close()
+    print(f"✅ auto_vacuum is now {'INCREMENTAL' if mode == 2 else mode}.")
+
+
+def incremental_vacuum(db_name='altos_one.db', step_pages=VACUUM_PAGES):
+    """
+    Return free pages to the filesystem a step at a time so the file actually
+    shrinks after a delete. Needs auto_vacuum = INCREMENTAL.
+    """
+    conn = connect(db_name)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.close()
+        print("auto_vacuum is not INCREMENTAL; run enable_incremental_vacuum() once (full VACUUM) to enable it.")
+        return 0
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    released = 0
+    while True:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if before == 0:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+        conn.commit()
+        step = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if step <= 0:
+            break
+        released += step
+        print(f"Released {released}/{free} free pages.")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    print(f"✅ Returned {released * page_size / 1024 ** 2:.2f} MB to the filesystem.")
+    return released
+
 
 def main():
-    table_name = input("Enter table name (listings or pendings): ").strip().lower()
-    if table_name not in ["listings", "pendings"]:
-        print("Invalid table name. Please enter 'listings' or 'pendings'.")
+    table_name = input("Enter table name (listings, pendings or solds): ").strip().lower()
+    if table_name not in DELETE_TABLES:
+        print("Invalid table name. Please enter 'listings', 'pendings' or 'solds'.")
         return
 
-    delete_date = input("Enter the date (YYYY-MM-DD) for which to delete rows: ").strip()
+    column = 'date'
+    if table_name == 'solds':
+        by_load = input("Delete solds by load_date instead of snapshot date? (y/n, default n): ").strip().lower()
+        column = 'load_date' if by_load == 'y' else 'date'
+
+    delete_date = input(f"Enter the {column} (YYYY-MM-DD) for which to delete rows: ").strip()
     # Validate date format
     try:
         datetime.strptime(delete_date, '%Y-%m-%d')
@@ -34,12 +152,13 @@ def main():
         print("Invalid date format. Please use YYYY-MM-DD.")
         return
 
-    confirm = input(f"Are you sure you want to delete all rows from '{table_name}' where date = {delete_date}? (y/n): ").strip().lower()
+    confirm = input(f"Are you sure you want to delete all rows from '{table_name}' where {column} = {delete_date}? (y/n): ").strip().lower()
     if confirm == 'y':
-        delete_rows_for_week(table_name, delete_date)
+        vacuum = input("Run incremental vacuum afterwards to shrink the file? (y/n, default n): ").strip().lower() == 'y'
+        delete_rows_for_week(table_name, delete_date, column=column, vacuum=vacuum)
+        publish_snapshot()
     else:
         print("Deletion canceled.")
 
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
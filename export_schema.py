@@ -1,14 +1,11 @@
-import sqlite3
 import pandas as pd
+from db import reader
+from profile_tables import PROFILE_TABLES, existing_tables
 
 def export_table_schema(table_name, db_name='altos_one.db'):
-    # Connect to the database
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
     # Get schema info
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    schema_info = cursor.fetchall()
+    with reader(db_name) as conn:
+        schema_info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
     
     # Build a DataFrame
     schema_df = pd.DataFrame(schema_info, columns=[
@@ -19,11 +16,10 @@ def export_table_schema(table_name, db_name='altos_one.db'):
     output_file = f"{table_name}_schema.csv"
     schema_df.to_csv(output_file, index=False)
     print(f"Schema for '{table_name}' written to '{output_file}'.")
-    
-    conn.close()
 
 def main():
-    tables = ['listings', 'pendings']
+    with reader() as conn:
+        tables = existing_tables(conn, PROFILE_TABLES)
     
     for table in tables:
         export_table_schema(table)
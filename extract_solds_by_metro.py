@@ -1,5 +1,25 @@
-import sqlite3
 import pandas as pd
+from db import reader
+from parallel_reports import run_partitioned
+from report_cache import cached_report
+from normalize import normalize_ids
+
+# Columns of the sold-properties CSV: the solds columns the report has always
+# published, not the internal ones added since (metro_key, property_key, the
+# *_day numbers). property_id is read as text so 64-bit IDs stay exact.
+SOLDS_COLUMNS = ['date', 'property_id', 'county_fips_code', 'parcel_number', 'street_address', 'city', 'state',
+                 'zip', 'county', 'type', 'beds', 'baths', 'floor_size', 'lot_size', 'built_in', 'geo_lat',
+                 'geo_long', 'estimated_value', 'sold_date', 'sold_price', 'list_price_initial', 'list_price_final',
+                 'listed_on', 'pending_on', 'agent_name', 'agent_email', 'agent_phone', 'agent_office', 'load_date']
+SELECT_SOLDS = ", ".join("CAST(s.property_id AS TEXT) AS property_id" if c == 'property_id' else f"s.{c}"
+                         for c in SOLDS_COLUMNS)
+
+
+def _read_solds(query, conn, params):
+    df = pd.read_sql_query(query, conn, params=params)
+    df['property_id'] = normalize_ids(df['property_id'])
+    return add_sale_to_list_price_ratio(df)
+
 
 def extract_solds_by_metro(db_name='altos_one.db', metro_filter=""):
     """
@@ -11,18 +31,19 @@ def extract_solds_by_metro(db_name='altos_one.db', metro_filter=""):
     
     The ratio is computed only if both sold_price and list_price_final are not null and list_price_final is not zero.
     """
-    conn = sqlite3.connect(db_name)
-    query = """
-    SELECT s.*, z.metro
+    query = f"""
+    SELECT {SELECT_SOLDS}, z.metro
     FROM solds s
     LEFT JOIN zip_to_metro z ON s.zip = z.zipcode
     WHERE LOWER(z.metro) LIKE LOWER(?)
     """
     param = f"%{metro_filter}%"
-    df = pd.read_sql_query(query, conn, params=(param,))
-    conn.close()
+    with reader(db_name) as conn:
+        return _read_solds(query, conn, (param,))
 
-    # Compute the sale_to_list_price_ratio column.
+
+def add_sale_to_list_price_ratio(df):
+    """Add the sale_to_list_price_ratio column described in extract_solds_by_metro."""
     def calc_ratio(row):
         try:
             sp = float(row['sold_price'])
@@ -37,14 +58,48 @@ def extract_solds_by_metro(db_name='altos_one.db', metro_filter=""):
     df['sale_to_list_price_ratio'] = df.apply(calc_ratio, axis=1)
     return df
 
+
+def extract_solds_for_metro(conn, metro):
+    """Partition task: sold records (with ratio) for exactly one metro."""
+    query = f"""
+    SELECT {SELECT_SOLDS}, z.metro
+    FROM solds s
+    JOIN zip_to_metro z ON s.zip = z.zipcode
+    WHERE z.metro = ?
+    """
+    return _read_solds(query, conn, (metro,))
+
+
+def extract_solds_by_metro_parallel(db_name='altos_one.db', metro_filter="", max_workers=None):
+    """
+    Parallel version of extract_solds_by_metro: every matching metro is
+    extracted in its own worker and the results are concatenated in metro order.
+    """
+    with reader(db_name) as conn:
+        metros = [r[0] for r in conn.execute(
+            "SELECT DISTINCT metro FROM zip_to_metro WHERE LOWER(metro) LIKE LOWER(?)",
+            (f"%{metro_filter}%",)
+        )]
+    if not metros:
+        return pd.DataFrame()
+    results = run_partitioned(extract_solds_for_metro, metros, db_name, max_workers=max_workers)
+    return pd.concat([df for _, df in results], ignore_index=True)
+
 def main():
     metro_input = input("Enter the metro market name (or part of it) to filter sold properties: ").strip()
     if not metro_input:
         print("No metro market entered. Exiting.")
         return
 
+    parallel = input("Run in parallel by metro? (y/n, default n): ").strip().lower() == 'y'
+
     print(f"Searching for sold properties in metro markets containing '{metro_input}'...")
-    df = extract_solds_by_metro(metro_filter=metro_input)
+    if parallel:
+        compute = lambda: extract_solds_by_metro_parallel(metro_filter=metro_input)
+    else:
+        compute = lambda: extract_solds_by_metro(metro_filter=metro_input)
+    df = cached_report('solds_by_metro', {'metro': metro_input.lower()}, compute,
+                       tables=['solds', 'zip_to_metro'])
     
     if df.empty:
         print(f"No sold records found for metro matching '{metro_input}'.")
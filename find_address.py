@@ -1,47 +1,42 @@
-import sqlite3
-import pandas as pd
+import csv
+from db import reader
 
-def main():
-    # Connect to the SQLite database
-    conn = sqlite3.connect('altos_one.db')
+# Pure sqlite3 + csv (no pandas) so a single address lookup starts instantly.
 
-    # Prompt the user for a partial street address to search for
-    address_part = input("Enter part of the street address to search for: ").strip()
+def search_address(address_part, db_name='altos_one.db'):
+    """
+    Search listings, pendings and solds for a partial street address and
+    export the matches (with a source column) to address_search_<query>.csv.
+    """
     pattern = f"%{address_part}%"
 
-    # Query each table for matching addresses, including a source column
-    listings_query = (
-        "SELECT 'listings' AS source, * "
-        "FROM listings "
-        "WHERE street_address LIKE ?"
-    )
-    pendings_query = (
-        "SELECT 'pendings' AS source, * "
-        "FROM pendings "
-        "WHERE street_address LIKE ?"
-    )
-    solds_query = (
-        "SELECT 'solds' AS source, * "
-        "FROM solds "
-        "WHERE street_address LIKE ?"
-    )
-
-    # Load into DataFrames
-    df_listings = pd.read_sql_query(listings_query, conn, params=(pattern,))
-    df_pendings = pd.read_sql_query(pendings_query, conn, params=(pattern,))
-    df_solds = pd.read_sql_query(solds_query, conn, params=(pattern,))
-
-    # Combine all results
-    df_all = pd.concat([df_listings, df_pendings, df_solds], ignore_index=True, sort=False)
-
-    # Close the connection
-    conn.close()
+    columns = ['source']
+    rows = []
+    with reader(db_name) as conn:
+        # Query each table for matching addresses, including a source column
+        for table in ['listings', 'pendings', 'solds']:
+            cursor = conn.execute(
+                f"SELECT '{table}' AS source, * FROM {table} WHERE street_address LIKE ?", (pattern,)
+            )
+            names = [d[0] for d in cursor.description]
+            # Combined header: union of all columns in order of first appearance
+            columns += [n for n in names if n not in columns]
+            rows += [dict(zip(names, r)) for r in cursor]
 
     # Export to CSV
     safe_addr = address_part.replace(' ', '_')
     output_file = f"address_search_{safe_addr}.csv"
-    df_all.to_csv(output_file, index=False)
-    print(f"✅ Exported {len(df_all)} matching rows to '{output_file}'")
+    with open(output_file, 'w', newline='') as f:
+        out = csv.DictWriter(f, fieldnames=columns)
+        out.writeheader()
+        out.writerows(rows)
+    print(f"✅ Exported {len(rows)} matching rows to '{output_file}'")
+    return output_file
+
+def main():
+    # Prompt the user for a partial street address to search for
+    address_part = input("Enter part of the street address to search for: ").strip()
+    search_address(address_part)
 
 if __name__ == '__main__':
     main()
@@ -1,77 +1,113 @@
-import sqlite3
 import pandas as pd
+from db import reader
+from archive_weeks import attach_archives
+from normalize import normalize_ids
 
-def main():
-    conn = sqlite3.connect('altos_one.db')
+# Columns the listings/pendings union is matched on (as the old pandas outer
+# merge did); the output is ordered by them too
+MATCH_COLS = ['date', 'property_id', 'county_fips_code', 'street_address', 'city', 'state', 'zip']
+# Selected as text and restored to Int64: the outer union leaves NULLs, which
+# would otherwise make pandas read them as float64 and round 64-bit IDs
+ID_COLS = ['property_id', 'listing_id', 'pending_id']
 
-    # 1) Prompt filters
-    sf = input("Limit to single_family type? (y/n, default n): ").strip().lower()
-    filter_clause = "AND type = 'single_family'" if sf == 'y' else ""
 
-    date = input("Enter the target week date (YYYY-MM-DD): ").strip()
-    check_solds = (
-        input("Also restrict to properties present in solds? (y/n, default n): ")
-        .strip().lower() == 'y'
-    )
+def find_common_properties(conn, start_date, end_date=None, single_family=False, check_solds=False):
+    """
+    Properties present in listings or pendings between start_date and end_date
+    (inclusive; a single week if end_date is None), with the matching
+    sold_date/sold_price from solds. With check_solds, only properties that
+    appear in solds are returned.
+
+    Runs as one SQL statement: the period's property_ids go into a temp table
+    that drives an indexed lookup into solds (through property_keys, so rows
+    archived before property_key existed still match), and only the matching
+    solds rows are read no matter how much solds history there is.
+    """
+    end_date = end_date or start_date
+    filter_clause = "AND type = 'single_family'" if single_family else ""
+    period = (start_date, end_date)
+
+    conn.execute("DROP TABLE IF EXISTS temp.common_props")
+    conn.execute(f"""
+        CREATE TEMP TABLE common_props AS
+        SELECT property_id FROM listings WHERE date BETWEEN ? AND ? AND property_id IS NOT NULL {filter_clause}
+        UNION
+        SELECT property_id FROM pendings WHERE date BETWEEN ? AND ? AND property_id IS NOT NULL {filter_clause}
+    """, period + period)
 
-    # 2) Load listings & pendings (for that date)
-    listings_q = f"""
+    # NULL-safe matching (IS) so rows with missing address parts still pair up,
+    # exactly like the previous pandas merge did.
+    match = " AND ".join(f"p.{c} IS l.{c}" for c in MATCH_COLS)
+    solds_join = "JOIN" if check_solds else "LEFT JOIN"
+    query = f"""
+    WITH l AS (
         SELECT date, property_id, listing_id,
                county_fips_code, street_address,
                city, state, zip, price AS listing_price
         FROM listings
-        WHERE date = ? {filter_clause}
-    """
-    pendings_q = f"""
+        WHERE date BETWEEN ? AND ? {filter_clause}
+    ),
+    p AS (
         SELECT date, property_id, pending_id,
                county_fips_code, street_address,
                city, state, zip, price AS pending_price,
                days_in_contract
         FROM pendings
-        WHERE date = ? {filter_clause}
+        WHERE date BETWEEN ? AND ? {filter_clause}
+    ),
+    u AS (
+        SELECT l.date, l.property_id, l.listing_id, p.pending_id,
+               l.county_fips_code, l.street_address, l.city, l.state, l.zip,
+               l.listing_price, p.pending_price, p.days_in_contract
+        FROM l LEFT JOIN p ON {match}
+        UNION ALL
+        SELECT p.date, p.property_id, NULL, p.pending_id,
+               p.county_fips_code, p.street_address, p.city, p.state, p.zip,
+               NULL, p.pending_price, p.days_in_contract
+        FROM p
+        WHERE NOT EXISTS (SELECT 1 FROM l WHERE {match})
+    ),
+    s AS (
+        SELECT c.property_id, s.sold_date, s.sold_price
+        FROM common_props c
+        JOIN property_keys k ON k.property_id = c.property_id
+        JOIN solds s ON s.property_key = k.property_key
+    )
+    SELECT u.date, {", ".join(f"CAST(u.{c} AS TEXT) AS {c}" for c in ID_COLS)},
+           u.county_fips_code, u.street_address, u.city, u.state, u.zip,
+           u.listing_price, u.pending_price, u.days_in_contract,
+           s.sold_date, s.sold_price
+    FROM u {solds_join} s ON s.property_id = u.property_id
+    ORDER BY {", ".join(f"u.{c}" for c in MATCH_COLS)}, u.listing_id, u.pending_id, s.sold_date
     """
-    df_list = pd.read_sql_query(listings_q, conn, params=(date,))
-    df_pen  = pd.read_sql_query(pendings_q, conn, params=(date,))
+    try:
+        result = pd.read_sql_query(query, conn, params=period + period)
+        for col in ID_COLS:
+            result[col] = normalize_ids(result[col])
+        return result
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.common_props")
 
-    # 3) Union them (so any property in either table)
-    df_list['in_list'] = True
-    df_pen ['in_pen']  = True
-    df_union = pd.merge(
-        df_list, df_pen,
-        on=['date','property_id','county_fips_code','street_address','city','state','zip'],
-        how='outer',
-        suffixes=('_list','_pen')
-    )
 
-    # 4) Optionally restrict to those in solds
-    if check_solds:
-        sold_ids = pd.read_sql_query("SELECT DISTINCT property_id FROM solds", conn)
-        df_union = df_union[df_union['property_id'].isin(sold_ids['property_id'])]
+def main():
+    # 1) Prompt filters
+    sf = input("Limit to single_family type? (y/n, default n): ").strip().lower()
 
-    # 5) Bring in sold_date & sold_price
-    df_solds = pd.read_sql_query(
-        "SELECT property_id, sold_date, sold_price FROM solds", conn
+    date = input("Enter the target week date (YYYY-MM-DD): ").strip()
+    end_date = input("Enter an end date for a range (YYYY-MM-DD, or press Enter for that week only): ").strip() or None
+    check_solds = (
+        input("Also restrict to properties present in solds? (y/n, default n): ")
+        .strip().lower() == 'y'
     )
-    df_union = df_union.merge(df_solds, on='property_id', how='left')
-
-    conn.close()
 
-    # 6) Clean up columns & pick one set of address fields
-    #    We already have county_fips_code / street_address / city / state / zip from the merge
-    #    listing_price, pending_price, days_in_contract may each be NaN if missing
-    output_cols = [
-        'date', 'property_id',
-        'listing_id', 'pending_id',
-        'county_fips_code', 'street_address',
-        'city', 'state', 'zip',
-        'listing_price', 'pending_price',
-        'days_in_contract',
-        'sold_date', 'sold_price'
-    ]
-    result = df_union[output_cols]
+    # 2) Listings/pendings union with sold_date & sold_price, in one query
+    with reader('altos_one.db') as conn:
+        # The period may reach into the archive tier
+        attach_archives(conn)
+        result = find_common_properties(conn, date, end_date, sf == 'y', check_solds)
 
-    # 7) Export
-    default_fn = f"common_properties_{date}.csv"
+    # 3) Export
+    default_fn = f"common_properties_{date}.csv" if not end_date else f"common_properties_{date}_{end_date}.csv"
     out_fn = input(f"Enter output CSV filename (default {default_fn}): ").strip() or default_fn
     result.to_csv(out_fn, index=False)
     print(f"✅ Exported {len(result)} rows to '{out_fn}'")
@@ -1,11 +1,10 @@
-import sqlite3
 import pandas as pd
+from db import reader
 
 def find_duplicates_from_db(db_name='altos_one.db', output_file='listings_duplicate.csv'):
     # Connect to the SQLite database and load the listings table into a DataFrame
-    conn = sqlite3.connect(db_name)
-    df = pd.read_sql_query("SELECT * FROM listings", conn)
-    conn.close()
+    with reader(db_name) as conn:
+        df = pd.read_sql_query("SELECT * FROM listings", conn)
     
     # Ensure the key columns are treated as strings and strip any extra whitespace
     df['date'] = df['date'].astype(str).str.strip()
@@ -1,27 +1,60 @@
-import sqlite3
 import pandas as pd
+from db import reader
+from parallel_reports import list_states, run_partitioned
+from report_cache import cached_report
+from archive_weeks import attach_archives, has_archives
+from week_partitions import route
 from datetime import datetime, timedelta
 
+# Columns of the withdrawn-listings CSV: the listings columns the report has
+# always published, not the internal ones added since (metro_key, property_key,
+# row_hash)
+LISTING_COLUMNS = ['date', 'property_id', 'listing_id', 'parcel_number', 'county_fips_code', 'street_address',
+                   'city', 'state', 'zip', 'price', 'type', 'beds', 'baths', 'floor_size', 'lot_size', 'built_in',
+                   'geo_lat', 'geo_long', 'load_date']
+
 
 def find_withdrawn_listings(conn, target_week_str, filter_clause=""):
     target_week = datetime.strptime(target_week_str, '%Y-%m-%d')
     week_prior_str = (target_week - timedelta(days=7)).strftime('%Y-%m-%d')
 
+    # Anti-join on the surrogate property_key through the (date, property_key)
+    # indexes. NOT EXISTS rather than NOT IN: one NULL key in the target week
+    # would make NOT IN drop every row. Each side reads its week's partition
+    # directly when the tables are partitioned. Rows without a property_key
+    # (archived before it existed) are matched on property_id instead; the
+    # key IS NULL lookups are empty index ranges when every row has a key.
+    unmatched = "\n".join(f"""
+      AND NOT EXISTS (SELECT 1 FROM {source} t
+                      WHERE t.date = :target AND t.property_key = l.property_key {filter_clause})
+      AND NOT EXISTS (SELECT 1 FROM {source} t
+                      WHERE t.date = :target AND t.property_key IS NULL AND t.property_id = l.property_id {filter_clause})
+      AND (l.property_key IS NOT NULL OR NOT EXISTS (SELECT 1 FROM {source} t
+                      WHERE t.date = :target AND t.property_id = l.property_id {filter_clause}))"""
+        for source in (route(conn, 'listings', target_week_str), route(conn, 'pendings', target_week_str)))
     query = f"""
-    WITH target_props AS (
-        SELECT property_id FROM listings WHERE date = ? {filter_clause}
-        UNION
-        SELECT property_id FROM pendings WHERE date = ? {filter_clause}
-    )
-    SELECT l.*
-    FROM listings l
-    WHERE l.date = ? {filter_clause}
-      AND l.property_id NOT IN (SELECT property_id FROM target_props)
+    SELECT {", ".join(f"l.{c}" for c in LISTING_COLUMNS)}
+    FROM {route(conn, 'listings', week_prior_str)} l
+    WHERE l.date = :prior {filter_clause}
+      AND l.property_id IS NOT NULL {unmatched}
     """
-    df = pd.read_sql_query(query, conn, params=(target_week_str, target_week_str, week_prior_str))
+    df = pd.read_sql_query(query, conn, params={'prior': week_prior_str, 'target': target_week_str})
     return df, week_prior_str
 
 
+def cached_withdrawn_listings(conn, target_week_str, filter_clause="", db_name='altos_one.db'):
+    """
+    find_withdrawn_listings, cached until the listings/pendings rows for the
+    target week or the week before it change.
+    """
+    week_prior_str = (datetime.strptime(target_week_str, '%Y-%m-%d') - timedelta(days=7)).strftime('%Y-%m-%d')
+    return cached_report(
+        'withdrawn_listings', {'week': target_week_str, 'filter': filter_clause},
+        lambda: find_withdrawn_listings(conn, target_week_str, filter_clause),
+        db_name, tables=['listings', 'pendings'], dates=[target_week_str, week_prior_str]
+    )
+
+
 def compute_state_counts(conn, week_prior_str, filter_clause=""):
     query = f"""
     SELECT state, COUNT(*) AS prior_week_listings
@@ -45,6 +78,34 @@ def compute_metro_counts(conn, week_prior_str, filter_clause=""):
     return df
 
 
+def _metro_counts_for_state(conn, state, week_prior_str, filter_clause=""):
+    query = f"""
+    SELECT z.metro, COUNT(*) AS prior_week_listings
+    FROM listings l
+    LEFT JOIN zip_to_metro z ON l.zip = z.zipcode
+    WHERE l.date = ? AND l.state IS ? {filter_clause}
+    GROUP BY z.metro
+    """
+    return pd.read_sql_query(query, conn, params=(week_prior_str, state))
+
+
+def compute_metro_counts_partitioned(db_name, week_prior_str, filter_clause="", max_workers=None, archives=False):
+    """
+    compute_metro_counts split by state across worker processes. Metros can
+    span states, so the per-state counts are summed back up per metro.
+    archives=True includes the archived weeks.
+    """
+    with reader(db_name) as conn:
+        if archives:
+            attach_archives(conn)
+        states = list_states(conn, 'listings', week_prior_str)
+    results = run_partitioned(_metro_counts_for_state, states, db_name,
+                              args=(week_prior_str, filter_clause), max_workers=max_workers, archives=archives)
+    df = pd.concat([r for _, r in results], ignore_index=True)
+    df['metro'] = df['metro'].fillna('UNKNOWN')
+    return df.groupby('metro', as_index=False)['prior_week_listings'].sum()
+
+
 def compute_withdrawal_statistics(withdrawals_df, counts_df, group_col):
     withdrawn_counts = withdrawals_df.groupby(group_col).size().reset_index(name='withdrawn_count')
     stats = pd.merge(counts_df, withdrawn_counts, on=group_col, how='left')
@@ -63,27 +124,39 @@ def add_metro_column(df, conn):
     return merged
 
 
-def run_all_history(conn, filter_clause=""):
+def withdrawal_history(conn, filter_clause="", cached=True):
+    """State-level withdrawal stats for every listings week (the all-history report)."""
+    find = cached_withdrawn_listings if cached else find_withdrawn_listings
     dates = pd.read_sql_query("SELECT DISTINCT date FROM listings ORDER BY date", conn)['date']
     all_stats = []
     for d in dates:
-        withdrawn_df, prior = find_withdrawn_listings(conn, d, filter_clause)
+        withdrawn_df, prior = find(conn, d, filter_clause)
         state_counts = compute_state_counts(conn, prior, filter_clause)
         stats = compute_withdrawal_statistics(withdrawn_df, state_counts, 'state')
         stats.insert(0, 'date', d)
         all_stats.append(stats)
-    result = pd.concat(all_stats, ignore_index=True)
+    return pd.concat(all_stats, ignore_index=True)
+
+
+def run_all_history(conn, filter_clause=""):
+    result = withdrawal_history(conn, filter_clause)
     result.to_csv('withdrawn_history_stats.csv', index=False)
-    print(f"✅ Exported historical state-level stats for {len(dates)} weeks to 'withdrawn_history_stats.csv'")
+    weeks = conn.execute("SELECT COUNT(DISTINCT date) FROM listings").fetchone()[0]
+    print(f"✅ Exported historical state-level stats for {weeks} weeks to 'withdrawn_history_stats.csv'")
 
 
-def run_detailed(conn, filter_clause=""):
-    target_week = input("Enter the target week date (YYYY-MM-DD): ").strip()
-    withdrawn_df, prior = find_withdrawn_listings(conn, target_week, filter_clause)
+def withdrawal_report(conn, target_week, filter_clause="", market="", parallel=False, db_name='altos_one.db',
+                      cached=True):
+    """
+    The detailed single-week report: (withdrawn listings, state stats, metro stats)
+    for target_week, limited to a state code, a metro substring or 'top50'.
+    """
+    if cached:
+        withdrawn_df, prior = cached_withdrawn_listings(conn, target_week, filter_clause, db_name)
+    else:
+        withdrawn_df, prior = find_withdrawn_listings(conn, target_week, filter_clause)
 
     withdrawn_df = add_metro_column(withdrawn_df, conn)
-
-    market = input("Enter state code, metro filter, 'top50', or press Enter for all: ").strip()
     is_top50 = market.lower() == 'top50'
 
     if is_top50:
@@ -96,10 +169,6 @@ def run_detailed(conn, filter_clause=""):
     elif market:
         withdrawn_df = withdrawn_df[withdrawn_df['metro'].str.contains(market, case=False, na=False)]
 
-    fn1 = input(f"Filename for withdrawn listings (default withdrawn_listings_{target_week}.csv): ").strip() or f"withdrawn_listings_{target_week}.csv"
-    withdrawn_df.to_csv(fn1, index=False)
-    print(f"✅ Exported withdrawn listings to '{fn1}'")
-
     state_counts = compute_state_counts(conn, prior, filter_clause)
     if is_top50:
         valid_states = withdrawn_df['state'].unique().tolist()
@@ -107,11 +176,11 @@ def run_detailed(conn, filter_clause=""):
     elif len(market) == 2:
         state_counts = state_counts[state_counts['state'].str.upper() == market.upper()]
     state_stats = compute_withdrawal_statistics(withdrawn_df, state_counts, 'state')
-    fn2 = input(f"Filename for state stats (default withdrawn_stats_{target_week}.csv): ").strip() or f"withdrawn_stats_{target_week}.csv"
-    state_stats.to_csv(fn2, index=False)
-    print(f"✅ Exported state-level stats to '{fn2}'")
 
-    metro_counts = compute_metro_counts(conn, prior, filter_clause)
+    if parallel:
+        metro_counts = compute_metro_counts_partitioned(db_name, prior, filter_clause, archives=has_archives(conn))
+    else:
+        metro_counts = compute_metro_counts(conn, prior, filter_clause)
     if is_top50:
         metro_counts = metro_counts[metro_counts['metro'].isin(top50)]
     elif market and len(market) != 2:
@@ -128,6 +197,22 @@ def run_detailed(conn, filter_clause=""):
         cols = metro_stats.columns.tolist()
         cols.insert(cols.index('metro')+1, cols.pop(cols.index('display_name')))
         metro_stats = metro_stats[cols]
+    return withdrawn_df, state_stats, metro_stats
+
+
+def run_detailed(conn, filter_clause="", parallel=False, db_name='altos_one.db'):
+    target_week = input("Enter the target week date (YYYY-MM-DD): ").strip()
+    market = input("Enter state code, metro filter, 'top50', or press Enter for all: ").strip()
+    withdrawn_df, state_stats, metro_stats = withdrawal_report(conn, target_week, filter_clause, market,
+                                                               parallel, db_name)
+
+    fn1 = input(f"Filename for withdrawn listings (default withdrawn_listings_{target_week}.csv): ").strip() or f"withdrawn_listings_{target_week}.csv"
+    withdrawn_df.to_csv(fn1, index=False)
+    print(f"✅ Exported withdrawn listings to '{fn1}'")
+
+    fn2 = input(f"Filename for state stats (default withdrawn_stats_{target_week}.csv): ").strip() or f"withdrawn_stats_{target_week}.csv"
+    state_stats.to_csv(fn2, index=False)
+    print(f"✅ Exported state-level stats to '{fn2}'")
 
     fn3 = input(f"Filename for metro stats (default withdrawn_metro_stats_{target_week}.csv): ").strip() or f"withdrawn_metro_stats_{target_week}.csv"
     metro_stats.to_csv(fn3, index=False)
@@ -135,17 +220,18 @@ def run_detailed(conn, filter_clause=""):
 
 
 def main():
-    conn = sqlite3.connect('altos_one.db')
     mode = input("Mode: all-history (enter 'all') or detailed single-week (enter 'detailed', default): ").strip().lower()
     sf = input("Focus only on single_family residences? (y/n, default y): ").strip().lower()
     filter_clause = '' if sf == 'n' else "AND type = 'single_family'"
 
-    if mode == 'all':
-        run_all_history(conn, filter_clause)
-    else:
-        run_detailed(conn, filter_clause)
-
-    conn.close()
+    with reader('altos_one.db') as conn:
+        # Any week may have moved to the archive tier
+        attach_archives(conn)
+        if mode == 'all':
+            run_all_history(conn, filter_clause)
+        else:
+            parallel = input("Compute metro stats in parallel by state? (y/n, default n): ").strip().lower() == 'y'
+            run_detailed(conn, filter_clause, parallel)
 
 if __name__ == '__main__':
     main()
@@ -1,5 +1,7 @@
-import sqlite3
 import pandas as pd
+from db import connect
+from data_versions import bump_data_version
+from normalize import assign_metro_keys, normalize_code, sync_metros
 # This script creates a zip_to_metro table in the SQLite database and imports data from a CSV file.
 # just a one time use
 def create_zip_to_metro_table(db_name='altos_one.db'):
@@ -9,7 +11,7 @@ def create_zip_to_metro_table(db_name='altos_one.db'):
       - zipcode
     An index on zipcode is added to optimize look-ups.
     """
-    conn = sqlite3.connect(db_name)
+    conn = connect(db_name)
     cursor = conn.cursor()
     # Drop the table if it exists; remove this step if you want to keep existing data.
     cursor.execute("DROP TABLE IF EXISTS zip_to_metro")
@@ -34,8 +36,8 @@ def import_zip_to_metro(csv_file, db_name='altos_one.db'):
     Reads the CSV file (expected columns: market_area, zipcode), renames the
     market_area column to 'metro', and imports the data into the zip_to_metro table.
     """
-    # Read CSV file into a DataFrame.
-    df = pd.read_csv(csv_file)
+    # Read CSV file into a DataFrame (zipcode as text so leading zeros survive).
+    df = pd.read_csv(csv_file, dtype={'zipcode': str})
     
     # Rename the column 'market_area' to 'metro' if it exists.
     if 'market_area' in df.columns:
@@ -45,11 +47,15 @@ def import_zip_to_metro(csv_file, db_name='altos_one.db'):
     
     # Optional: You can also trim whitespace from the columns.
     df['metro'] = df['metro'].astype(str).str.strip()
-    df['zipcode'] = df['zipcode'].astype(str).str.strip()
+    df['zipcode'] = normalize_code(df['zipcode'], 5)
     
     # Insert the data into the zip_to_metro table.
-    conn = sqlite3.connect(db_name)
+    conn = connect(db_name)
     df.to_sql('zip_to_metro', conn, if_exists='append', index=False)
+    bump_data_version(conn, 'zip_to_metro')
+    # Give new metros a metro_key and re-derive metro_key on the fact tables
+    sync_metros(conn)
+    assign_metro_keys(conn)
     conn.commit()
     conn.close()
     print("✅ CSV data imported into 'zip_to_metro' table.")
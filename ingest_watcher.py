@@ -0,0 +1,300 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Drop-folder ingest daemon.
+#
+# Watches incoming/ for weekly CSVs, works out which table and snapshot date
+# each file is for (from the filename, or the header and first row), and
+# queues them. A single writer task loads the queue one file at a time with
+# insert_weekly_data.insert_csv_to_table in a one-thread executor, so files
+# that land together never compete for the SQLite write lock. Before a file
+# is loaded, every row's date column must match its snapshot date; files that
+# don't (or have no date column) go to failed/. Once the queue drains it
+# refreshes the solds rollup and publishes a new read snapshot.
+# Progress and throughput are written to ingest_status.json.
+
+DROP_DIR = 'incoming'      # loaded files move to incoming/processed/, bad ones to incoming/failed/
+STATUS_FILE = 'ingest_status.json'
+POLL_SECONDS = 5
+STABLE_SECONDS = 10      # a file must stop changing for this long before it is loaded
+TABLES = ['listings', 'pendings', 'solds']   # load order for files of the same date
+
+# Columns that only appear in one kind of file
+SIGNATURE_COLUMNS = {'listing_id': 'listings', 'pending_id': 'pendings', 'sold_date': 'solds'}
+DATE_PATTERNS = [r'(\d{4}-\d{2}-\d{2})', r'(\d{4})(\d{2})(\d{2})']
+
+
+def read_header(path):
+    """(header, first data row) of a CSV file."""
+    with open(path, newline='') as f:
+        rows = csv.reader(f)
+        header = next(rows, [])
+        first = next(rows, [])
+    return header, dict(zip(header, first))
+
+
+def infer_table(path, header):
+    """Table for a CSV from its filename, falling back to its distinguishing columns."""
+    name = os.path.basename(path).lower()
+    for table in TABLES:
+        if table[:-1] in name:          # 'listing', 'pending', 'sold'
+            return table
+    for col, table in SIGNATURE_COLUMNS.items():
+        if col in header:
+            return table
+    return None
+
+
+def infer_date(path, first_row):
+    """Snapshot date for a CSV from its filename, falling back to the first row's date column."""
+    name = os.path.basename(path)
+    for pattern in DATE_PATTERNS:
+        m = re.search(pattern, name)
+        if m:
+            try:
+                return datetime.strptime('-'.join(m.groups()), '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    value = (first_row.get('date') or '').strip()
+    try:
+        return datetime.strptime(value[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def check_dates(path, expected, chunksize=500000):
+    """
+    Raise ValueError unless every row of the CSV has `date` == expected (the
+    snapshot date the file was queued under). Reads only the date column.
+    """
+    import pandas as pd
+    if expected is None:
+        raise ValueError("can't tell which snapshot date this file is for")
+    try:
+        chunks = pd.read_csv(path, usecols=['date'], dtype=str, chunksize=chunksize, keep_default_na=False)
+    except ValueError:
+        raise ValueError("file has no 'date' column") from None
+    found = set()
+    for chunk in chunks:
+        found.update(chunk['date'].str.strip().str.slice(0, 10).unique())
+    other = sorted(found - {expected})
+    if other:
+        shown = ", ".join(d or '(blank)' for d in other[:5])
+        raise ValueError(f"rows dated {shown} don't match the file's snapshot date {expected}")
+
+
+class IngestWatcher:
+    def __init__(self, db_name='altos_one.db', drop_dir=DROP_DIR, status_file=STATUS_FILE,
+                 poll_seconds=POLL_SECONDS, stable_seconds=STABLE_SECONDS, publish=True):
+        self.db_name = db_name
+        self.drop_dir = drop_dir
+        self.processed_dir = os.path.join(drop_dir, 'processed')
+        self.failed_dir = os.path.join(drop_dir, 'failed')
+        self.status_file = status_file
+        self.poll_seconds = poll_seconds
+        self.stable_seconds = stable_seconds
+        self.publish = publish
+        self.queue = asyncio.Queue()
+        # The one thread that writes to the database
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+        self._seen = {}        # path -> (size, mtime) from the previous poll
+        self._queued = set()
+        self._status_lock = threading.Lock()   # the writer thread reports progress too
+        self.status = {
+            'state': 'idle', 'started_at': datetime.now().isoformat(timespec='seconds'),
+            'current': None, 'queued': [], 'completed': [], 'failed': [],
+            'totals': {'files': 0, 'rows': 0, 'seconds': 0.0},
+        }
+
+    # --- status -------------------------------------------------------------
+
+    def write_status(self):
+        with self._status_lock:
+            self.status['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            self.status['queued'] = sorted(os.path.basename(p) for p in list(self._queued))
+            tmp = self.status_file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.status, f, indent=2)
+            os.replace(tmp, self.status_file)
+
+    def _progress(self, current, t0, rows):
+        # Called from the writer thread after every chunk; write_status may be
+        # serializing the same dicts on the event loop thread
+        elapsed = time.monotonic() - t0
+        with self._status_lock:
+            current['rows'] = rows
+            current['seconds'] = round(elapsed, 1)
+            current['rows_per_sec'] = round(rows / elapsed) if elapsed else None
+        self.write_status()
+
+    # --- discovery ----------------------------------------------------------
+
+    def _stable_files(self):
+        """CSV files in the drop folder that haven't changed since the last poll."""
+        now = time.time()
+        stable = []
+        current = {}
+        for entry in os.scandir(self.drop_dir):
+            if not entry.is_file() or not entry.name.lower().endswith('.csv'):
+                continue
+            st = entry.stat()
+            current[entry.path] = (st.st_size, st.st_mtime)
+            if (self._seen.get(entry.path) == current[entry.path]
+                    and now - st.st_mtime >= self.stable_seconds
+                    and entry.path not in self._queued):
+                stable.append(entry.path)
+        self._seen = current
+        return stable
+
+    def _describe(self, path):
+        header, first_row = read_header(path)
+        return {'path': path, 'file': os.path.basename(path),
+                'table': infer_table(path, header), 'date': infer_date(path, first_row)}
+
+    async def scan(self):
+        """Poll the drop folder and queue newly stable files, oldest date first, listings before solds."""
+        while True:
+            jobs = []
+            for path in self._stable_files():
+                try:
+                    job = self._describe(path)
+                except (OSError, UnicodeDecodeError, csv.Error) as e:
+                    job = {'path': path, 'file': os.path.basename(path), 'table': None, 'date': None, 'error': str(e)}
+                jobs.append(job)
+            jobs.sort(key=lambda j: (j['date'] or '', TABLES.index(j['table']) if j['table'] in TABLES else 99))
+            for job in jobs:
+                self._queued.add(job['path'])
+                await self.queue.put(job)
+            if jobs:
+                self.write_status()
+            await asyncio.sleep(self.poll_seconds)
+
+    # --- loading ------------------------------------------------------------
+
+    def _move(self, path, directory):
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            target = os.path.join(directory, f"{stem}.{datetime.now():%Y%m%d%H%M%S}{ext}")
+        shutil.move(path, target)
+        return target
+
+    def _load(self, job, current, t0):
+        from insert_weekly_data import insert_csv_to_table
+        # The date only ordered the queue so far: refuse files whose rows say otherwise
+        check_dates(job['path'], job['date'])
+        return insert_csv_to_table(job['path'], job['table'], self.db_name,
+                                   progress=lambda rows: self._progress(current, t0, rows))
+
+    def _post_load_steps(self, tables):
+        """(name, function) of the steps to run once the queue is empty."""
+        steps = []
+        if 'solds' in tables:
+            from solds_rollup import refresh_rollup
+            steps.append(('solds rollup', lambda: refresh_rollup(self.db_name)))
+            from solds_cohorts import refresh_cohorts
+            steps.append(('solds cohorts', lambda: refresh_cohorts(self.db_name)))
+        if self.publish:
+            from snapshot import publish_snapshot
+            steps.append(('snapshot', lambda: publish_snapshot(self.db_name)))
+        return steps
+
+    def _after_batch(self, tables):
+        """Incremental rollups and a fresh snapshot; one failing step doesn't skip the others."""
+        from load_metrics import track_run
+        errors = []
+        with track_run('load', 'post_load', self.db_name) as metrics:
+            for name, step in self._post_load_steps(tables):
+                try:
+                    with metrics.stage(name):
+                        step()
+                except Exception as e:
+                    print(f"❌ Post-load step '{name}' failed: {e}")
+                    errors.append({'step': name, 'error': f"{type(e).__name__}: {e}"})
+        with self._status_lock:
+            self.status['post_load_errors'] = errors
+
+    async def load(self):
+        """The single writer: load queued files one at a time, then run the post-load steps."""
+        loop = asyncio.get_running_loop()
+        loaded_tables = set()
+        while True:
+            job = await self.queue.get()
+            t0 = time.monotonic()
+            current = {'file': job['file'], 'table': job['table'], 'date': job['date'], 'rows': 0}
+            self.status['state'] = 'loading'
+            self.status['current'] = current
+            self.write_status()
+            try:
+                if job.get('error') or job['table'] is None:
+                    raise ValueError(job.get('error') or "can't tell which table this file is for")
+                print(f"Loading '{job['file']}' into '{job['table']}' (snapshot {job['date']})...")
+                rows = await loop.run_in_executor(self.writer, self._load, job, current, t0)
+                elapsed = time.monotonic() - t0
+                moved = self._move(job['path'], self.processed_dir)
+                self.status['completed'].append({
+                    'file': job['file'], 'table': job['table'], 'date': job['date'], 'rows': rows,
+                    'seconds': round(elapsed, 1), 'rows_per_sec': round(rows / elapsed) if elapsed else None,
+                    'finished_at': datetime.now().isoformat(timespec='seconds'), 'moved_to': moved,
+                })
+                totals = self.status['totals']
+                totals['files'] += 1
+                totals['rows'] += rows
+                totals['seconds'] = round(totals['seconds'] + elapsed, 1)
+                loaded_tables.add(job['table'])
+                print(f"✅ Loaded {rows} rows from '{job['file']}' in {elapsed:.1f}s.")
+            except Exception as e:
+                moved = self._move(job['path'], self.failed_dir) if os.path.exists(job['path']) else None
+                self.status['failed'].append({'file': job['file'], 'error': f"{type(e).__name__}: {e}",
+                                              'failed_at': datetime.now().isoformat(timespec='seconds'),
+                                              'moved_to': moved})
+                print(f"❌ Failed to load '{job['file']}': {e}")
+            finally:
+                self._queued.discard(job['path'])
+                self.status['current'] = None
+                self.queue.task_done()
+
+            if self.queue.empty() and loaded_tables:
+                self.status['state'] = 'post-load'
+                self.write_status()
+                await loop.run_in_executor(self.writer, self._after_batch, set(loaded_tables))
+                loaded_tables.clear()
+            self.status['state'] = 'idle' if self.queue.empty() else 'loading'
+            self.write_status()
+
+    async def run(self):
+        os.makedirs(self.drop_dir, exist_ok=True)
+        self.write_status()
+        print(f"✅ Watching '{self.drop_dir}/' for listings/pendings/solds CSVs (Ctrl-C to stop).")
+        try:
+            await asyncio.gather(self.scan(), self.load())
+        finally:
+            self.writer.shutdown(wait=True)
+
+
+def watch(db_name='altos_one.db', drop_dir=DROP_DIR, poll_seconds=POLL_SECONDS, stable_seconds=STABLE_SECONDS):
+    import load_metrics
+    # Every load shares this process, so its peak RSS doesn't describe any one of them
+    load_metrics.RECORD_PEAK_RSS = False
+    watcher = IngestWatcher(db_name, drop_dir, poll_seconds=poll_seconds, stable_seconds=stable_seconds)
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        print("Ingest watcher stopped.")
+
+
+def main():
+    watch()
+
+
+if __name__ == "__main__":
+    main()
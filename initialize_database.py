@@ -1,10 +1,16 @@
-import sqlite3
+from db import connect
+from data_versions import bump_data_version
+from spatial_index import create_spatial_index
+from property_keys import create_property_keys_table
+from week_partitions import drop_partitioned
 
 def initialize_database(db_name='altos_one.db'):
-    conn = sqlite3.connect(db_name)
+    conn = connect(db_name)
     cursor = conn.cursor()
     
-    # Drop existing tables if they exist
+    # Drop existing tables if they exist (partitions and views included)
+    drop_partitioned(conn, 'listings')
+    drop_partitioned(conn, 'pendings')
     cursor.execute("DROP TABLE IF EXISTS listings")
     cursor.execute("DROP TABLE IF EXISTS pendings")
     
@@ -30,6 +36,9 @@ def initialize_database(db_name='altos_one.db'):
         geo_lat REAL,
         geo_long REAL,
         load_date TEXT,
+        metro_key INTEGER,
+        property_key INTEGER,
+        row_hash INTEGER,
         UNIQUE(date, listing_id)
     )
     """)
@@ -62,6 +71,9 @@ def initialize_database(db_name='altos_one.db'):
         agent_office TEXT,
         days_in_contract INTEGER,
         load_date TEXT,
+        metro_key INTEGER,
+        property_key INTEGER,
+        row_hash INTEGER,
         UNIQUE(date, pending_id)
     )
     """)
@@ -73,6 +85,26 @@ def initialize_database(db_name='altos_one.db'):
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_pendings_date ON pendings (date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_pendings_pending_id ON pendings (pending_id)')
     
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_metro_key ON listings (metro_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pendings_metro_key ON pendings (metro_key)')
+    
+    # Property joins use the dense surrogate key (see property_keys.py)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_property_key ON listings (date, property_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pendings_property_key ON pendings (date, property_key)')
+    create_property_keys_table(conn)
+    
+    # Week-over-week diffs hash-join (key, row_hash) per date (see snapshot_diff.py)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_row_hash ON listings (date, listing_id, row_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pendings_row_hash ON pendings (date, pending_id, row_hash)')
+    
+    # R*Tree indexes on geo_lat/geo_long, maintained by triggers at insert time
+    create_spatial_index(conn, 'listings')
+    create_spatial_index(conn, 'pendings')
+    
+    # Every cached report over the old tables is stale now
+    bump_data_version(conn, 'listings')
+    bump_data_version(conn, 'pendings')
+    
     conn.commit()
     conn.close()
     print("✅ Database initialized with composite UNIQUE constraints on (date, listing_id) and (date, pending_id).")
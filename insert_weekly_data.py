@@ -1,25 +1,76 @@
 import sqlite3
 import pandas as pd
 from datetime import datetime
+from typing import Callable, Optional
+from db import connect
+from data_versions import bump_data_version
+from solds_rollup import refresh_rollup
+from solds_cohorts import ensure_day_columns, refresh_cohorts
+from snapshot import publish_snapshot
+from normalize import ensure_metro_key_column, normalize_chunk, read_dtypes, sql_rows, zip_metro_keys
+from property_keys import add_property_keys, ensure_property_key_column
+from week_partitions import split_by_partition
+from column_stats import missing_stats, save_stats, stored_row_counts, update_stats
+from load_metrics import track_run
+from snapshot_diff import HASH_TABLES, add_row_hashes, column_types, ensure_row_hash_column, report_latest_changes
 
-def insert_csv_to_table(csv_file: str, table_name: str, db_name: str = 'altos_one.db', chunksize: int = 10000) -> None:
+def insert_csv_to_table(csv_file: str, table_name: str, db_name: str = 'altos_one.db', chunksize: int = 10000,
+                        progress: Optional[Callable[[int], None]] = None) -> int:
     """
     Insert CSV data into the specified SQLite table. If primary key conflicts occur,
-    replaces existing rows. Adds a 'load_date' column to each row.
+    replaces existing rows. Adds a 'load_date' column to each row, normalizes
+    zip/FIPS codes and IDs, and assigns each row its integer metro_key.
+    If given, progress(rows_so_far) is called after every committed chunk.
+    Stage timings and throughput are recorded in run_metrics (load_metrics.py).
+    Returns the number of rows processed.
     """
-    conn = sqlite3.connect(db_name)
+    with track_run('load', table_name, db_name) as metrics:
+        metrics.rows = _insert_csv(csv_file, table_name, db_name, chunksize, progress, metrics)
+    return metrics.rows
+
+
+def _insert_csv(csv_file, table_name, db_name, chunksize, progress, metrics):
+    conn = connect(db_name)
     cursor = conn.cursor()
     today = datetime.today().strftime('%Y-%m-%d')
     inserted_total = 0
+    stats = {}
+
+    with metrics.stage('index'):
+        if ensure_metro_key_column(conn, table_name):
+            print(f"Added 'metro_key' to '{table_name}' and assigned it to existing rows.")
+        if ensure_property_key_column(conn, table_name):
+            print(f"Added 'property_key' to '{table_name}' and assigned it to existing rows.")
+        if table_name == 'solds' and ensure_day_columns(conn):
+            print("Added the solds day-number columns and filled them for existing rows.")
+        hash_types = None
+        if table_name in HASH_TABLES:
+            if ensure_row_hash_column(conn, table_name):
+                print(f"Existing '{table_name}' rows have no current row_hash; run snapshot_diff.py once to backfill them.")
+            hash_types = column_types(conn, table_name)
+        if missing_stats(conn, table_name):
+            print(f"Existing '{table_name}' dates have no column stats; run column_stats.py once to backfill them.")
+        # zip -> metro_key lookup, loaded once per file
+        zip_keys = zip_metro_keys(conn)
 
-    # Read in chunks to handle large files
-    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
-        # Handle column name changes for solds table
-        if table_name == 'solds':
-            if 'listed_price' in chunk.columns:
-                chunk = chunk.rename(columns={'listed_price': 'list_price_initial'})
-            if 'pending_price' in chunk.columns:
-                chunk = chunk.rename(columns={'pending_price': 'list_price_final'})
+    # Read in chunks to handle large files (IDs and codes as text, see normalize.py)
+    for chunk in metrics.timed(pd.read_csv(csv_file, chunksize=chunksize, dtype=read_dtypes()), 'parse'):
+        with metrics.stage('normalize'):
+            # Handle column name changes for solds table
+            if table_name == 'solds':
+                if 'listed_price' in chunk.columns:
+                    chunk = chunk.rename(columns={'listed_price': 'list_price_initial'})
+                if 'pending_price' in chunk.columns:
+                    chunk = chunk.rename(columns={'pending_price': 'list_price_final'})
+
+            # Zero-pad zip/FIPS, restore 64-bit IDs and add metro_key
+            chunk = normalize_chunk(chunk, zip_keys)
+        with metrics.stage('keys'):
+            # Dense surrogate key for property_id (property_keys table)
+            chunk = add_property_keys(conn, chunk)
+            if hash_types:
+                # Content hash for week-over-week diffs (snapshot_diff.py)
+                chunk = add_row_hashes(chunk, hash_types)
 
         # Add the load_date column (each table has a load_date column)
         chunk['load_date'] = today
@@ -28,21 +79,40 @@ def insert_csv_to_table(csv_file: str, table_name: str, db_name: str = 'altos_on
         cols = chunk.columns.tolist()
         placeholders = ",".join(["?" for _ in cols])
         col_names = ",".join(cols)
-        insert_sql = f"INSERT OR REPLACE INTO {table_name} ({col_names}) VALUES ({placeholders})"
-
-        # Convert DataFrame rows to list of tuples for executemany
-        data_tuples = [tuple(x) for x in chunk[cols].values]
 
         try:
-            cursor.executemany(insert_sql, data_tuples)
-            conn.commit()
-            inserted_total += len(data_tuples)
-            print(f"Inserted/Replaced {len(data_tuples)} rows into '{table_name}' from current chunk.")
+            with metrics.stage('write'):
+                # One target per snapshot date when the table is partitioned (week_partitions.py)
+                rows = 0
+                for target, part in split_by_partition(conn, table_name, chunk):
+                    insert_sql = f"INSERT OR REPLACE INTO {target} ({col_names}) VALUES ({placeholders})"
+                    # Convert DataFrame rows to list of tuples for executemany
+                    data_tuples = sql_rows(part[cols])
+                    cursor.executemany(insert_sql, data_tuples)
+                    rows += len(data_tuples)
+                # Invalidate cached reports that read these snapshot dates, in the
+                # same transaction as the rows, so no committed chunk goes unversioned
+                chunk_dates = chunk['date'].dropna().astype(str).unique() if 'date' in chunk.columns else []
+                bump_data_version(conn, table_name, chunk_dates)
+                conn.commit()
+            inserted_total += rows
+            with metrics.stage('stats'):
+                # Per-column stats for profile_tables.py (column_stats.py)
+                update_stats(stats, chunk)
+            print(f"Inserted/Replaced {rows} rows into '{table_name}' from current chunk.")
+            if progress:
+                progress(inserted_total)
         except sqlite3.IntegrityError as e:
+            conn.rollback()
             print(f"IntegrityError encountered: {e}. Continuing with next chunk.")
 
+    with metrics.stage('stats'):
+        save_stats(conn, table_name, stats, stored_row_counts(conn, table_name, {d for d, _ in stats}))
+        conn.commit()
+
     conn.close()
     print(f"Finished inserting into '{table_name}'. Total rows processed: {inserted_total}")
+    return inserted_total
 
 
 def main() -> None:
@@ -53,24 +123,43 @@ def main() -> None:
     listings_csv = input("Enter the listings CSV filename (or press Enter to skip): ").strip()
     pendings_csv = input("Enter the pendings CSV filename (or press Enter to skip): ").strip()
     solds_csv = input("Enter the solds CSV filename (or press Enter to skip): ").strip()
-    
-    if listings_csv:
-        print("Importing listings...")
-        insert_csv_to_table(listings_csv, 'listings')
-    else:
-        print("Skipping listings import.")
-    
-    if pendings_csv:
-        print("Importing pendings...")
-        insert_csv_to_table(pendings_csv, 'pendings')
-    else:
-        print("Skipping pendings import.")
-    
-    if solds_csv:
-        print("Importing solds...")
-        insert_csv_to_table(solds_csv, 'solds')
-    else:
-        print("Skipping solds import.")
+
+    # The whole weekly load is one run too, timed per file and post-load step
+    with track_run('load', 'weekly') as metrics:
+        if listings_csv:
+            print("Importing listings...")
+            with metrics.stage('listings'):
+                metrics.rows += insert_csv_to_table(listings_csv, 'listings')
+            with metrics.stage('diff'):
+                report_latest_changes('listings')
+        else:
+            print("Skipping listings import.")
+
+        if pendings_csv:
+            print("Importing pendings...")
+            with metrics.stage('pendings'):
+                metrics.rows += insert_csv_to_table(pendings_csv, 'pendings')
+            with metrics.stage('diff'):
+                report_latest_changes('pendings')
+        else:
+            print("Skipping pendings import.")
+
+        if solds_csv:
+            print("Importing solds...")
+            with metrics.stage('solds'):
+                metrics.rows += insert_csv_to_table(solds_csv, 'solds')
+            with metrics.stage('rollups'):
+                # Fold the new week into the persisted solds summary accumulators
+                refresh_rollup()
+                # ... and into the days-on-market cohort histograms
+                refresh_cohorts()
+        else:
+            print("Skipping solds import.")
+
+        if listings_csv or pendings_csv or solds_csv:
+            with metrics.stage('snapshot'):
+                # Point the reports at a consistent copy that includes this week
+                publish_snapshot()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Windows: no peak-memory figure.
+    resource = None
+
+from db import connect_read_only
+
+# Per-run timings for loads and reports.
+#
+# A RunMetrics records wall time per stage (parse, normalize, write, ... for a
+# load; the whole command for a report), rows and rows/sec, the process's
+# peak RSS and the database's file and page counts. finish() appends a row to
+# run_metrics and rewrites a Prometheus text file (for node_exporter's
+# textfile collector) with the latest run of each kind/name, so load-time
+# regressions can be alerted on.
+#
+# run_metrics lives in its own file (altos_one_metrics.db next to the
+# database), so recording a report run never touches the live database and
+# never makes the published snapshot stale.
+
+PROM_FILE = 'altos_metrics.prom'
+
+# ru_maxrss is the peak over the whole process lifetime, so it only describes a
+# run when the process does one thing. Long-lived processes (the altos.py
+# worker, the ingest watcher) set this to False and their runs record no peak.
+RECORD_PEAK_RSS = True
+
+
+def metrics_db_path(db_name='altos_one.db'):
+    return os.path.splitext(db_name)[0] + '_metrics.db'
+
+
+def create_run_metrics_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS run_metrics (
+        run_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        status TEXT NOT NULL,
+        seconds REAL,
+        rows INTEGER,
+        rows_per_sec REAL,
+        peak_rss_bytes INTEGER,
+        db_bytes INTEGER,
+        wal_bytes INTEGER,
+        page_size INTEGER,
+        page_count INTEGER,
+        freelist_count INTEGER,
+        stages TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_run_metrics_kind_name ON run_metrics (kind, name, run_id)")
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def database_size(db_name='altos_one.db'):
+    """File sizes and page counts of the live database (a read-only connection, no table reads)."""
+    if not os.path.exists(db_name):
+        return {}
+    wal = db_name + '-wal'
+    size = {'db_bytes': os.path.getsize(db_name), 'wal_bytes': os.path.getsize(wal) if os.path.exists(wal) else 0}
+    conn = connect_read_only(db_name)
+    try:
+        for pragma in ('page_size', 'page_count', 'freelist_count'):
+            size[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+    finally:
+        conn.close()
+    return size
+
+
+class RunMetrics:
+    """Stage timings and counters for one load or report run."""
+
+    def __init__(self, kind, name, db_name='altos_one.db', prom_file=PROM_FILE):
+        self.kind = kind
+        self.name = name
+        self.db_name = db_name
+        self.prom_file = prom_file
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.t0 = time.perf_counter()
+        self.stages = {}
+        self.rows = 0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage):
+        """Time a block; repeated blocks with the same name add up (e.g. one per chunk)."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t)
+
+    def timed(self, iterable, stage):
+        """Iterate, charging the time spent producing each item (e.g. CSV parsing) to `stage`."""
+        iterator = iter(iterable)
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - t)
+                return
+            self.add(stage, time.perf_counter() - t)
+            yield item
+
+    def finish(self, status='ok'):
+        """Record the run in run_metrics and refresh the Prometheus file. Returns the recorded row."""
+        seconds = time.perf_counter() - self.t0
+        row = {
+            'kind': self.kind, 'name': self.name, 'started_at': self.started_at, 'status': status,
+            'seconds': round(seconds, 3), 'rows': self.rows,
+            'rows_per_sec': round(self.rows / seconds, 1) if self.rows and seconds else None,
+            'peak_rss_bytes': peak_rss_bytes() if RECORD_PEAK_RSS else None,
+            'stages': json.dumps({k: round(v, 3) for k, v in self.stages.items()}),
+        }
+        row.update(database_size(self.db_name))
+        conn = sqlite3.connect(metrics_db_path(self.db_name))
+        try:
+            create_run_metrics_table(conn)
+            cols = list(row)
+            conn.execute(f"INSERT INTO run_metrics ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})",
+                         [row[c] for c in cols])
+            conn.commit()
+            write_prometheus(conn, self.prom_file)
+        finally:
+            conn.close()
+        return row
+
+
+@contextmanager
+def track_run(kind, name, db_name='altos_one.db'):
+    """`with track_run('load', 'listings', db) as m:` -- records the run as 'failed' if the block raises."""
+    metrics = RunMetrics(kind, name, db_name)
+    try:
+        yield metrics
+    except BaseException:
+        _finish_quietly(metrics, 'failed')
+        raise
+    _finish_quietly(metrics, 'ok')
+
+
+def _finish_quietly(metrics, status):
+    # Metrics must never fail the load or report they describe
+    try:
+        metrics.finish(status)
+    except Exception as e:
+        print(f"❌ Could not record run metrics: {e}")
+
+
+# --- Prometheus text format ------------------------------------------------------
+
+GAUGES = [
+    ('altos_run_duration_seconds', 'seconds', "Wall time of the latest run."),
+    ('altos_run_rows', 'rows', "Rows processed by the latest run."),
+    ('altos_run_rows_per_second', 'rows_per_sec', "Throughput of the latest run."),
+    ('altos_run_peak_rss_bytes', 'peak_rss_bytes', "Peak resident memory of the process that ran the latest run (not recorded for worker or watcher runs)."),
+]
+DB_GAUGES = [
+    ('altos_db_file_bytes', 'db_bytes', "Size of the database file."),
+    ('altos_db_wal_bytes', 'wal_bytes', "Size of the database's -wal file."),
+    ('altos_db_page_count', 'page_count', "Pages in the database."),
+    ('altos_db_freelist_count', 'freelist_count', "Free pages in the database."),
+]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(conn, prom_file=PROM_FILE):
+    """Rewrite prom_file (atomically) from the latest run of each kind/name."""
+    conn.row_factory = sqlite3.Row
+    latest = conn.execute("""
+        SELECT * FROM run_metrics WHERE run_id IN (SELECT MAX(run_id) FROM run_metrics GROUP BY kind, name)
+        ORDER BY kind, name
+    """).fetchall()
+    conn.row_factory = None
+    lines = []
+
+    def gauge(metric, help_text, samples):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for labels, value in samples:
+            if value is not None:
+                label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+
+    for metric, col, help_text in GAUGES:
+        gauge(metric, help_text, [({'kind': r['kind'], 'name': r['name']}, r[col]) for r in latest])
+    gauge('altos_run_success', "1 if the latest run finished, 0 if it failed.",
+          [({'kind': r['kind'], 'name': r['name']}, int(r['status'] == 'ok')) for r in latest])
+    gauge('altos_run_last_timestamp_seconds', "Start time of the latest run.",
+          [({'kind': r['kind'], 'name': r['name']}, int(datetime.fromisoformat(r['started_at']).timestamp()))
+           for r in latest])
+    gauge('altos_run_stage_seconds', "Wall time per stage of the latest run.",
+          [({'kind': r['kind'], 'name': r['name'], 'stage': stage}, seconds)
+           for r in latest for stage, seconds in json.loads(r['stages'] or '{}').items()])
+    if latest:
+        newest = max(latest, key=lambda r: r['run_id'])
+        for metric, col, help_text in DB_GAUGES:
+            gauge(metric, help_text, [({}, newest[col])])
+
+    tmp = prom_file + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, prom_file)
+
+
+def recent_runs(db_name='altos_one.db', kind=None, name=None, limit=20):
+    """The latest runs (newest first), for eyeballing trends."""
+    import pandas as pd
+    path = metrics_db_path(db_name)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    where, params = [], []
+    if kind:
+        where.append("kind = ?")
+        params.append(kind)
+    if name:
+        where.append("name = ?")
+        params.append(name)
+    conn = sqlite3.connect(path)
+    try:
+        return pd.read_sql_query(
+            "SELECT run_id, kind, name, started_at, status, seconds, rows, rows_per_sec, "
+            "peak_rss_bytes / 1048576.0 AS peak_rss_mb, db_bytes / 1048576.0 AS db_mb, page_count, stages "
+            f"FROM run_metrics {'WHERE ' + ' AND '.join(where) if where else ''} "
+            "ORDER BY run_id DESC LIMIT ?", conn, params=params + [limit]
+        )
+    finally:
+        conn.close()
+
+
+def main():
+    kind = input("Show runs of which kind (load, report, or Enter for all)? ").strip().lower() or None
+    runs = recent_runs(kind=kind)
+    if runs.empty:
+        print("No runs recorded yet.")
+    else:
+        print(runs.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
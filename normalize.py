@@ -0,0 +1,267 @@
+import pandas as pd
+from db import connect
+from data_versions import bump_data_version
+from archive_weeks import editable_archives
+from week_partitions import data_tables, index_name, physical_tables, rebuild_view
+
+# Vectorized clean-up applied to every chunk at ingest (insert_weekly_data),
+# plus the metros dimension and a one-time backfill for existing rows.
+#
+#  - Key columns are read as strings, so 64-bit IDs never pass through float
+#    and zips like 03811 keep their leading zero.
+#  - zip and county_fips_code are zero-padded to 5 digits ("3811" -> "03811",
+#    "33015.0" -> "33015"), so they join to zip_to_metro.
+#  - Each row gets an integer metro_key (metros.metro_key) from an in-memory
+#    zip -> metro_key dict. zip_to_metro can list a zip under several metros;
+#    metro_key is then the zip's primary metro (the lowest key), which is what
+#    clustering and the solds cohorts group by. Reports that count a row under
+#    every metro of its zip keep joining zip_to_metro on zip.
+#  - Solds date columns are also stored as integer day numbers (days since
+#    1970-01-01), so day counts are a subtraction (see solds_cohorts.py).
+
+METRO_KEY_TABLES = ['listings', 'pendings', 'solds']
+ID_COLUMNS = ['property_id', 'listing_id', 'pending_id']
+CODE_WIDTHS = {'zip': 5, 'county_fips_code': 5}
+STRING_COLUMNS = [
+    'date', 'parcel_number', 'county_fips_code', 'street_address', 'city', 'state', 'zip',
+    'county', 'type', 'agent_name', 'agent_email', 'agent_phone', 'agent_office',
+    'sold_date', 'listed_on', 'pending_on', 'load_date',
+]
+BACKFILL_CHUNK = 50000
+# Text date column -> integer day-number column
+DAY_COLUMNS = {'listed_on': 'listed_on_day', 'pending_on': 'pending_on_day', 'sold_date': 'sold_day'}
+EPOCH = pd.Timestamp('1970-01-01')
+
+
+def read_dtypes():
+    """dtype= for pd.read_csv: IDs and codes as text; numeric columns are inferred."""
+    return {c: str for c in ID_COLUMNS + STRING_COLUMNS}
+
+
+def normalize_code(values, width):
+    """Strip a trailing '.0' and zero-pad all-digit codes to `width` (ZIP+4 keeps its first 5 digits)."""
+    s = values.astype('string').str.strip()
+    s = s.str.replace(r'\.0+$', '', regex=True)
+    if width == 5:
+        s = s.str.replace(r'^(\d{5})-\d{4}$', r'\1', regex=True)
+    short = s.str.fullmatch(rf'\d{{1,{width - 1}}}').fillna(False).astype(bool)
+    s = s.mask(short, s.str.zfill(width))
+    return s.mask(s == '')
+
+
+def normalize_ids(values):
+    """Text IDs -> nullable Int64 without a float round trip."""
+    s = values.astype('string').str.strip().str.replace(r'\.0+$', '', regex=True)
+    return s.mask(s == '').astype('Int64')
+
+
+def day_numbers(values):
+    """YYYY-MM-DD[...] text -> nullable Int64 days since 1970-01-01 (unparseable -> NA)."""
+    dates = pd.to_datetime(values.astype('string').str.slice(0, 10), format='%Y-%m-%d', errors='coerce')
+    return ((dates - EPOCH) // pd.Timedelta(days=1)).astype('Int64')
+
+
+def normalize_chunk(chunk, zip_keys=None):
+    """Normalize codes and IDs of one DataFrame chunk in place and add metro_key (and solds day numbers)."""
+    for col, width in CODE_WIDTHS.items():
+        if col in chunk.columns:
+            chunk[col] = normalize_code(chunk[col], width)
+    for col in ID_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = normalize_ids(chunk[col])
+    if zip_keys is not None and 'zip' in chunk.columns:
+        chunk['metro_key'] = chunk['zip'].map(zip_keys).astype('Int64')
+    if 'sold_date' in chunk.columns:
+        for col, day_col in DAY_COLUMNS.items():
+            if col in chunk.columns:
+                chunk[day_col] = day_numbers(chunk[col])
+    return chunk
+
+
+def sql_rows(df):
+    """DataFrame rows as tuples of plain Python values (NA/NaN -> None) for executemany."""
+    return [tuple(r) for r in df.astype(object).where(df.notna(), None).values]
+
+
+# --- metros dimension -----------------------------------------------------------
+
+def create_metros_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS metros (
+        metro_key INTEGER PRIMARY KEY,
+        metro TEXT NOT NULL UNIQUE,
+        display_name TEXT
+    )
+    """)
+
+
+def sync_metros(conn):
+    """Add new zip_to_metro metros to metros (existing keys never change) and copy display names."""
+    create_metros_table(conn)
+    conn.execute("INSERT OR IGNORE INTO metros (metro) SELECT DISTINCT metro FROM zip_to_metro")
+    zcols = [r[1] for r in conn.execute("PRAGMA table_info(zip_to_metro)")]
+    if 'display_name' in zcols:
+        conn.execute("""
+            UPDATE metros SET display_name = (
+                SELECT MAX(NULLIF(z.display_name, '')) FROM zip_to_metro z WHERE z.metro = metros.metro
+            )
+        """)
+
+
+def zip_metro_keys(conn):
+    """{zipcode: metro_key}; a zip listed under several metros gets the lowest key."""
+    try:
+        rows = conn.execute("""
+            SELECT z.zipcode, MIN(m.metro_key)
+            FROM zip_to_metro z JOIN metros m ON m.metro = z.metro
+            GROUP BY z.zipcode
+        """).fetchall()
+    except Exception:
+        # No zip_to_metro / metros yet: every row stays unassigned.
+        return {}
+    return dict(rows)
+
+
+def metro_names(conn, display=False):
+    """{metro_key: metro} (or display_name when set, if display=True)."""
+    col = "COALESCE(NULLIF(display_name, ''), metro)" if display else "metro"
+    return dict(conn.execute(f"SELECT metro_key, {col} FROM metros"))
+
+
+def ensure_metro_key_column(conn, table, fill=True):
+    """
+    Add metro_key (and its index) to a fact table created before it existed
+    and, with fill=True, normalize and key the existing rows (commits per
+    chunk). Returns True if added.
+    """
+    physical = physical_tables(conn, table)
+    added = False
+    for name in physical:
+        cols = [r[1] for r in conn.execute(f"PRAGMA table_info({name})")]
+        if 'metro_key' not in cols:
+            conn.execute(f"ALTER TABLE {name} ADD COLUMN metro_key INTEGER")
+            added = True
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name(table, name, 'metro_key')} ON {name} (metro_key)")
+    if added and physical != [table]:
+        rebuild_view(conn, table)
+    if added and fill:
+        normalize_zip_to_metro(conn)
+        conn.commit()
+        zip_keys = zip_metro_keys(conn)
+        for name in data_tables(conn, table):
+            _backfill_table(conn, 'main', name, zip_keys)
+        bump_data_version(conn, table)
+    return added
+
+
+def assign_metro_keys(conn, tables=METRO_KEY_TABLES):
+    """Re-derive metro_key for every row from the current zip_to_metro mapping (after a mapping import)."""
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    for table in tables:
+        if table not in existing:
+            continue
+        ensure_metro_key_column(conn, table, fill=False)
+        for name in data_tables(conn, table):
+            conn.execute(f"""
+                UPDATE {name} SET metro_key = (
+                    SELECT MIN(m.metro_key) FROM zip_to_metro z JOIN metros m ON m.metro = z.metro
+                    WHERE z.zipcode = {name}.zip
+                )
+            """)
+        bump_data_version(conn, table)
+
+
+# --- backfill -------------------------------------------------------------------
+
+def _backfill_table(conn, schema, table, zip_keys):
+    """Normalize zip/county_fips_code and set metro_key on existing rows, a rowid range at a time."""
+    changed = 0
+    last = conn.execute(f"SELECT MAX(rowid) FROM {schema}.{table}").fetchone()[0] or 0
+    for start in range(0, last + 1, BACKFILL_CHUNK):
+        df = pd.read_sql_query(
+            f"SELECT rowid AS rid, zip, county_fips_code, metro_key FROM {schema}.{table} "
+            "WHERE rowid >= ? AND rowid < ?",
+            conn, params=(start, start + BACKFILL_CHUNK), dtype={'zip': 'string', 'county_fips_code': 'string'}
+        )
+        if df.empty:
+            continue
+        new = normalize_chunk(df[['zip', 'county_fips_code']].copy(), zip_keys)
+        old_key = df['metro_key'].astype('Int64')
+        diff = (
+            new['zip'].ne(df['zip']).fillna(df['zip'].notna()) |
+            new['county_fips_code'].ne(df['county_fips_code']).fillna(df['county_fips_code'].notna()) |
+            new['metro_key'].ne(old_key).fillna(new['metro_key'].notna() | old_key.notna())
+        ).astype(bool)
+        if not diff.any():
+            continue
+        new['rid'] = df['rid']
+        conn.executemany(
+            f"UPDATE {schema}.{table} SET zip = ?, county_fips_code = ?, metro_key = ? WHERE rowid = ?",
+            sql_rows(new.loc[diff, ['zip', 'county_fips_code', 'metro_key', 'rid']])
+        )
+        conn.commit()
+        changed += int(diff.sum())
+    return changed
+
+
+def normalize_zip_to_metro(conn):
+    """Zero-pad zip_to_metro zipcodes and sync the metros dimension. The caller commits."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'zip_to_metro'").fetchone():
+        return
+    zips = pd.read_sql_query("SELECT rowid AS rid, zipcode FROM zip_to_metro", conn, dtype={'zipcode': 'string'})
+    padded = normalize_code(zips['zipcode'], 5)
+    fix = padded.ne(zips['zipcode']).fillna(False).astype(bool)
+    if fix.any():
+        conn.executemany("UPDATE zip_to_metro SET zipcode = ? WHERE rowid = ?",
+                         sql_rows(pd.DataFrame({'z': padded[fix], 'r': zips.loc[fix, 'rid']})))
+        print(f"Padded {int(fix.sum())} zipcodes in 'zip_to_metro'.")
+        bump_data_version(conn, 'zip_to_metro')
+    sync_metros(conn)
+
+
+def backfill(db_name='altos_one.db', include_archives=True):
+    """
+    One-time fix-up of data loaded before ingest normalization: pad zip_to_metro
+    zipcodes, fill metros, then normalize zip/county_fips_code and assign
+    metro_key in listings, pendings, solds and (optionally) the archive files.
+    """
+    conn = connect(db_name)
+    normalize_zip_to_metro(conn)
+    conn.commit()
+    zip_keys = zip_metro_keys(conn)
+
+    for table in METRO_KEY_TABLES:
+        ensure_metro_key_column(conn, table, fill=False)
+        conn.commit()
+        changed = sum(_backfill_table(conn, 'main', name, zip_keys) for name in data_tables(conn, table))
+        bump_data_version(conn, table)
+        conn.commit()
+        print(f"Normalized {changed} rows in '{table}'.")
+
+        if include_archives:
+            with editable_archives(table) as paths:
+                for path in paths:
+                    conn.execute("ATTACH DATABASE ? AS arch", (path,))
+                    try:
+                        if 'metro_key' not in [r[1] for r in conn.execute(f"PRAGMA arch.table_info({table})")]:
+                            conn.execute(f"ALTER TABLE arch.{table} ADD COLUMN metro_key INTEGER")
+                        conn.commit()
+                        changed = _backfill_table(conn, 'arch', table, zip_keys)
+                        print(f"Normalized {changed} rows in '{path}'.")
+                    finally:
+                        conn.execute("DETACH DATABASE arch")
+
+    conn.close()
+    print("✅ zip/FIPS normalization and metro_key backfill complete.")
+
+
+def main():
+    confirm = input("Normalize zip/FIPS codes and assign metro_key on all existing rows? (y/n): ").strip().lower()
+    if confirm == 'y':
+        backfill()
+    else:
+        print("Backfill canceled.")
+
+
+if __name__ == "__main__":
+    main()
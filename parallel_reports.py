@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from db import open_reader, reader
+
+# Partitioned report execution: metro/state level reports are independent per
+# partition, so each partition is computed in its own worker process with its
+# own read-only SQLite connection and the results are returned in sorted
+# partition order, making the concatenated output deterministic.
+
+UNKNOWN_METRO = 'UNKNOWN'
+
+_worker_conn = None
+
+
+def _init_worker(db_name, archives=False):
+    global _worker_conn
+    _worker_conn = open_reader(db_name)
+    if archives:
+        from archive_weeks import attach_archives
+        attach_archives(_worker_conn)
+
+
+def _run_partition(task, key, args):
+    return task(_worker_conn, key, *args)
+
+
+def _sort_key(key):
+    # None sorts first, everything else by its string form.
+    return (key is not None, str(key))
+
+
+def run_partitioned(task, keys, db_name='altos_one.db', args=(), max_workers=None, archives=False):
+    """
+    Call task(conn, key, *args) once per partition key and return the results
+    as a list of (key, result) pairs ordered by key.
+
+    `task` must be a module-level function so it can be sent to the worker
+    processes. max_workers defaults to the number of CPUs; max_workers=1 runs
+    the partitions serially in this process. archives=True gives every
+    connection the archived weeks too (archive_weeks.attach_archives).
+    """
+    keys = sorted(set(keys), key=_sort_key)
+    max_workers = max_workers or os.cpu_count() or 1
+    if archives:
+        # Decompress changed cold months here once, not in every worker
+        from archive_weeks import thaw_archives
+        thaw_archives()
+
+    if max_workers == 1 or len(keys) <= 1:
+        with reader(db_name) as conn:
+            if archives:
+                from archive_weeks import attach_archives
+                attach_archives(conn)
+            return [(key, task(conn, key, *args)) for key in keys]
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(keys)),
+                             initializer=_init_worker, initargs=(db_name, archives)) as pool:
+        futures = [pool.submit(_run_partition, task, key, args) for key in keys]
+        # Collect in submission order, not completion order.
+        return [(key, future.result()) for key, future in zip(keys, futures)]
+
+
+def list_metros(conn, include_unknown=True):
+    """Distinct metros in zip_to_metro, plus UNKNOWN for unmapped zips."""
+    metros = [r[0] for r in conn.execute("SELECT DISTINCT metro FROM zip_to_metro")]
+    if include_unknown:
+        metros.append(UNKNOWN_METRO)
+    return metros
+
+
+def list_metro_keys(conn, include_unknown=True):
+    """metro_key of every metro (normalize.py's metros), plus None for rows whose zip has no metro."""
+    keys = [r[0] for r in conn.execute("SELECT metro_key FROM metros")]
+    if include_unknown:
+        keys.append(None)
+    return keys
+
+
+def list_market_names(conn, include_unknown=True):
+    """
+    Distinct report market names (display_name if set, otherwise metro). Reports
+    that group by market_name partition on this so no group spans two workers.
+    """
+    markets = [r[0] for r in conn.execute(
+        "SELECT DISTINCT COALESCE(NULLIF(display_name, ''), metro) FROM zip_to_metro"
+    )]
+    if include_unknown:
+        markets.append(UNKNOWN_METRO)
+    return markets
+
+
+def list_states(conn, table, date=None):
+    """Distinct states present in table (optionally for one snapshot date)."""
+    if date is None:
+        rows = conn.execute(f"SELECT DISTINCT state FROM {table}")
+    else:
+        rows = conn.execute(f"SELECT DISTINCT state FROM {table} WHERE date = ?", (date,))
+    return [r[0] for r in rows]
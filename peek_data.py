@@ -1,22 +1,19 @@
-import sqlite3
-import pandas as pd
+from db import reader
+from profile_tables import PROFILE_TABLES, existing_tables, sample_rows
 
 def export_sample_to_csv(table_name, db_name='altos_one.db', sample_size=5):
-    # Connect to database
-    conn = sqlite3.connect(db_name)
-    
-    # Read sample data
-    df_sample = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {sample_size}", conn)
+    # Read sample rows spread across the table (every week, not just the oldest)
+    with reader(db_name) as conn:
+        df_sample = sample_rows(conn, table_name, sample_size)
     
     # Save to CSV
     output_file = f"{table_name}_sample.csv"
     df_sample.to_csv(output_file, index=False)
     print(f"Sample data from '{table_name}' written to '{output_file}'.")
-    
-    conn.close()
 
 def main():
-    tables = ['listings', 'pendings']
+    with reader() as conn:
+        tables = existing_tables(conn, PROFILE_TABLES)
     
     for table in tables:
         export_sample_to_csv(table)
@@ -0,0 +1,160 @@
+import random
+import pandas as pd
+from db import connect, reader
+from column_stats import table_stats
+from week_partitions import data_tables
+
+# Constant-time table profiles.
+#
+# Nothing here scans a table:
+#  - Row counts, null rates, min/max and distinct estimates come from the
+#    ingest-time column_stats rows (column_stats.py); the row counts are exact.
+#  - sqlite_stat1 (written by ANALYZE; snapshot.py runs it on every published
+#    snapshot) only supplies index selectivity: the planner's average rows per
+#    value of each index's first column. Its row counts are estimates (a
+#    bounded ANALYZE extrapolates them), so they are never shown as counts.
+#  - The sample is SAMPLE_ROWS rows picked by rowid probes spread evenly from
+#    MIN(rowid) to MAX(rowid) (one index seek each), so it covers every week
+#    instead of the oldest one. Partitioned tables get probes in every partition.
+# Columns with no stored stats (e.g. zip_to_metro) are described from the
+# sample; a table with none has no row count.
+
+PROFILE_TABLES = ['listings', 'pendings', 'solds', 'zip_to_metro']
+SAMPLE_ROWS = 200
+ANALYSIS_LIMIT = 1000     # rows per index examined by a bounded ANALYZE
+PROBES_PER_QUERY = 250    # stays under SQLite's 500-term compound SELECT limit
+
+
+def existing_tables(conn, tables=PROFILE_TABLES):
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    return [t for t in tables if t in names]
+
+
+def sample_rows(conn, table, sample_size=SAMPLE_ROWS, seed=None):
+    """
+    About sample_size rows of table spread evenly over its rowid range (or each
+    partition's). With a seed, each probe lands at a random point in its slice.
+    """
+    rng = random.Random(seed) if seed is not None else None
+    physical = data_tables(conn, table)
+    if len(physical) > sample_size:
+        # More partitions than rows wanted: one row from each of an evenly spaced subset
+        physical = [physical[int((i + 0.5) * len(physical) / sample_size)] for i in range(sample_size)]
+    frames = []
+    for i, name in enumerate(physical):
+        per_table = sample_size // len(physical) + (1 if i < sample_size % len(physical) else 0)
+        lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {name}").fetchone()
+        if lo is None:
+            continue
+        step = (hi - lo + 1) / per_table
+        probes = sorted({int(lo + step * (i + (rng.random() if rng else 0.5))) for i in range(per_table)})
+        parts = []
+        for start in range(0, len(probes), PROBES_PER_QUERY):
+            batch = probes[start:start + PROBES_PER_QUERY]
+            query = " UNION ".join(
+                f"SELECT * FROM (SELECT rowid AS _rid, * FROM {name} WHERE rowid >= ? ORDER BY rowid LIMIT 1)"
+                for _ in batch
+            )
+            parts.append(pd.read_sql_query(query, conn, params=batch))
+        # Probes that land in a gap can reach the same row
+        frames.append(pd.concat(parts).drop_duplicates('_rid').drop(columns='_rid'))
+    if not frames:
+        return pd.read_sql_query(f"SELECT * FROM {table} WHERE 0", conn)
+    return pd.concat(frames, ignore_index=True)
+
+
+def index_selectivity(conn, table):
+    """
+    {column: average rows per value} for the first column of each index, from
+    sqlite_stat1 (the largest over partitions); {} when the table hasn't been
+    analyzed.
+    """
+    selectivity = {}
+    for name in data_tables(conn, table):
+        try:
+            rows = conn.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ?", (name,)).fetchall()
+        except Exception:
+            # No sqlite_stat1: never analyzed.
+            return {}
+        for idx, stat in rows:
+            # stat = "rows avg-rows-per-first-column-value ..."
+            numbers = [int(x) for x in stat.split() if x.isdigit()]
+            if idx is None or len(numbers) < 2:
+                continue
+            first = conn.execute(f"PRAGMA index_info({idx})").fetchone()
+            if first and first[2]:
+                selectivity[first[2]] = max(selectivity.get(first[2], 0), numbers[1])
+    return selectivity
+
+
+def profile_table(conn, table, sample):
+    """
+    One row per column: type, rows, null rate, distinct estimate, min, max,
+    index rows per value, and where they came from.
+    """
+    stats = table_stats(conn, table)
+    selectivity = index_selectivity(conn, table)
+    # Every column gets a stats row per loaded row, so any one has the table's count
+    table_rows = max(s['rows'] for s in stats.values()) if stats else None
+    rows = []
+    for _, name, col_type, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        s = stats.get(name)
+        if s:
+            row_count, nulls, lo, hi, distinct = s['rows'], s['nulls'], s['min'], s['max'], s['distinct']
+            source = f"column_stats ({s['dates']} dates)"
+        elif name in sample.columns and len(sample):
+            values = sample[name]
+            row_count, nulls = len(values), int(values.isna().sum())
+            non_null = values.dropna()
+            try:
+                lo, hi = (non_null.min(), non_null.max()) if len(non_null) else (None, None)
+            except TypeError:
+                lo = hi = None
+            distinct = int(non_null.nunique())
+            source = f"sample ({len(sample)} rows)"
+        else:
+            row_count, nulls, lo, hi, distinct, source = 0, 0, None, None, None, 'none'
+        rows.append({
+            'column': name, 'type': col_type,
+            'rows': table_rows,
+            'null_rate': round(nulls / row_count, 4) if row_count else None,
+            'distinct_est': distinct, 'min': lo, 'max': hi,
+            'index_rows_per_value': selectivity.get(name), 'source': source,
+        })
+    return pd.DataFrame(rows)
+
+
+def analyze_bounded(db_name='altos_one.db', tables=PROFILE_TABLES, limit=ANALYSIS_LIMIT):
+    """Fill sqlite_stat1 on the live database with ANALYZE capped at `limit` rows per index."""
+    conn = connect(db_name)
+    conn.execute(f"PRAGMA analysis_limit = {int(limit)}")
+    for table in existing_tables(conn, tables):
+        for name in data_tables(conn, table):
+            conn.execute(f"ANALYZE {name}")
+    conn.commit()
+    conn.close()
+
+
+def profile_tables(db_name='altos_one.db', tables=PROFILE_TABLES, sample_size=SAMPLE_ROWS, seed=None, analyze=False):
+    """Write {table}_profile.csv and {table}_sample.csv for each table."""
+    if analyze:
+        analyze_bounded(db_name, tables)
+    with reader(db_name) as conn:
+        for table in existing_tables(conn, tables):
+            sample = sample_rows(conn, table, sample_size, seed)
+            profile = profile_table(conn, table, sample)
+            profile.to_csv(f"{table}_profile.csv", index=False)
+            sample.to_csv(f"{table}_sample.csv", index=False)
+            rows = profile['rows'].iloc[0] if len(profile) else None
+            count = f"{rows} rows" if rows is not None and pd.notna(rows) else "no column_stats row count"
+            print(f"✅ '{table}': {count}, {len(profile)} columns -> '{table}_profile.csv', "
+                  f"{len(sample)} sampled rows -> '{table}_sample.csv'.")
+
+
+def main():
+    analyze = input("Run a bounded ANALYZE on the live database first? (y/n, default n): ").strip().lower() == 'y'
+    profile_tables(analyze=analyze)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import pandas as pd
+from db import connect
+from data_versions import bump_data_version
+from archive_weeks import editable_archives
+from week_partitions import data_tables, index_name, physical_tables, rebuild_view
+
+# Dense surrogate keys for property_id.
+#
+# property_id is a signed 64-bit hash, so every index entry on it takes 8+
+# bytes and the values are scattered. property_keys maps each property_id to
+# a small sequential property_key (1, 2, 3, ...; SQLite stores these in 1-4
+# bytes), assigned at ingest. The fact tables carry property_key next to
+# property_id, their property indexes are built on property_key, and the
+# property joins (find_withdrawals, find_common_properties) use it.
+
+KEY_TABLES = ['listings', 'pendings', 'solds']
+# The property index each fact table gets on the surrogate key
+KEY_INDEXES = {
+    'listings': '(date, property_key)',
+    'pendings': '(date, property_key)',
+    'solds': '(property_key)',
+}
+
+
+def create_property_keys_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS property_keys (
+        property_key INTEGER PRIMARY KEY,
+        property_id INTEGER NOT NULL UNIQUE
+    )
+    """)
+
+
+def ensure_property_key_column(conn, table, schema='main', fill=True):
+    """
+    Add property_key (and its index) to a fact table created before it existed
+    and, with fill=True, key the existing rows (the caller commits). Returns
+    True if added.
+    """
+    physical = physical_tables(conn, table, schema)
+    added = False
+    for name in physical:
+        cols = [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({name})")]
+        if 'property_key' not in cols:
+            conn.execute(f"ALTER TABLE {schema}.{name} ADD COLUMN property_key INTEGER")
+            added = True
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{index_name(table, name, 'property_key')} "
+                     f"ON {name} {KEY_INDEXES[table]}")
+    if added and physical != [table]:
+        rebuild_view(conn, table)
+    if added and fill:
+        _fill_keys(conn, schema, table)
+        bump_data_version(conn, table)
+    return added
+
+
+def assign_property_keys(conn, property_ids):
+    """{property_id: property_key} for the given IDs, adding keys for new ones. The caller commits."""
+    create_property_keys_table(conn)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS chunk_property_ids (property_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.chunk_property_ids")
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.chunk_property_ids VALUES (?)",
+        [(int(i),) for i in pd.unique(property_ids.dropna())]
+    )
+    conn.execute("INSERT OR IGNORE INTO property_keys (property_id) SELECT property_id FROM temp.chunk_property_ids")
+    return dict(conn.execute("""
+        SELECT k.property_id, k.property_key
+        FROM property_keys k JOIN temp.chunk_property_ids c ON c.property_id = k.property_id
+    """))
+
+
+def add_property_keys(conn, chunk):
+    """Add the property_key column to an ingest chunk (property_id must already be Int64)."""
+    if 'property_id' in chunk.columns:
+        keys = assign_property_keys(conn, chunk['property_id'])
+        chunk['property_key'] = chunk['property_id'].map(keys).astype('Int64')
+    return chunk
+
+
+def _fill_keys(conn, schema, table):
+    """Assign property_key to rows that have a property_id but no key yet. Returns rows updated."""
+    create_property_keys_table(conn)
+    updated = 0
+    names = data_tables(conn, table) if schema == 'main' else [table]
+    for name in names:
+        conn.execute(f"""
+            INSERT OR IGNORE INTO main.property_keys (property_id)
+            SELECT property_id FROM {schema}.{name} WHERE property_id IS NOT NULL ORDER BY rowid
+        """)
+        cursor = conn.execute(f"""
+            UPDATE {schema}.{name} SET property_key = (
+                SELECT k.property_key FROM main.property_keys k WHERE k.property_id = {name}.property_id
+            )
+            WHERE property_key IS NULL AND property_id IS NOT NULL
+        """)
+        updated += cursor.rowcount
+    return updated
+
+
+def _backfill_table(conn, schema, table):
+    ensure_property_key_column(conn, table, schema, fill=False)
+    updated = _fill_keys(conn, schema, table)
+    conn.commit()
+    return updated
+
+
+def backfill(db_name='altos_one.db', include_archives=True):
+    """
+    One-time fill of property_keys and the property_key column for rows loaded
+    before surrogate keys existed (optionally including the archive files), and
+    replace the 64-bit solds property_id index with the surrogate one.
+    """
+    conn = connect(db_name)
+    create_property_keys_table(conn)
+    for table in KEY_TABLES:
+        updated = _backfill_table(conn, 'main', table)
+        bump_data_version(conn, table)
+        conn.commit()
+        print(f"Assigned property_key to {updated} rows in '{table}'.")
+
+        if include_archives and table in ('listings', 'pendings'):
+            with editable_archives(table) as paths:
+                for path in paths:
+                    conn.execute("ATTACH DATABASE ? AS arch", (path,))
+                    try:
+                        updated = _backfill_table(conn, 'arch', table)
+                        print(f"Assigned property_key to {updated} rows in '{path}'.")
+                    finally:
+                        conn.execute("DETACH DATABASE arch")
+
+    conn.execute("DROP INDEX IF EXISTS idx_solds_property_id")
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM property_keys").fetchone()[0]
+    conn.close()
+    print(f"✅ property_keys holds {total} properties.")
+
+
+def main():
+    confirm = input("Assign property_key to all existing rows? (y/n): ").strip().lower()
+    if confirm == 'y':
+        backfill()
+    else:
+        print("Backfill canceled.")
+
+
+if __name__ == "__main__":
+    main()
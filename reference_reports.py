@@ -0,0 +1,493 @@
+import sqlite3
+import pandas as pd
+from datetime import datetime, timedelta
+
+# The original, unoptimized implementations of the reports, kept as the
+# golden reference for compare_report_outputs.py. They read the tables with a
+# plain sqlite3 connection and do the work in pandas, exactly as the scripts
+# did before the performance work (prompts replaced by arguments, CSV writes
+# by return values). Don't optimize anything here: a faster path proves
+# itself by matching these outputs.
+#
+# null_safe=True fixes the two NULL property_id bugs the rewrites fixed on
+# purpose, and nothing else: one NULL property_id in the target week made the
+# withdrawals NOT IN drop every row, and the pandas merges matched NULL
+# property_ids in listings/pendings to every solds row with a NULL one.
+#
+# IDs are the one other change: wherever a column of IDs can hold NULLs the
+# queries read them as text into Int64 (exact_ids), where the originals let
+# pandas read them as float64 and round 64-bit IDs. The golden outputs then
+# carry exact IDs; NULLs still merge and group the way they did.
+#
+# The original schema and loader are at the bottom, so the harness can build
+# a database the way the scripts did and then upgrade it. The originals'
+# SELECT l.* / s.* meant that schema's columns, so the queries here name them
+# (baseline_columns): the tables have gained internal columns since.
+
+
+def exact_ids(df, cols):
+    """ID columns selected with CAST(... AS TEXT) -> Int64 (no float round trip)."""
+    for col in cols:
+        df[col] = df[col].astype('string').astype('Int64')
+    return df
+
+
+# --- find_withdrawals.py -------------------------------------------------------
+
+def find_withdrawn_listings(conn, target_week_str, filter_clause="", null_safe=False):
+    target_week = datetime.strptime(target_week_str, '%Y-%m-%d')
+    week_prior_str = (target_week - timedelta(days=7)).strftime('%Y-%m-%d')
+
+    not_null = "AND property_id IS NOT NULL" if null_safe else ""
+    query = f"""
+    WITH target_props AS (
+        SELECT property_id FROM listings WHERE date = ? {filter_clause} {not_null}
+        UNION
+        SELECT property_id FROM pendings WHERE date = ? {filter_clause} {not_null}
+    )
+    SELECT {", ".join(f"l.{c}" for c in baseline_columns('listings'))}
+    FROM listings l
+    WHERE l.date = ? {filter_clause}
+      AND l.property_id NOT IN (SELECT property_id FROM target_props)
+    """
+    df = pd.read_sql_query(query, conn, params=(target_week_str, target_week_str, week_prior_str))
+    return df, week_prior_str
+
+
+def compute_state_counts(conn, week_prior_str, filter_clause=""):
+    query = f"""
+    SELECT state, COUNT(*) AS prior_week_listings
+    FROM listings
+    WHERE date = ? {filter_clause}
+    GROUP BY state
+    """
+    return pd.read_sql_query(query, conn, params=(week_prior_str,))
+
+
+def compute_metro_counts(conn, week_prior_str, filter_clause=""):
+    query = f"""
+    SELECT z.metro, COUNT(*) AS prior_week_listings
+    FROM listings l
+    LEFT JOIN zip_to_metro z ON l.zip = z.zipcode
+    WHERE l.date = ? {filter_clause}
+    GROUP BY z.metro
+    """
+    df = pd.read_sql_query(query, conn, params=(week_prior_str,))
+    df['metro'] = df['metro'].fillna('UNKNOWN')
+    return df
+
+
+def compute_withdrawal_statistics(withdrawals_df, counts_df, group_col):
+    withdrawn_counts = withdrawals_df.groupby(group_col).size().reset_index(name='withdrawn_count')
+    stats = pd.merge(counts_df, withdrawn_counts, on=group_col, how='left')
+    stats['withdrawn_count'] = stats['withdrawn_count'].fillna(0)
+    stats['withdrawal_percentage'] = (
+        stats['withdrawn_count'] / stats['prior_week_listings'].replace({0: pd.NA}) * 100
+    ).round(2).fillna(0)
+    return stats
+
+
+def add_metro_column(df, conn):
+    mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
+    merged = pd.merge(df, mapping, left_on='zip', right_on='zipcode', how='left')
+    merged.drop(columns=['zipcode'], inplace=True)
+    merged['metro'] = merged['metro'].fillna('UNKNOWN')
+    return merged
+
+
+def withdrawal_history(db_path, filter_clause="", null_safe=False):
+    """run_all_history's withdrawn_history_stats.csv."""
+    conn = sqlite3.connect(db_path)
+    dates = pd.read_sql_query("SELECT DISTINCT date FROM listings ORDER BY date", conn)['date']
+    all_stats = []
+    for d in dates:
+        withdrawn_df, prior = find_withdrawn_listings(conn, d, filter_clause, null_safe)
+        state_counts = compute_state_counts(conn, prior, filter_clause)
+        stats = compute_withdrawal_statistics(withdrawn_df, state_counts, 'state')
+        stats.insert(0, 'date', d)
+        all_stats.append(stats)
+    conn.close()
+    return pd.concat(all_stats, ignore_index=True)
+
+
+def withdrawal_report(db_path, target_week, filter_clause="", market="", null_safe=False):
+    """run_detailed's three CSVs: (withdrawn listings, state stats, metro stats)."""
+    conn = sqlite3.connect(db_path)
+    withdrawn_df, prior = find_withdrawn_listings(conn, target_week, filter_clause, null_safe)
+
+    withdrawn_df = add_metro_column(withdrawn_df, conn)
+    is_top50 = market.lower() == 'top50'
+
+    if is_top50:
+        top50 = pd.read_sql_query(
+            "SELECT DISTINCT metro FROM zip_to_metro WHERE display_name IS NOT NULL", conn
+        )['metro'].tolist()
+        withdrawn_df = withdrawn_df[withdrawn_df['metro'].isin(top50)]
+    elif len(market) == 2:
+        withdrawn_df = withdrawn_df[withdrawn_df['state'].str.upper() == market.upper()]
+    elif market:
+        withdrawn_df = withdrawn_df[withdrawn_df['metro'].str.contains(market, case=False, na=False)]
+
+    state_counts = compute_state_counts(conn, prior, filter_clause)
+    if is_top50:
+        valid_states = withdrawn_df['state'].unique().tolist()
+        state_counts = state_counts[state_counts['state'].isin(valid_states)]
+    elif len(market) == 2:
+        state_counts = state_counts[state_counts['state'].str.upper() == market.upper()]
+    state_stats = compute_withdrawal_statistics(withdrawn_df, state_counts, 'state')
+
+    metro_counts = compute_metro_counts(conn, prior, filter_clause)
+    if is_top50:
+        metro_counts = metro_counts[metro_counts['metro'].isin(top50)]
+    elif market and len(market) != 2:
+        metro_counts = metro_counts[metro_counts['metro'].str.contains(market, case=False, na=False)]
+    metro_stats = compute_withdrawal_statistics(withdrawn_df, metro_counts, 'metro')
+
+    if is_top50:
+        display_map = pd.read_sql_query(
+            "SELECT DISTINCT metro, display_name FROM zip_to_metro WHERE display_name IS NOT NULL", conn
+        )
+        metro_stats = metro_stats.merge(display_map, on='metro', how='left')
+        cols = metro_stats.columns.tolist()
+        cols.insert(cols.index('metro')+1, cols.pop(cols.index('display_name')))
+        metro_stats = metro_stats[cols]
+    conn.close()
+    return withdrawn_df, state_stats, metro_stats
+
+
+# --- extract_solds_by_metro.py -------------------------------------------------
+
+def solds_by_metro(db_path, metro_filter=""):
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join("CAST(s.property_id AS TEXT) AS property_id" if c == 'property_id' else f"s.{c}"
+                        for c in baseline_columns('solds'))
+    query = f"""
+    SELECT {columns}, z.metro
+    FROM solds s
+    LEFT JOIN zip_to_metro z ON s.zip = z.zipcode
+    WHERE LOWER(z.metro) LIKE LOWER(?)
+    """
+    df = exact_ids(pd.read_sql_query(query, conn, params=(f"%{metro_filter}%",)), ['property_id'])
+    conn.close()
+
+    def calc_ratio(row):
+        try:
+            sp = float(row['sold_price'])
+            lpf = float(row['list_price_final'])
+            if pd.notnull(sp) and pd.notnull(lpf) and lpf != 0:
+                return 1 + ((sp - lpf) / lpf)
+            else:
+                return None
+        except (ValueError, TypeError):
+            return None
+
+    df['sale_to_list_price_ratio'] = df.apply(calc_ratio, axis=1)
+    return df
+
+
+# --- analyze_solds_summary.py --------------------------------------------------
+
+def load_solds(db_path='altos_one.db'):
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query("SELECT * FROM solds", conn)
+    conn.close()
+    return df
+
+
+def process_solds(df):
+    df['sold_date'] = pd.to_datetime(df['sold_date'], errors='coerce')
+    df['sold_month'] = df['sold_date'].dt.strftime('%Y-%m')
+    df['sold_price'] = pd.to_numeric(df['sold_price'], errors='coerce')
+    df['list_price_final'] = pd.to_numeric(df['list_price_final'], errors='coerce')
+    return df
+
+
+def load_zip_to_metro(db_path='altos_one.db'):
+    conn = sqlite3.connect(db_path)
+    mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
+    conn.close()
+    return mapping
+
+
+def join_metro(df, mapping):
+    merged = pd.merge(df, mapping, left_on='zip', right_on='zipcode', how='left')
+    merged.drop(columns=['zipcode'], inplace=True)
+    merged['display_name'] = merged['display_name'].fillna('')
+    merged['metro'] = merged['metro'].fillna('UNKNOWN')
+    return merged
+
+
+def calculate_ratio(df):
+    def ratio_calc(row):
+        sp = row['sold_price']
+        lpf = row['list_price_final']
+        if pd.notnull(sp) and pd.notnull(lpf) and lpf != 0:
+            r = 1 + ((sp - lpf) / lpf)
+            return r if 0.5 <= r <= 2.0 else None
+        return None
+    df['sale_to_list_ratio'] = df.apply(ratio_calc, axis=1)
+    return df
+
+
+def aggregate_summary(df, calc_ratio=False):
+    df['market_name'] = df.apply(
+        lambda r: r['display_name'] if r['display_name'] else r['metro'], axis=1
+    )
+    agg_dict = {'sold_price': ['median', 'size']}
+    if calc_ratio:
+        agg_dict['sale_to_list_ratio'] = ['mean']
+    summary = df.groupby(['sold_month', 'market_name', 'type']).agg(agg_dict)
+    summary.columns = ['_'.join(col).strip() for col in summary.columns.values]
+    summary = summary.reset_index()
+    summary.rename(columns={'sold_price_median': 'median_sold_price',
+                            'sold_price_size': 'sold_count'}, inplace=True)
+    if calc_ratio:
+        summary.rename(columns={'sale_to_list_ratio_mean': 'average_sale_to_list_ratio'}, inplace=True)
+    return summary
+
+
+def solds_summary(db_path='altos_one.db', calc_ratio=False, filter_top50=False):
+    """(sold_weeks_count.csv, solds_summary_by_date.csv) of analyze_solds_summary.py."""
+    df = process_solds(load_solds(db_path))
+    df = join_metro(df, load_zip_to_metro(db_path))
+    if filter_top50:
+        df = df[df['display_name'] != '']
+    weeks_count = df.groupby('sold_month').size().reset_index(name='sold_count')
+    if calc_ratio:
+        df = calculate_ratio(df)
+    return weeks_count, aggregate_summary(df, calc_ratio)
+
+
+# --- sold_summary_by_date.py ---------------------------------------------------
+
+def sold_summary_by_date(db_path='altos_one.db', filter_top50=False):
+    """solds_summary.csv of sold_summary_by_date.py."""
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query("SELECT * FROM solds", conn)
+    df['sold_date'] = pd.to_datetime(df['sold_date'], errors='coerce')
+    df['sold_month'] = df['sold_date'].dt.strftime('%Y-%m')
+    df['sold_price'] = pd.to_numeric(df['sold_price'], errors='coerce')
+    df['list_price_final'] = pd.to_numeric(df['list_price_final'], errors='coerce')
+
+    mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
+    conn.close()
+    df = pd.merge(df, mapping, left_on='zip', right_on='zipcode', how='left')
+    df.drop(columns=['zipcode'], inplace=True)
+    df['display_name'] = df['display_name'].fillna('')
+
+    if filter_top50:
+        df = df[df['display_name'].astype(bool)]
+
+    def calc_ratio(row):
+        sp = row['sold_price']
+        lpf = row['list_price_final']
+        if pd.notnull(sp) and pd.notnull(lpf) and lpf != 0:
+            return 1 + ((sp - lpf) / lpf)
+        return None
+    df['sale_to_list_ratio'] = df.apply(calc_ratio, axis=1)
+
+    df['market_name'] = df.apply(
+        lambda r: r['display_name'] if r['display_name'] else r['metro'], axis=1
+    )
+    return df.groupby(['sold_month', 'market_name', 'type']).agg(
+        sold_count=('sold_price', 'size'),
+        median_sold_price=('sold_price', 'median'),
+        average_sale_to_list_ratio=('sale_to_list_ratio', 'mean')
+    ).reset_index()
+
+
+# --- find_common_properties.py -------------------------------------------------
+
+def common_properties(db_path, date, single_family=False, check_solds=False, null_safe=False):
+    """common_properties_{date}.csv of find_common_properties.py (one week)."""
+    conn = sqlite3.connect(db_path)
+    filter_clause = "AND type = 'single_family'" if single_family else ""
+
+    listings_q = f"""
+        SELECT date, CAST(property_id AS TEXT) AS property_id, CAST(listing_id AS TEXT) AS listing_id,
+               county_fips_code, street_address,
+               city, state, zip, price AS listing_price
+        FROM listings
+        WHERE date = ? {filter_clause}
+    """
+    pendings_q = f"""
+        SELECT date, CAST(property_id AS TEXT) AS property_id, CAST(pending_id AS TEXT) AS pending_id,
+               county_fips_code, street_address,
+               city, state, zip, price AS pending_price,
+               days_in_contract
+        FROM pendings
+        WHERE date = ? {filter_clause}
+    """
+    df_list = exact_ids(pd.read_sql_query(listings_q, conn, params=(date,)), ['property_id', 'listing_id'])
+    df_pen = exact_ids(pd.read_sql_query(pendings_q, conn, params=(date,)), ['property_id', 'pending_id'])
+
+    df_list['in_list'] = True
+    df_pen['in_pen'] = True
+    df_union = pd.merge(
+        df_list, df_pen,
+        on=['date', 'property_id', 'county_fips_code', 'street_address', 'city', 'state', 'zip'],
+        how='outer',
+        suffixes=('_list', '_pen')
+    )
+
+    if check_solds:
+        sold_ids = exact_ids(pd.read_sql_query(
+            "SELECT DISTINCT CAST(property_id AS TEXT) AS property_id FROM solds", conn), ['property_id'])
+        if null_safe:
+            sold_ids = sold_ids.dropna()
+        df_union = df_union[df_union['property_id'].isin(sold_ids['property_id'])]
+
+    df_solds = exact_ids(pd.read_sql_query(
+        "SELECT CAST(property_id AS TEXT) AS property_id, sold_date, sold_price FROM solds", conn
+    ), ['property_id'])
+    if null_safe:
+        df_solds = df_solds.dropna(subset=['property_id'])
+    df_union = df_union.merge(df_solds, on='property_id', how='left')
+    conn.close()
+
+    output_cols = [
+        'date', 'property_id',
+        'listing_id', 'pending_id',
+        'county_fips_code', 'street_address',
+        'city', 'state', 'zip',
+        'listing_price', 'pending_price',
+        'days_in_contract',
+        'sold_date', 'sold_price'
+    ]
+    return df_union[output_cols]
+
+
+# --- analyze_listings_missing_parcel.py ----------------------------------------
+
+def missing_parcels(db_path='altos_one.db'):
+    """listings_missing_parcel_by_week_and_metro.csv of analyze_listings_missing_parcel.py."""
+    conn = sqlite3.connect(db_path)
+    listings = pd.read_sql_query("SELECT date, zip, parcel_number FROM listings", conn)
+    zip_to_metro = pd.read_sql_query("SELECT zipcode, metro FROM zip_to_metro", conn)
+    conn.close()
+
+    df = pd.merge(listings, zip_to_metro,
+                  left_on='zip', right_on='zipcode',
+                  how='left')
+    df.drop(columns=['zipcode'], inplace=True)
+    df['metro'] = df['metro'].fillna('UNKNOWN')
+
+    missing = df[
+        df['parcel_number'].isnull() |
+        (df['parcel_number'].astype(str).str.strip() == "")
+    ]
+    return (
+        missing
+        .groupby(['date', 'metro'])
+        .size()
+        .reset_index(name='missing_parcel_count')
+    )
+
+
+# --- the original schema and loader ----------------------------------------------
+# initialize_database.py, create_solds_table.py, import_zip_to_metro.py,
+# update_metro_display.py and insert_weekly_data.py as they were (prints dropped).
+
+BASELINE_TABLES = {
+    'listings': """
+        date TEXT NOT NULL, property_id INTEGER, listing_id INTEGER NOT NULL, parcel_number TEXT,
+        county_fips_code TEXT, street_address TEXT, city TEXT, state TEXT, zip TEXT, price INTEGER,
+        type TEXT, beds INTEGER, baths REAL, floor_size INTEGER, lot_size INTEGER, built_in INTEGER,
+        geo_lat REAL, geo_long REAL, load_date TEXT, UNIQUE(date, listing_id)""",
+    'pendings': """
+        date TEXT NOT NULL, property_id INTEGER, pending_id INTEGER NOT NULL, parcel_number TEXT,
+        county_fips_code TEXT, street_address TEXT, city TEXT, state TEXT, zip TEXT, price INTEGER,
+        type TEXT, beds INTEGER, baths REAL, floor_size INTEGER, lot_size INTEGER, built_in INTEGER,
+        geo_lat REAL, geo_long REAL, days_on_market INTEGER, agent_name TEXT, agent_email TEXT,
+        agent_phone TEXT, agent_office TEXT, days_in_contract INTEGER, load_date TEXT,
+        UNIQUE(date, pending_id)""",
+    'solds': """
+        date TEXT NOT NULL, property_id INTEGER, county_fips_code TEXT, parcel_number TEXT,
+        street_address TEXT, city TEXT, state TEXT, zip TEXT, county TEXT, type TEXT, beds INTEGER,
+        baths REAL, floor_size INTEGER, lot_size INTEGER, built_in INTEGER, geo_lat REAL, geo_long REAL,
+        estimated_value REAL, sold_date TEXT, sold_price INTEGER, list_price_initial INTEGER,
+        list_price_final INTEGER, listed_on TEXT, pending_on TEXT, agent_name TEXT, agent_email TEXT,
+        agent_phone TEXT, agent_office TEXT, load_date TEXT""",
+    'zip_to_metro': "metro TEXT NOT NULL, zipcode TEXT NOT NULL",
+}
+
+
+# Added after creation by the original scripts (update_metro_display)
+BASELINE_ADDED_COLUMNS = {'zip_to_metro': ['display_name']}
+
+
+def baseline_columns(table):
+    """The column names of one baseline table, in order."""
+    return ([d.split()[0] for d in BASELINE_TABLES[table].split('UNIQUE(')[0].split(',') if d.strip()]
+            + BASELINE_ADDED_COLUMNS.get(table, []))
+
+
+BASELINE_INDEXES = [
+    'idx_listings_date ON listings (date)', 'idx_listings_listing_id ON listings (listing_id)',
+    'idx_pendings_date ON pendings (date)', 'idx_pendings_pending_id ON pendings (pending_id)',
+    'idx_solds_property_id ON solds(property_id)', 'idx_solds_date ON solds(date)',
+    'idx_solds_zip ON solds(zip)', 'idx_solds_street_address ON solds(street_address)',
+    'idx_zip ON zip_to_metro (zipcode)',
+]
+
+
+def create_baseline_schema(db_path):
+    """The four tables and their indexes as the original scripts created them."""
+    conn = sqlite3.connect(db_path)
+    for table, columns in BASELINE_TABLES.items():
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"CREATE TABLE {table} ({columns})")
+    for index in BASELINE_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+    conn.commit()
+    conn.close()
+
+
+def import_zip_to_metro(csv_file, db_path):
+    # zipcode was inferred as a number, so 02101 went in as '2101'
+    df = pd.read_csv(csv_file)
+    df.rename(columns={'market_area': 'metro'}, inplace=True)
+    df['metro'] = df['metro'].astype(str).str.strip()
+    df['zipcode'] = df['zipcode'].astype(str).str.strip()
+    conn = sqlite3.connect(db_path)
+    df.to_sql('zip_to_metro', conn, if_exists='append', index=False)
+    conn.commit()
+    conn.close()
+
+
+def update_metro_display(db_path, csv_path):
+    df = pd.read_csv(csv_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("ALTER TABLE zip_to_metro ADD COLUMN display_name TEXT;")
+    except sqlite3.OperationalError:
+        pass
+    for _, row in df.iterrows():
+        conn.execute("UPDATE zip_to_metro SET display_name = ? WHERE metro LIKE ?;",
+                     (row['display name'], f"%{row['MSA name']}%"))
+    conn.commit()
+    conn.close()
+
+
+def insert_csv_to_table(csv_file, table_name, db_path, chunksize=10000):
+    # Every column inferred: short zips stay short, and a property_id column
+    # with blanks is read as float64 (64-bit IDs lose their low bits)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    today = datetime.today().strftime('%Y-%m-%d')
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        if table_name == 'solds':
+            if 'listed_price' in chunk.columns:
+                chunk = chunk.rename(columns={'listed_price': 'list_price_initial'})
+            if 'pending_price' in chunk.columns:
+                chunk = chunk.rename(columns={'pending_price': 'list_price_final'})
+        chunk['load_date'] = today
+        cols = chunk.columns.tolist()
+        insert_sql = (f"INSERT OR REPLACE INTO {table_name} ({','.join(cols)}) "
+                      f"VALUES ({','.join('?' for _ in cols)})")
+        try:
+            cursor.executemany(insert_sql, [tuple(x) for x in chunk[cols].values])
+            conn.commit()
+        except sqlite3.IntegrityError:
+            pass
+    conn.close()
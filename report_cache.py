@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import pandas as pd
+from datetime import datetime
+from db import reader
+from data_versions import data_version_token
+
+# On-disk cache for report results.
+#
+# Entries are keyed by report name, parameters and the data-version token of
+# the tables/dates the report reads (see data_versions.py). A load or delete
+# bumps those versions, so affected reports miss and recompute while every
+# other cached report keeps hitting. Results are pickled DataFrames (or tuples
+# of them) with a small SQLite index used for LRU size-based eviction.
+
+CACHE_DIR = 'report_cache'
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def _open_index(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), timeout=30)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        report TEXT NOT NULL,
+        params TEXT,
+        file TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT,
+        last_access REAL NOT NULL
+    )
+    """)
+    return conn
+
+
+def _evict(index, cache_dir, max_bytes):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    total = index.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= max_bytes:
+        return
+    for key, file, size in index.execute("SELECT key, file, size FROM entries ORDER BY last_access").fetchall():
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, file))
+        except FileNotFoundError:
+            pass
+        index.execute("DELETE FROM entries WHERE key = ?", (key,))
+        total -= size
+    index.commit()
+
+
+def cached_report(report, params, compute, db_name='altos_one.db', tables=(), dates=None,
+                  cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Return compute() for (report, params), reusing a cached result when none of
+    `tables` (restricted to `dates`, if given) has changed since it was stored.
+    """
+    with reader(db_name) as conn:
+        token = data_version_token(conn, tables, dates)
+    params_json = json.dumps(params, sort_keys=True, default=str)
+    key = hashlib.sha256(f"{report}|{params_json}|{token}".encode()).hexdigest()
+
+    index = _open_index(cache_dir)
+    try:
+        row = index.execute("SELECT file FROM entries WHERE key = ?", (key,)).fetchone()
+        if row:
+            try:
+                result = pd.read_pickle(os.path.join(cache_dir, row[0]))
+                index.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                index.commit()
+                print(f"Using cached '{report}' result.")
+                return result
+            except (FileNotFoundError, EOFError):
+                index.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+        result = compute()
+
+        file = f"{report}_{key[:24]}.pkl"
+        path = os.path.join(cache_dir, file)
+        pd.to_pickle(result, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        index.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, report, params_json, file, os.path.getsize(path),
+             datetime.now().isoformat(timespec='seconds'), time.time())
+        )
+        index.commit()
+        _evict(index, cache_dir, max_bytes)
+        return result
+    finally:
+        index.close()
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Remove every cached result."""
+    index = _open_index(cache_dir)
+    for (file,) in index.execute("SELECT file FROM entries").fetchall():
+        try:
+            os.remove(os.path.join(cache_dir, file))
+        except FileNotFoundError:
+            pass
+    index.execute("DELETE FROM entries")
+    index.commit()
+    index.close()
+
+
+if __name__ == "__main__":
+    clear_cache()
+    print(f"✅ Cleared report cache in '{CACHE_DIR}'.")
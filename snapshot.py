@@ -0,0 +1,93 @@
+import glob
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from db import connect, current_snapshot, snapshot_dir, snapshot_pointer, source_stamp
+
+# Read-only snapshots for the reports.
+#
+# publish_snapshot() writes a vacuumed, analyzed copy of the database to
+# snapshots/altos_one-<timestamp>.db and then atomically swaps the pointer
+# file (snapshots/altos_one.current.json) to it. db.reader() follows the
+# pointer and opens the copy with immutable=1 and a large mmap_size, so
+# reports take no locks on altos_one.db and never see a half-loaded week.
+#
+# The pointer records a stamp of the live database files; as soon as anything
+# is written to altos_one.db the snapshot is out of date and readers go back
+# to the live database until the next publish.
+
+KEEP_SNAPSHOTS = 2
+
+
+def _write_pointer(db_name, snapshot_name, source):
+    pointer = snapshot_pointer(db_name)
+    tmp = pointer + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'snapshot': snapshot_name, 'source': source,
+                   'published_at': datetime.now().isoformat(timespec='seconds')}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+
+def list_snapshots(db_name='altos_one.db'):
+    """Published snapshot files for db_name, oldest first."""
+    pattern = os.path.join(snapshot_dir(db_name), f"{Path(db_name).stem}-*.db")
+    return sorted(glob.glob(pattern))
+
+
+def prune_snapshots(db_name='altos_one.db', keep=KEEP_SNAPSHOTS):
+    """
+    Delete all but the newest `keep` snapshots. A reader still holding an
+    older file open keeps working; the space is freed when it closes.
+    """
+    current = current_snapshot(db_name)
+    removed = 0
+    for path in list_snapshots(db_name)[:-keep or None]:
+        if current and os.path.samefile(path, current):
+            continue
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def publish_snapshot(db_name='altos_one.db', keep=KEEP_SNAPSHOTS):
+    """Publish a vacuumed, analyzed, immutable copy of db_name and point readers at it."""
+    directory = snapshot_dir(db_name)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{Path(db_name).stem}-{datetime.now():%Y%m%d-%H%M%S-%f}.db"
+    path = os.path.join(directory, name)
+    tmp = path + '.tmp'
+
+    conn = connect(db_name)
+    try:
+        # Fold the WAL into the main file first so the stamp taken below stays
+        # valid until the next write.
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        source = source_stamp(db_name)
+        conn.execute("VACUUM INTO ?", (tmp,))
+    finally:
+        conn.close()
+
+    snap = sqlite3.connect(tmp)
+    snap.execute("PRAGMA journal_mode = DELETE")
+    snap.execute("ANALYZE")
+    snap.commit()
+    snap.close()
+    os.replace(tmp, path)
+
+    _write_pointer(db_name, name, source)
+    removed = prune_snapshots(db_name, keep)
+    size_mb = os.path.getsize(path) / 1024 ** 2
+    print(f"✅ Published snapshot '{path}' ({size_mb:.1f} MB); removed {removed} old snapshot(s).")
+    return path
+
+
+def main():
+    publish_snapshot()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+from db import connect, reader
+from archive_weeks import attach_archives, editable_archives
+from week_partitions import data_tables, index_name, physical_tables, rebuild_view, route
+
+# What changed between two weekly snapshots of listings or pendings.
+#
+# Every row gets a 64-bit row_hash of its content columns at ingest
+# (row_hashes), so the diff first hash-joins just (key, row_hash) of the two
+# dates: keys only in the new week are added, keys only in the old week are
+# removed, keys whose hash differs are changed. Full rows are read only for
+# those keys, and changed rows are compared column by column into deltas.
+#
+# The hash is over the declared columns of the table, canonicalized by
+# declared type (INTEGER as exact Int64, REAL as float64, text as strings), so
+# a value hashes the same whether it came from a CSV chunk or back out of
+# SQLite. INTEGER columns are read back as text for hashing: pandas would turn
+# them into float64 and 2**53 + 1 would hash like 2**53. Adding a new content
+# column to the table changes every row's hash once. HASH_VERSION is bumped
+# whenever the canonical form changes; stored hashes from an older version are
+# cleared on the next load (and recomputed by the backfill).
+
+HASH_TABLES = ['listings', 'pendings']
+DIFF_KEYS = {'listings': 'listing_id', 'pendings': 'pending_id'}
+# Columns that don't describe the listing itself
+NON_CONTENT = {'date', 'load_date', 'metro_key', 'property_key', 'row_hash'}
+# Covering index for the hash-join: one date's (key, row_hash) without touching the rows
+HASH_INDEXES = {'listings': '(date, listing_id, row_hash)', 'pendings': '(date, pending_id, row_hash)'}
+BACKFILL_CHUNK = 50000
+HASH_VERSION = 2         # 1: every number as float64
+
+
+def column_types(conn, table):
+    """{column: declared type} of table (its template when partitioned)."""
+    return {r[1]: r[2].upper() for r in conn.execute(f"PRAGMA table_info({physical_tables(conn, table)[0]})")}
+
+
+def hash_columns(types):
+    """SELECT list for hashing rows of a table: INTEGER content columns as exact text."""
+    return ",".join(f"CAST({c} AS TEXT) AS {c}" if 'INT' in t and c not in NON_CONTENT else c
+                    for c, t in types.items())
+
+
+def exact_integers(values):
+    """
+    An INTEGER column as (Int64 of its whole-number values, float64 of the
+    rest) with no float round trip: ints and Int64 as they are, floats that are
+    whole numbers exactly, text (CAST from SQLite) parsed digit for digit.
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.astype('Int64'), pd.Series(np.nan, index=values.index)
+    if pd.api.types.is_float_dtype(values.dtype):
+        floats = values.astype('float64')
+        whole = np.isfinite(floats) & (floats == np.floor(floats)) & (floats.abs() < 2.0 ** 63)
+        return floats.where(whole).astype('Int64'), floats.mask(whole)
+    text = values.astype('string').str.strip().str.replace(r'\.0+$', '', regex=True)
+    whole = text.str.fullmatch(r'-?\d{1,18}').fillna(False).astype(bool)
+    return text.where(whole).astype('Int64'), pd.to_numeric(text.mask(whole), errors='coerce').astype('float64')
+
+
+def row_hashes(df, types):
+    """Signed 64-bit content hash of each row of df (vectorized)."""
+    cols = sorted(c for c in types if c not in NON_CONTENT)
+    canonical = pd.DataFrame(index=df.index)
+    for col in cols:
+        values = df[col] if col in df.columns else pd.Series(pd.NA, index=df.index, dtype='object')
+        if 'INT' in types[col]:
+            canonical[col], canonical[col + ' (non-integer)'] = exact_integers(values)
+        elif 'REAL' in types[col]:
+            canonical[col] = pd.to_numeric(values, errors='coerce').astype('float64')
+        else:
+            canonical[col] = values.astype('string')
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy().view(np.int64)
+
+
+def add_row_hashes(chunk, types):
+    """Add the row_hash column to an ingest chunk (after normalization)."""
+    chunk['row_hash'] = row_hashes(chunk, types)
+    return chunk
+
+
+def _hash_version(conn, table):
+    conn.execute("CREATE TABLE IF NOT EXISTS row_hash_meta (tbl TEXT PRIMARY KEY, version INTEGER)")
+    row = conn.execute("SELECT version FROM row_hash_meta WHERE tbl = ?", (table,)).fetchone()
+    return row[0] if row else 1
+
+
+def _clear_archived_hashes(conn, table):
+    cleared = 0
+    with editable_archives(table) as paths:
+        for path in paths:
+            conn.execute("ATTACH DATABASE ? AS arch", (path,))
+            try:
+                if 'row_hash' in [r[1] for r in conn.execute(f"PRAGMA arch.table_info({table})")]:
+                    cleared += conn.execute(f"UPDATE arch.{table} SET row_hash = NULL "
+                                            "WHERE row_hash IS NOT NULL").rowcount
+                    conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE arch")
+    return cleared
+
+
+def ensure_row_hash_column(conn, table):
+    """
+    Add row_hash (and its index) to a table created before it existed, and
+    clear hashes stored by an older HASH_VERSION. Returns True if existing
+    rows now need the backfill.
+    """
+    physical = physical_tables(conn, table)
+    added = False
+    for name in physical:
+        if 'row_hash' not in [r[1] for r in conn.execute(f"PRAGMA table_info({name})")]:
+            conn.execute(f"ALTER TABLE {name} ADD COLUMN row_hash INTEGER")
+            added = True
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name(table, name, 'row_hash')} "
+                     f"ON {name} {HASH_INDEXES[table]}")
+    if added and physical != [table]:
+        rebuild_view(conn, table)
+    cleared = 0
+    if _hash_version(conn, table) != HASH_VERSION:
+        for name in data_tables(conn, table):
+            cleared += conn.execute(f"UPDATE {name} SET row_hash = NULL WHERE row_hash IS NOT NULL").rowcount
+        conn.execute("INSERT OR REPLACE INTO row_hash_meta VALUES (?, ?)", (table, HASH_VERSION))
+        conn.commit()
+        cleared += _clear_archived_hashes(conn, table)
+    return added or cleared > 0
+
+
+def _backfill_table(conn, name, types, present=None):
+    """Hash the rows of name that have no row_hash; `present` limits the columns read (archive files)."""
+    select = hash_columns({c: t for c, t in types.items() if present is None or c in present})
+    last = conn.execute(f"SELECT MAX(rowid) FROM {name}").fetchone()[0] or 0
+    updated = 0
+    for start in range(0, last + 1, BACKFILL_CHUNK):
+        df = pd.read_sql_query(f"SELECT rowid AS rid, {select} FROM {name} WHERE rowid >= ? "
+                               "AND rowid < ? AND row_hash IS NULL", conn, params=(start, start + BACKFILL_CHUNK))
+        if df.empty:
+            continue
+        hashes = row_hashes(df, types)
+        conn.executemany(f"UPDATE {name} SET row_hash = ? WHERE rowid = ?", zip(hashes.tolist(), df['rid'].tolist()))
+        conn.commit()
+        updated += len(df)
+    return updated
+
+
+def backfill(db_name='altos_one.db', tables=HASH_TABLES):
+    """One-time row_hash for rows loaded before it existed, a rowid range at a time."""
+    conn = connect(db_name)
+    for table in tables:
+        ensure_row_hash_column(conn, table)
+        conn.commit()
+        types = column_types(conn, table)
+        updated = sum(_backfill_table(conn, name, types) for name in data_tables(conn, table))
+        print(f"Hashed {updated} rows in '{table}'.")
+        with editable_archives(table) as paths:
+            for path in paths:
+                conn.execute("ATTACH DATABASE ? AS arch", (path,))
+                try:
+                    arch_cols = [r[1] for r in conn.execute(f"PRAGMA arch.table_info({table})")]
+                    if 'row_hash' in arch_cols:
+                        # Columns the archive lacks hash as NULL, as the attach_archives view shows them
+                        updated = _backfill_table(conn, f"arch.{table}", types, arch_cols)
+                        print(f"Hashed {updated} rows in '{path}'.")
+                finally:
+                    conn.execute("DETACH DATABASE arch")
+    conn.close()
+    print("✅ row_hash backfill complete.")
+
+
+# --- diff -------------------------------------------------------------------
+
+def snapshot_dates(conn, table, count=2):
+    """The latest `count` snapshot dates of table, newest first."""
+    return [r[0] for r in conn.execute(f"SELECT DISTINCT date FROM {table} ORDER BY date DESC LIMIT ?", (count,))]
+
+
+def _key_hashes(conn, table, date, key):
+    """(key, row_hash) of one snapshot date; hashes rows that predate row_hash on the fly."""
+    source = route(conn, table, date)
+    types = column_types(conn, table)
+    hashed = 'row_hash' in types
+    if hashed:
+        df = pd.read_sql_query(f"SELECT {key} AS k, row_hash FROM {source} WHERE date = ? AND {key} IS NOT NULL",
+                               conn, params=(date,))
+    if not hashed or df['row_hash'].isna().any():
+        print(f"Some '{table}' rows for {date} have no row_hash (backfill them with snapshot_diff.py); hashing them now.")
+        full = pd.read_sql_query(f"SELECT {key} AS k, {hash_columns(types)} FROM {source} "
+                                 f"WHERE date = ? AND {key} IS NOT NULL", conn, params=(date,))
+        df = pd.DataFrame({'k': full['k'], 'row_hash': row_hashes(full, types)})
+    duplicates = df['k'].duplicated(keep='last')
+    if duplicates.any():
+        print(f"{int(duplicates.sum())} duplicate '{key}' values in '{table}' for {date}; keeping the last row of each.")
+        df = df[~duplicates]
+    return df
+
+
+def _rows_for_keys(conn, table, date, key, keys):
+    """Full rows of one date for a set of keys (through a temp key table)."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS diff_keys (k PRIMARY KEY)")
+    try:
+        conn.execute("DELETE FROM temp.diff_keys")
+        conn.executemany("INSERT OR IGNORE INTO temp.diff_keys VALUES (?)", [(k,) for k in keys])
+        df = pd.read_sql_query(
+            f"SELECT t.* FROM {route(conn, table, date)} t JOIN temp.diff_keys d ON d.k = t.{key} WHERE t.date = ?",
+            conn, params=(date,)
+        )
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.diff_keys")
+    return df.drop_duplicates(key, keep='last')
+
+
+def _keys_of(merged, mask):
+    return [k.item() if hasattr(k, 'item') else k for k in merged.loc[mask, 'k']]
+
+
+def column_deltas(old, new, key):
+    """Long-format (key, column, old_value, new_value, delta) for every content column that differs."""
+    old = old.set_index(key)
+    new = new.set_index(key).reindex(old.index)
+    frames = []
+    for col in old.columns:
+        if col in NON_CONTENT or col not in new.columns:
+            continue
+        o, n = old[col], new[col]
+        differs = ~((o == n) | (o.isna() & n.isna()))
+        if not differs.any():
+            continue
+        part = pd.DataFrame({key: o.index[differs], 'column': col,
+                             'old_value': o[differs].to_numpy(), 'new_value': n[differs].to_numpy()})
+        if pd.api.types.is_numeric_dtype(o) and pd.api.types.is_numeric_dtype(n):
+            part['delta'] = (n[differs] - o[differs]).to_numpy()
+        frames.append(part)
+    if not frames:
+        return pd.DataFrame(columns=[key, 'column', 'old_value', 'new_value', 'delta'])
+    return pd.concat(frames, ignore_index=True).sort_values([key, 'column'], ignore_index=True)
+
+
+def diff_snapshots(conn, table, old_date, new_date, key=None):
+    """
+    {'added', 'removed', 'changed', 'deltas'} DataFrames between two snapshot
+    dates of table: added/removed hold the full rows, changed the new rows and
+    deltas one row per changed column. key defaults to listing_id/pending_id.
+    """
+    key = key or DIFF_KEYS[table]
+    merged = _key_hashes(conn, table, old_date, key).merge(
+        _key_hashes(conn, table, new_date, key), on='k', how='outer', suffixes=('_old', '_new'), indicator=True
+    )
+    added = _keys_of(merged, merged['_merge'] == 'right_only')
+    removed = _keys_of(merged, merged['_merge'] == 'left_only')
+    changed = _keys_of(merged, (merged['_merge'] == 'both') & (merged['row_hash_old'] != merged['row_hash_new']))
+
+    changed_old = _rows_for_keys(conn, table, old_date, key, changed)
+    changed_new = _rows_for_keys(conn, table, new_date, key, changed)
+    return {
+        'added': _rows_for_keys(conn, table, new_date, key, added),
+        'removed': _rows_for_keys(conn, table, old_date, key, removed),
+        'changed': changed_new,
+        'deltas': column_deltas(changed_old, changed_new, key),
+    }
+
+
+def change_counts(conn, table, old_date, new_date, key=None):
+    """Just the sizes of the added/removed/changed sets (hash columns only)."""
+    key = key or DIFF_KEYS[table]
+    merged = _key_hashes(conn, table, old_date, key).merge(
+        _key_hashes(conn, table, new_date, key), on='k', how='outer', suffixes=('_old', '_new'), indicator=True
+    )
+    both = merged['_merge'] == 'both'
+    return {
+        'added': int((merged['_merge'] == 'right_only').sum()),
+        'removed': int((merged['_merge'] == 'left_only').sum()),
+        'changed': int((both & (merged['row_hash_old'] != merged['row_hash_new'])).sum()),
+        'unchanged': int((both & (merged['row_hash_old'] == merged['row_hash_new'])).sum()),
+    }
+
+
+def report_latest_changes(table, db_name='altos_one.db'):
+    """Print the change counts between the two newest snapshot dates (run after a load)."""
+    conn = connect(db_name)
+    try:
+        dates = snapshot_dates(conn, table)
+        if len(dates) < 2:
+            return None
+        counts = change_counts(conn, table, dates[1], dates[0])
+    finally:
+        conn.close()
+    print(f"'{table}' {dates[1]} -> {dates[0]}: {counts['added']} added, {counts['removed']} removed, "
+          f"{counts['changed']} changed, {counts['unchanged']} unchanged.")
+    return counts
+
+
+def export_diff(table, old_date=None, new_date=None, key=None, db_name='altos_one.db'):
+    """Write {table}_diff_{old}_{new}_{added,removed,changed,deltas}.csv; dates default to the newest two."""
+    with reader(db_name) as conn:
+        # Either date may have moved to the archive tier
+        attach_archives(conn)
+        if old_date is None or new_date is None:
+            dates = snapshot_dates(conn, table)
+            if len(dates) < 2:
+                print(f"'{table}' has fewer than two snapshot dates.")
+                return None
+            new_date, old_date = new_date or dates[0], old_date or dates[1]
+        result = diff_snapshots(conn, table, old_date, new_date, key)
+    for name, df in result.items():
+        output_file = f"{table}_diff_{old_date}_{new_date}_{name}.csv"
+        df.to_csv(output_file, index=False)
+        print(f"✅ {len(df)} {name} rows written to '{output_file}'.")
+    return result
+
+
+def main():
+    if input("Backfill row hashes for rows loaded before they existed? (y/n): ").strip().lower() == 'y':
+        backfill()
+        return
+    table = input("Table to diff (listings or pendings): ").strip().lower()
+    if table not in HASH_TABLES:
+        print("Invalid table name. Please enter 'listings' or 'pendings'.")
+        return
+    old_date = input("Older snapshot date (YYYY-MM-DD, Enter for the second newest): ").strip() or None
+    new_date = input("Newer snapshot date (YYYY-MM-DD, Enter for the newest): ").strip() or None
+    key = input(f"Match rows on (Enter for {DIFF_KEYS[table]}, or property_key): ").strip() or None
+    export_diff(table, old_date, new_date, key)
+
+
+if __name__ == "__main__":
+    main()
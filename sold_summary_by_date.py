@@ -1,16 +1,13 @@
-import sqlite3
 import pandas as pd
-
-def main():
-    db_path = 'altos_one.db'
-    conn = sqlite3.connect(db_path)
-
-    # Prompt: only top 50 metros?
-    top50_choice = input("Include only top50 metros? (y/n, default n): ").strip().lower()
-    filter_top50 = (top50_choice == 'y')
-
-    # Load solds table
-    df = pd.read_sql_query("SELECT * FROM solds", conn)
+from db import reader
+
+def summarize_by_date(db_path='altos_one.db', filter_top50=False):
+    """Monthly sold count, median price and mean sale-to-list ratio by market and type."""
+    with reader(db_path) as conn:
+        # Load solds table
+        df = pd.read_sql_query("SELECT * FROM solds", conn)
+        # Load metro mapping with display_name
+        mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
     # Process sold_date -> sold_month
     df['sold_date'] = pd.to_datetime(df['sold_date'], errors='coerce')
     df['sold_month'] = df['sold_date'].dt.strftime('%Y-%m')
@@ -18,9 +15,6 @@ def main():
     df['sold_price'] = pd.to_numeric(df['sold_price'], errors='coerce')
     df['list_price_final'] = pd.to_numeric(df['list_price_final'], errors='coerce')
 
-    # Load metro mapping with display_name
-    mapping = pd.read_sql_query("SELECT zipcode, metro, display_name FROM zip_to_metro", conn)
-    conn.close()
     # Merge to add metro and display_name
     df = pd.merge(df, mapping, left_on='zip', right_on='zipcode', how='left')
     df.drop(columns=['zipcode'], inplace=True)
@@ -43,12 +37,21 @@ def main():
     df['market_name'] = df.apply(
         lambda r: r['display_name'] if r['display_name'] else r['metro'], axis=1
     )
-    grouped = df.groupby(['sold_month', 'market_name', 'type']).agg(
+    return df.groupby(['sold_month', 'market_name', 'type']).agg(
         sold_count=('sold_price', 'size'),
         median_sold_price=('sold_price', 'median'),
         average_sale_to_list_ratio=('sale_to_list_ratio', 'mean')
     ).reset_index()
 
+def main():
+    db_path = 'altos_one.db'
+
+    # Prompt: only top 50 metros?
+    top50_choice = input("Include only top50 metros? (y/n, default n): ").strip().lower()
+    filter_top50 = (top50_choice == 'y')
+
+    grouped = summarize_by_date(db_path, filter_top50)
+
     # Output to CSV
     default_out = 'solds_summary.csv'
     out_file = input(f"Enter output CSV filename (default {default_out}): ").strip() or default_out
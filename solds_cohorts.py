@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from db import connect, reader
+from data_versions import data_version_token
+from normalize import DAY_COLUMNS, metro_names
+
+# Days-on-market distributions by listing cohort.
+#
+# Solds carry listed_on_day / pending_on_day / sold_day (days since
+# 1970-01-01, set at ingest by normalize.normalize_chunk), so day counts are
+# integer subtractions with no date parsing. For every (cohort week of
+# listed_on, metro_key, type) we keep two histograms, stored as little-endian
+# uint32 BLOBs over BIN_EDGES:
+#   - 'pending': pending_on - listed_on
+#   - 'close':   sold_date  - listed_on
+# Daily bins for the first 90 days, weekly bins to a year, one overflow bin.
+# Like solds_rollup, histograms add up, so each snapshot date is folded in
+# once and can be subtracted again before its rows are deleted.
+
+BIN_EDGES = np.concatenate([np.arange(0, 91), np.arange(97, 365, 7), [365]]).astype(np.int64)
+N_BINS = len(BIN_EDGES)                   # the last bin holds 365+ days
+METRICS = {'pending': 'pending_on_day', 'close': 'sold_day'}
+NO_METRO = 0      # metro_key for rows without one (real keys start at 1)
+NO_TYPE = ''
+CHUNKSIZE = 100000
+DAY_SQL = "CASE WHEN date(substr({col}, 1, 10)) = substr({col}, 1, 10) " \
+          "THEN CAST(julianday(substr({col}, 1, 10)) - 2440587.5 AS INTEGER) END"
+
+
+def create_cohort_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS solds_cohorts (
+        cohort_week TEXT NOT NULL,
+        metro_key INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        hist BLOB NOT NULL,
+        PRIMARY KEY (cohort_week, metro_key, type, metric)
+    )
+    """)
+    # Snapshot dates folded in, with the solds data version at the time
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS solds_cohorts_dates (
+        date TEXT PRIMARY KEY,
+        version TEXT,
+        rows INTEGER,
+        built_at TEXT
+    )
+    """)
+
+
+def ensure_day_columns(conn):
+    """Add the solds day-number columns if missing and fill them for existing rows. Returns rows filled."""
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(solds)")]
+    filled = 0
+    for col, day_col in DAY_COLUMNS.items():
+        if day_col not in cols:
+            conn.execute(f"ALTER TABLE solds ADD COLUMN {day_col} INTEGER")
+            # One-time fill in SQL; rejects dates SQLite would silently roll over (2025-02-30)
+            cursor = conn.execute(f"UPDATE solds SET {day_col} = {DAY_SQL.format(col=col)} WHERE {col} IS NOT NULL")
+            filled = max(filled, cursor.rowcount)
+    return filled
+
+
+# --- histograms -------------------------------------------------------------
+
+def day_bins(days):
+    """Bin index of each day count (vectorized); -1 for missing or negative counts."""
+    days = np.asarray(days, dtype=float)
+    valid = np.isfinite(days) & (days >= 0)
+    bins = np.full(days.shape, -1, dtype=np.int64)
+    bins[valid] = np.searchsorted(BIN_EDGES, days[valid], side='right') - 1
+    return bins
+
+
+def cohort_weeks(listed_days):
+    """Monday (YYYY-MM-DD) of each listed_on day number's week."""
+    monday = listed_days - (listed_days + 3) % 7      # 1970-01-01 was a Thursday
+    unique = np.unique(monday)
+    names = pd.Series(np.datetime_as_string(np.datetime64('1970-01-01') + unique.astype('timedelta64[D]')),
+                      index=unique)
+    return names.reindex(monday).to_numpy()
+
+
+def histograms(df):
+    """
+    {(cohort_week, metro_key, type, metric): counts} for a frame of solds day
+    columns, binned with one np.bincount per metric.
+    """
+    df = df[df['listed_on_day'].notnull()]
+    if df.empty:
+        return {}
+    listed = df['listed_on_day'].to_numpy(dtype=np.int64)
+    keys = pd.DataFrame({
+        'cohort_week': cohort_weeks(listed),
+        'metro_key': df['metro_key'].fillna(NO_METRO).astype('int64').to_numpy(),
+        'type': df['type'].fillna(NO_TYPE).to_numpy(),
+    })
+    codes, groups = pd.MultiIndex.from_frame(keys).factorize()
+    out = {}
+    for metric, day_col in METRICS.items():
+        bins = day_bins(df[day_col].to_numpy(dtype=float) - listed)
+        ok = bins >= 0
+        counts = np.bincount(codes[ok] * N_BINS + bins[ok], minlength=len(groups) * N_BINS)
+        counts = counts.reshape(len(groups), N_BINS)
+        for i in np.flatnonzero(counts.sum(axis=1)):
+            week, metro_key, type_ = groups[i]
+            out[(str(week), int(metro_key), str(type_), metric)] = counts[i]
+    return out
+
+
+def persist(conn, hists, sign=1):
+    """Add (sign=1) or subtract (sign=-1) histograms into solds_cohorts."""
+    if not hists:
+        return
+    existing = {}
+    for week in {k[0] for k in hists}:
+        for cohort_week, metro_key, type_, metric, blob in conn.execute(
+            "SELECT cohort_week, metro_key, type, metric, hist FROM solds_cohorts WHERE cohort_week = ?", (week,)
+        ):
+            existing[(cohort_week, metro_key, type_, metric)] = np.frombuffer(blob, dtype='<u4').astype(np.int64)
+    upserts, deletes = [], []
+    for key, counts in hists.items():
+        total = existing.get(key, np.zeros(N_BINS, dtype=np.int64)) + sign * counts
+        total = np.maximum(total, 0)
+        if total.sum() == 0:
+            deletes.append(key)
+        else:
+            upserts.append(key + (int(total.sum()), total.astype('<u4').tobytes()))
+    conn.executemany("INSERT OR REPLACE INTO solds_cohorts VALUES (?, ?, ?, ?, ?, ?)", upserts)
+    conn.executemany("DELETE FROM solds_cohorts WHERE cohort_week = ? AND metro_key = ? AND type = ? AND metric = ?",
+                     deletes)
+
+
+def merge_histograms(parts):
+    merged = {}
+    for part in parts:
+        for key, counts in part.items():
+            merged[key] = merged[key] + counts if key in merged else counts
+    return merged
+
+
+def histograms_for_date(conn, date, chunksize=CHUNKSIZE):
+    """Histograms and row count of one snapshot date of solds (integer columns only)."""
+    parts = []
+    rows = 0
+    for chunk in pd.read_sql_query(
+        "SELECT listed_on_day, pending_on_day, sold_day, metro_key, type FROM solds WHERE date = ?",
+        conn, params=(date,), chunksize=chunksize
+    ):
+        rows += len(chunk)
+        parts.append(histograms(chunk))
+    return merge_histograms(parts), rows
+
+
+def remove_date(conn, date):
+    """Subtract one snapshot date from the cohorts. Call on a write connection before deleting its solds rows."""
+    create_cohort_tables(conn)
+    if not conn.execute("SELECT 1 FROM solds_cohorts_dates WHERE date = ?", (date,)).fetchone():
+        return
+    hists, _ = histograms_for_date(conn, date)
+    persist(conn, hists, sign=-1)
+    conn.execute("DELETE FROM solds_cohorts_dates WHERE date = ?", (date,))
+
+
+def refresh_cohorts(db_name='altos_one.db', rebuild=False):
+    """
+    Fold solds snapshot dates not yet counted into the cohort histograms.
+    Rebuilds when a counted date was reloaded or changed outside remove_date
+    (including metro_key reassignment). Returns the number of dates added.
+    """
+    conn = connect(db_name)
+    create_cohort_tables(conn)
+    filled = ensure_day_columns(conn)
+    if filled:
+        print(f"Filled day-number columns for {filled} existing solds rows.")
+    conn.commit()
+    counted = dict(conn.execute("SELECT date, version FROM solds_cohorts_dates").fetchall())
+    dates = [r[0] for r in conn.execute("SELECT DISTINCT date FROM solds ORDER BY date")]
+    versions = {d: data_version_token(conn, ['solds'], [d]) for d in dates}
+    if not rebuild and any(d not in versions or versions[d] != v for d, v in counted.items()):
+        print("Previously counted solds dates changed; rebuilding cohorts.")
+        rebuild = True
+    if rebuild:
+        conn.execute("DELETE FROM solds_cohorts")
+        conn.execute("DELETE FROM solds_cohorts_dates")
+        counted = {}
+
+    new_dates = [d for d in dates if d not in counted]
+    for d in new_dates:
+        hists, rows = histograms_for_date(conn, d)
+        persist(conn, hists)
+        conn.execute("INSERT OR REPLACE INTO solds_cohorts_dates VALUES (?, ?, ?, ?)",
+                     (d, versions[d], rows, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+        print(f"Added {rows} solds rows for {d} to the cohort histograms.")
+    conn.close()
+    return len(new_dates)
+
+
+# --- reading ----------------------------------------------------------------
+
+def percentiles(hists, qs=(0.25, 0.5, 0.75)):
+    """Per-row percentiles (days) of an (n, N_BINS) histogram array, interpolated within bins."""
+    hists = np.asarray(hists, dtype=float)
+    upper = np.append(BIN_EDGES[1:], BIN_EDGES[-1])      # overflow bin reports its lower edge
+    cum = hists.cumsum(axis=1)
+    n = cum[:, -1:]
+    out = []
+    for q in qs:
+        target = q * n
+        idx = (cum < target).sum(axis=1).clip(max=N_BINS - 1)
+        rows = np.arange(len(hists))
+        before = np.where(idx > 0, cum[rows, idx - 1], 0.0)
+        in_bin = hists[rows, idx]
+        frac = np.divide(target[:, 0] - before, in_bin, out=np.zeros(len(hists)), where=in_bin > 0)
+        out.append(BIN_EDGES[idx] + frac * (upper[idx] - BIN_EDGES[idx]))
+    return np.column_stack(out) if out else np.empty((len(hists), 0))
+
+
+def cohort_velocity(db_name='altos_one.db', metric='pending', by_metro=True, by_type=True, since=None):
+    """
+    Days-to-pending ('pending') or days-to-close ('close') per listing cohort
+    week (and metro/type): count, p25, median, p75 and mean, from the stored
+    histograms only.
+    """
+    with reader(db_name) as conn:
+        query = "SELECT cohort_week, metro_key, type, n, hist FROM solds_cohorts WHERE metric = ?"
+        params = [metric]
+        if since:
+            query += " AND cohort_week >= ?"
+            params.append(since)
+        rows = conn.execute(query, params).fetchall()
+        names = metro_names(conn, display=True)
+    if not rows:
+        return pd.DataFrame(columns=['cohort_week', 'metro', 'type', 'count', 'p25_days', 'median_days',
+                                     'p75_days', 'mean_days'])
+    keys = pd.DataFrame([r[:3] for r in rows], columns=['cohort_week', 'metro_key', 'type'])
+    hists = np.vstack([np.frombuffer(r[4], dtype='<u4') for r in rows]).astype(np.int64)
+    group_cols = ['cohort_week'] + (['metro_key'] if by_metro else []) + (['type'] if by_type else [])
+    codes, groups = pd.MultiIndex.from_frame(keys[group_cols]).factorize()
+    summed = np.zeros((len(groups), N_BINS), dtype=np.int64)
+    np.add.at(summed, codes, hists)
+
+    result = pd.DataFrame(list(groups), columns=group_cols)
+    if by_metro:
+        result.insert(1, 'metro', result.pop('metro_key').map(names).fillna('UNKNOWN'))
+    result['count'] = summed.sum(axis=1)
+    p = percentiles(summed)
+    result['p25_days'], result['median_days'], result['p75_days'] = p[:, 0], p[:, 1], p[:, 2]
+    mids = (BIN_EDGES + np.append(BIN_EDGES[1:], BIN_EDGES[-1])) / 2
+    result['mean_days'] = (summed * mids).sum(axis=1) / result['count']
+    return result.sort_values(['cohort_week'] + result.columns[1:len(group_cols)].tolist(), ignore_index=True)
+
+
+def main():
+    rebuild = input("Rebuild the cohort histograms from scratch? (y/n, default n): ").strip().lower() == 'y'
+    added = refresh_cohorts(rebuild=rebuild)
+    print(f"✅ Cohort histograms up to date ({added} snapshot date(s) added).")
+    for metric in METRICS:
+        output_file = f"solds_cohort_days_to_{metric}.csv"
+        cohort_velocity(metric=metric).round(1).to_csv(output_file, index=False)
+        print(f"✅ Exported days-to-{metric} by cohort week, metro and type to '{output_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import math
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from db import connect, reader
+from data_versions import data_version_token
+from analyze_solds_summary import join_metro, load_zip_to_metro, process_solds
+
+# Streaming, persisted aggregates behind analyze_solds_summary.aggregate_summary.
+#
+# Solds are consumed in chunks and folded into per-(sold_month, market_name,
+# type) accumulators: exact counts/sums (for sold_count and the mean
+# sale-to-list ratio) plus a mergeable quantile sketch of sold_price for the
+# median. The sketch uses logarithmic buckets (as in DDSketch): every value in
+# bucket i lies within RELATIVE_ERROR of the bucket's representative value, so
+# the reported median is within that relative error of the exact one.
+# Accumulators from different chunks, partitions or weeks merge by adding
+# counts, so loading a new week only scans that week.
+
+RELATIVE_ERROR = 0.005
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+LOG_GAMMA = math.log(GAMMA)
+ZERO_BUCKET = -(2 ** 31)  # prices <= 0
+
+CHUNKSIZE = 100000
+KEYS = ['sold_month', 'market_name', 'type', 'top50']
+NO_TYPE = ''  # stored type for solds without one
+SOLDS_COLUMNS = "date, zip, type, sold_date, sold_price, list_price_final"
+
+
+def create_rollup_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS solds_rollup (
+        sold_month TEXT NOT NULL,
+        market_name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        top50 INTEGER NOT NULL,
+        sold_count INTEGER NOT NULL,
+        ratio_count INTEGER NOT NULL,
+        ratio_sum REAL NOT NULL,
+        PRIMARY KEY (sold_month, market_name, type, top50)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS solds_rollup_sketch (
+        sold_month TEXT NOT NULL,
+        market_name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        top50 INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (sold_month, market_name, type, top50, bucket)
+    )
+    """)
+    # Snapshot dates folded into the rollup, with the solds data version at the time
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS solds_rollup_dates (
+        date TEXT PRIMARY KEY,
+        version TEXT,
+        rows INTEGER,
+        rolled_up_at TEXT
+    )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS solds_rollup_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+# --- sketch -----------------------------------------------------------------
+
+def price_buckets(prices):
+    """Sketch bucket index for each price (vectorized)."""
+    prices = np.asarray(prices, dtype=float)
+    buckets = np.full(prices.shape, ZERO_BUCKET, dtype=np.int64)
+    positive = prices > 0
+    buckets[positive] = np.ceil(np.log(prices[positive]) / LOG_GAMMA).astype(np.int64)
+    return buckets
+
+
+def bucket_values(buckets):
+    """Representative value of each bucket (within RELATIVE_ERROR of every value in it)."""
+    buckets = np.asarray(buckets, dtype=np.int64)
+    values = 2 * np.exp(buckets * LOG_GAMMA) / (GAMMA + 1)
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+
+def sketch_medians(sketch):
+    """
+    Median per group from sketch rows (KEYS + bucket + count), matching
+    pandas' median: the mean of the two middle values for an even count.
+    """
+    if sketch.empty:
+        return pd.DataFrame(columns=KEYS + ['median_sold_price'])
+    s = sketch.sort_values(KEYS + ['bucket'], ignore_index=True)
+    grouped = s.groupby(KEYS, sort=False)['count']
+    s['cum'] = grouped.cumsum()
+    s['n'] = grouped.transform('sum')
+    s['value'] = bucket_values(s['bucket'])
+    before = s['cum'] - s['count']
+    lo = (s['n'] - 1) // 2
+    hi = s['n'] // 2
+    lower = s[(before <= lo) & (s['cum'] > lo)].set_index(KEYS)['value']
+    upper = s[(before <= hi) & (s['cum'] > hi)].set_index(KEYS)['value']
+    return ((lower + upper) / 2).rename('median_sold_price').reset_index()
+
+
+# --- accumulators -----------------------------------------------------------
+
+def accumulate(df):
+    """
+    Fold a chunk of solds (already joined with metro/display_name and run
+    through process_solds) into (counts, sketch) accumulator frames.
+    """
+    df = df.copy()
+    df['market_name'] = df['display_name'].where(df['display_name'] != '', df['metro'])
+    df['top50'] = (df['display_name'] != '').astype(int)
+    # Rows without a type still count towards the monthly totals but, as in
+    # aggregate_summary, not towards any summary group.
+    df = df.dropna(subset=['sold_month'])
+    df['type'] = df['type'].fillna(NO_TYPE)
+
+    sp = df['sold_price']
+    lpf = df['list_price_final']
+    valid = sp.notnull() & lpf.notnull() & (lpf != 0)
+    ratio = (1 + (sp - lpf) / lpf).where(valid)
+    df['ratio'] = ratio.where((ratio >= 0.5) & (ratio <= 2.0))
+
+    counts = df.groupby(KEYS).agg(
+        sold_count=('sold_price', 'size'),
+        ratio_count=('ratio', 'count'),
+        ratio_sum=('ratio', 'sum'),
+    ).reset_index()
+
+    priced = df[df['sold_price'].notnull()]
+    sketch = (
+        priced.assign(bucket=price_buckets(priced['sold_price']))
+        .groupby(KEYS + ['bucket']).size().reset_index(name='count')
+    )
+    return counts, sketch
+
+
+def merge_accumulators(parts):
+    """Merge (counts, sketch) pairs from chunks, partitions or weeks."""
+    parts = list(parts)
+    counts = pd.concat([c for c, _ in parts], ignore_index=True)
+    sketch = pd.concat([s for _, s in parts], ignore_index=True)
+    counts = counts.groupby(KEYS, as_index=False)[['sold_count', 'ratio_count', 'ratio_sum']].sum()
+    sketch = sketch.groupby(KEYS + ['bucket'], as_index=False)['count'].sum()
+    return counts, sketch
+
+
+def persist(conn, counts, sketch, sign=1):
+    """Add (sign=1) or subtract (sign=-1) accumulators into the rollup tables."""
+    conn.executemany(
+        """
+        INSERT INTO solds_rollup VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sold_month, market_name, type, top50) DO UPDATE SET
+            sold_count = sold_count + excluded.sold_count,
+            ratio_count = ratio_count + excluded.ratio_count,
+            ratio_sum = ratio_sum + excluded.ratio_sum
+        """,
+        [(m, k, t, int(top), sign * int(n), sign * int(rc), sign * float(rs))
+         for m, k, t, top, n, rc, rs in counts[KEYS + ['sold_count', 'ratio_count', 'ratio_sum']].itertuples(index=False)]
+    )
+    conn.executemany(
+        """
+        INSERT INTO solds_rollup_sketch VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sold_month, market_name, type, top50, bucket) DO UPDATE SET
+            count = count + excluded.count
+        """,
+        [(m, k, t, int(top), int(b), sign * int(c))
+         for m, k, t, top, b, c in sketch[KEYS + ['bucket', 'count']].itertuples(index=False)]
+    )
+    conn.execute("DELETE FROM solds_rollup WHERE sold_count <= 0")
+    conn.execute("DELETE FROM solds_rollup_sketch WHERE count <= 0")
+
+
+def accumulate_date(conn, date, mapping, chunksize=CHUNKSIZE):
+    """Scan one snapshot date of solds in chunks and return its merged accumulators and row count."""
+    parts = []
+    rows = 0
+    for chunk in pd.read_sql_query(f"SELECT {SOLDS_COLUMNS} FROM solds WHERE date = ?", conn,
+                                   params=(date,), chunksize=chunksize):
+        rows += len(chunk)
+        parts.append(accumulate(join_metro(process_solds(chunk), mapping)))
+    if not parts:
+        return None, 0
+    return merge_accumulators(parts), rows
+
+
+def remove_date(conn, date, db_name='altos_one.db'):
+    """
+    Subtract one snapshot date's contribution from the rollup. Call on a write
+    connection before deleting that date's solds rows.
+    """
+    create_rollup_tables(conn)
+    if not conn.execute("SELECT 1 FROM solds_rollup_dates WHERE date = ?", (date,)).fetchone():
+        return
+    acc, _ = accumulate_date(conn, date, load_zip_to_metro(db_name))
+    if acc is not None:
+        persist(conn, *acc, sign=-1)
+    conn.execute("DELETE FROM solds_rollup_dates WHERE date = ?", (date,))
+
+
+def refresh_rollup(db_name='altos_one.db', rebuild=False):
+    """
+    Fold any solds snapshot dates not yet in the rollup into it. Rebuilds from
+    scratch when zip_to_metro changed or a rolled-up date was reloaded or
+    removed outside remove_date (its old contribution can't be subtracted).
+    """
+    conn = connect(db_name)
+    create_rollup_tables(conn)
+    mapping_token = data_version_token(conn, ['zip_to_metro'])
+    row = conn.execute("SELECT value FROM solds_rollup_meta WHERE key = 'zip_to_metro'").fetchone()
+    rolled = dict(conn.execute("SELECT date, version FROM solds_rollup_dates").fetchall())
+    dates = [r[0] for r in conn.execute("SELECT DISTINCT date FROM solds ORDER BY date")]
+    versions = {d: data_version_token(conn, ['solds'], [d]) for d in dates}
+
+    if not rebuild and rolled:
+        if row is None or row[0] != mapping_token:
+            print("zip_to_metro changed since the last rollup; rebuilding.")
+            rebuild = True
+        elif any(d not in versions or versions[d] != v for d, v in rolled.items()):
+            print("Previously rolled-up solds dates changed; rebuilding.")
+            rebuild = True
+    if rebuild:
+        conn.execute("DELETE FROM solds_rollup")
+        conn.execute("DELETE FROM solds_rollup_sketch")
+        conn.execute("DELETE FROM solds_rollup_dates")
+        rolled = {}
+
+    mapping = load_zip_to_metro(db_name)
+    new_dates = [d for d in dates if d not in rolled]
+    for d in new_dates:
+        acc, rows = accumulate_date(conn, d, mapping)
+        if acc is not None:
+            persist(conn, *acc)
+        conn.execute("INSERT OR REPLACE INTO solds_rollup_dates VALUES (?, ?, ?, ?)",
+                     (d, versions[d], rows, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+        print(f"Rolled up {rows} solds rows for {d}.")
+    conn.execute("INSERT OR REPLACE INTO solds_rollup_meta VALUES ('zip_to_metro', ?)", (mapping_token,))
+    conn.commit()
+    conn.close()
+    return len(new_dates)
+
+
+def summary_from_rollup(db_name='altos_one.db', calc_ratio=False, filter_top50=False):
+    """
+    (weekly counts, summary) with the same columns as analyze_solds_summary,
+    read from the persisted accumulators instead of the solds table.
+    """
+    with reader(db_name) as conn:
+        counts = pd.read_sql_query("SELECT * FROM solds_rollup", conn)
+        sketch = pd.read_sql_query("SELECT * FROM solds_rollup_sketch", conn)
+    if filter_top50:
+        counts = counts[counts['top50'] == 1]
+        sketch = sketch[sketch['top50'] == 1]
+
+    weeks_count = counts.groupby('sold_month', as_index=False)['sold_count'].sum()
+
+    counts = counts[counts['type'] != NO_TYPE]
+    summary = counts.merge(sketch_medians(sketch), on=KEYS, how='left')
+    # top50 follows from market_name, so dropping it never merges two groups
+    summary = summary.groupby(['sold_month', 'market_name', 'type'], as_index=False).agg(
+        median_sold_price=('median_sold_price', 'first'),
+        sold_count=('sold_count', 'sum'),
+        ratio_sum=('ratio_sum', 'sum'),
+        ratio_count=('ratio_count', 'sum'),
+    )
+    if calc_ratio:
+        summary['average_sale_to_list_ratio'] = summary['ratio_sum'] / summary['ratio_count'].replace(0, np.nan)
+    summary = summary.drop(columns=['ratio_sum', 'ratio_count'])
+    return weeks_count, summary
+
+
+def main():
+    rebuild = input("Rebuild the rollup from scratch? (y/n, default n): ").strip().lower() == 'y'
+    added = refresh_rollup(rebuild=rebuild)
+    print(f"✅ Solds rollup up to date ({added} snapshot date(s) added).")
+
+    top50_choice = input("Include only top50 metros? (y/n, default n): ").strip().lower()
+    calc_choice = input("Calculate list-to-sale ratio? (y/n, default n): ").strip().lower()
+    weeks_count, summary = summary_from_rollup(calc_ratio=(calc_choice == 'y'), filter_top50=(top50_choice == 'y'))
+    default_summary = 'solds_summary_by_date.csv'
+    summary_file = input(f"Enter filename for summary (default {default_summary}): ").strip() or default_summary
+    summary.to_csv(summary_file, index=False)
+    print(f"✅ Exported summary statistics to '{summary_file}' with {len(summary)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import math
+import numpy as np
+import pandas as pd
+from db import connect
+from week_partitions import data_tables
+
+# R*Tree spatial index over geo_lat/geo_long.
+#
+# Each fact table gets a companion virtual table <table>_geo keyed by the
+# fact row's rowid. Triggers keep it in sync, so every load through
+# insert_weekly_data maintains the index without extra work. The R*Tree is
+# only a coarse filter (it stores 32-bit floats, rounded outward); exact
+# distances are computed on the base table's coordinates.
+
+SPATIAL_TABLES = ['listings', 'pendings', 'solds']
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def create_spatial_index(conn, table):
+    """
+    Create (or rebuild) the <table>_geo R*Tree and the triggers that maintain
+    it, then backfill it from the existing rows. The caller commits.
+    """
+    geo = f"{table}_geo"
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {geo} USING rtree(id, min_lat, max_lat, min_long, max_long)")
+
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {geo}_insert AFTER INSERT ON {table}
+    WHEN NEW.geo_lat IS NOT NULL AND NEW.geo_long IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO {geo} VALUES (NEW.rowid, NEW.geo_lat, NEW.geo_lat, NEW.geo_long, NEW.geo_long);
+    END
+    """)
+    # INSERT OR REPLACE deletes the conflicting row; db.connect turns on
+    # recursive_triggers so that delete is seen here too.
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {geo}_delete AFTER DELETE ON {table}
+    BEGIN
+        DELETE FROM {geo} WHERE id = OLD.rowid;
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {geo}_update AFTER UPDATE OF geo_lat, geo_long ON {table}
+    BEGIN
+        DELETE FROM {geo} WHERE id = OLD.rowid;
+        INSERT INTO {geo}
+        SELECT NEW.rowid, NEW.geo_lat, NEW.geo_lat, NEW.geo_long, NEW.geo_long
+        WHERE NEW.geo_lat IS NOT NULL AND NEW.geo_long IS NOT NULL;
+    END
+    """)
+
+    # Rebuild from scratch so a recreated base table never leaves stale ids behind.
+    cursor.execute(f"DELETE FROM {geo}")
+    cursor.execute(f"""
+    INSERT INTO {geo}
+    SELECT rowid, geo_lat, geo_lat, geo_long, geo_long
+    FROM {table}
+    WHERE geo_lat IS NOT NULL AND geo_long IS NOT NULL
+    """)
+    return cursor.execute(f"SELECT COUNT(*) FROM {geo}").fetchone()[0]
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in miles."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def bounding_box(lat, lon, miles):
+    """(min_lat, max_lat, min_long, max_long) enclosing a circle of `miles` around a point."""
+    dlat = miles / MILES_PER_DEGREE_LAT
+    dlon = miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def query_bbox(conn, table, min_lat, max_lat, min_long, max_long, where="", params=()):
+    """Rows of `table` inside a bounding box, using the <table>_geo index (one per partition if partitioned)."""
+    box = (min_lat, max_lat, min_long, max_long)
+    frames = []
+    for physical in data_tables(conn, table):
+        query = f"""
+        SELECT t.*
+        FROM {physical}_geo g
+        JOIN {physical} t ON t.rowid = g.id
+        WHERE g.max_lat >= ? AND g.min_lat <= ?
+          AND g.max_long >= ? AND g.min_long <= ?
+          AND t.geo_lat BETWEEN ? AND ?
+          AND t.geo_long BETWEEN ? AND ?
+          {where}
+        """
+        frames.append(pd.read_sql_query(query, conn, params=box + box + tuple(params)))
+    if len(frames) == 1:
+        return frames[0]
+    if not frames:
+        return pd.read_sql_query(f"SELECT * FROM {table} WHERE 0", conn)
+    return pd.concat(frames, ignore_index=True)
+
+
+def query_radius(conn, table, lat, lon, miles, where="", params=()):
+    """Rows of `table` within `miles` of (lat, lon), nearest first, with a distance_miles column."""
+    df = query_bbox(conn, table, *bounding_box(lat, lon, miles), where=where, params=params)
+    df['distance_miles'] = haversine_miles(lat, lon, df['geo_lat'].to_numpy(float), df['geo_long'].to_numpy(float))
+    df = df[df['distance_miles'] <= miles]
+    return df.sort_values('distance_miles', kind='stable', ignore_index=True)
+
+
+def query_nearest(conn, table, lat, lon, k=10, max_miles=50.0, where="", params=(), start_miles=0.5):
+    """
+    The k rows of `table` nearest to (lat, lon), searching outwards by doubling
+    the radius until k rows are found or max_miles is reached.
+    """
+    miles = min(start_miles, max_miles)
+    while True:
+        df = query_radius(conn, table, lat, lon, miles, where=where, params=params)
+        if len(df) >= k or miles >= max_miles:
+            return df.head(k)
+        miles = min(miles * 2, max_miles)
+
+
+def _sold_since_clause(sold_since):
+    if sold_since is None:
+        return "", ()
+    return "AND t.sold_date >= ?", (sold_since,)
+
+
+def solds_in_bbox(conn, min_lat, max_lat, min_long, max_long, sold_since=None):
+    """Solds inside a bounding box, optionally only those with sold_date >= sold_since."""
+    where, params = _sold_since_clause(sold_since)
+    return query_bbox(conn, 'solds', min_lat, max_lat, min_long, max_long, where, params)
+
+
+def solds_within_radius(conn, lat, lon, miles, sold_since=None):
+    """Solds within `miles` of a point, e.g. solds within 1 mile in the last 90 days."""
+    where, params = _sold_since_clause(sold_since)
+    return query_radius(conn, 'solds', lat, lon, miles, where, params)
+
+
+def nearest_solds(conn, lat, lon, k=10, sold_since=None, max_miles=50.0):
+    """The k solds nearest to a point."""
+    where, params = _sold_since_clause(sold_since)
+    return query_nearest(conn, 'solds', lat, lon, k, max_miles, where, params)
+
+
+def main(db_name='altos_one.db'):
+    conn = connect(db_name)
+    for table in SPATIAL_TABLES:
+        for physical in data_tables(conn, table):
+            count = create_spatial_index(conn, physical)
+            print(f"✅ Spatial index '{physical}_geo' built with {count} rows.")
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import sqlite3
 import pandas as pd
+from db import connect
+from data_versions import bump_data_version
+from normalize import sync_metros
 
 METROS_CSV = 'metros_msa.csv'  # Path to your 50-metro mapping CSV
 DB_PATH     = 'altos_one.db'  # Path to your SQLite database
@@ -14,7 +17,7 @@ def update_metro_display(db_path=DB_PATH, csv_path=METROS_CSV):
     # Load the CSV mapping
     df = pd.read_csv(csv_path)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
     # 1) Add display_name column if missing
@@ -38,6 +41,8 @@ def update_metro_display(db_path=DB_PATH, csv_path=METROS_CSV):
         cursor.execute(sql, (disp_name, f"%{msa_key}%"))
         print(f"Mapped metro '%{msa_key}%' → '{disp_name}' ({cursor.rowcount} rows updated)")
 
+    bump_data_version(conn, 'zip_to_metro')
+    sync_metros(conn)
     conn.commit()
     conn.close()
     print("✅ Top‑50 MSA display names updated.")
@@ -0,0 +1,358 @@
+import re
+from datetime import datetime
+from db import connect
+
+# Optional partitioned layout for listings and pendings.
+#
+# partition_table('listings') moves the table's rows into one table per
+# snapshot week (listings_w20250404) or month (listings_m202504), each with
+# its own copy of the indexes and its own R*Tree. The original table is kept,
+# empty, as listings_template (the schema new partitions are created from),
+# and `listings` becomes a generated UNION ALL view over the partitions, so
+# every existing query keeps working unchanged.
+#
+#  - Loads: insert_weekly_data sends each chunk's rows to the partition for
+#    their date (split_by_partition), creating it on first use.
+#  - Deletes: delete_week_data drops a week partition outright (DROP TABLE).
+#  - Reads: route(conn, table, date) names the one partition holding a date,
+#    so `WHERE date = ?` queries touch a single small B-tree.
+#
+# SQLite allows at most 500 terms in a compound SELECT, so the view can span
+# at most 500 partitions (about 9 years of weeks; use 'month' for longer).
+
+PARTITION_TABLES = ['listings', 'pendings']
+GRANULARITIES = {'week': 'w', 'month': 'm'}
+
+
+def create_registry(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS partitioned_tables (
+        table_name TEXT PRIMARY KEY,
+        granularity TEXT NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS partitions (
+        table_name TEXT NOT NULL,
+        partition_key TEXT NOT NULL,
+        partition_name TEXT NOT NULL UNIQUE,
+        created_at TEXT,
+        PRIMARY KEY (table_name, partition_key)
+    )
+    """)
+
+
+def template_name(table):
+    return f"{table}_template"
+
+
+def granularity(conn, table):
+    """'week' or 'month' if table is partitioned, else None."""
+    try:
+        row = conn.execute("SELECT granularity FROM partitioned_tables WHERE table_name = ?", (table,)).fetchone()
+    except Exception:
+        # No registry: nothing is partitioned.
+        return None
+    return row[0] if row else None
+
+
+def is_partitioned(conn, table):
+    return granularity(conn, table) is not None
+
+
+def partition_key(date, gran):
+    """Partition key for a snapshot date: the date itself (week) or YYYY-MM (month)."""
+    date = str(date)[:10]
+    return date if gran == 'week' else date[:7]
+
+
+def partition_name(table, key, gran):
+    return f"{table}_{GRANULARITIES[gran]}{key.replace('-', '')}"
+
+
+def list_partitions(conn, table):
+    """[(partition_key, partition_name)] of table, oldest first."""
+    if not is_partitioned(conn, table):
+        return []
+    return conn.execute(
+        "SELECT partition_key, partition_name FROM partitions WHERE table_name = ? ORDER BY partition_key", (table,)
+    ).fetchall()
+
+
+def physical_tables(conn, table, schema='main'):
+    """The real tables behind `table`: the template and partitions if partitioned, else the table itself."""
+    if schema != 'main' or not is_partitioned(conn, table):
+        return [table]
+    return [template_name(table)] + [name for _, name in list_partitions(conn, table)]
+
+
+def index_name(table, name, suffix):
+    """
+    Name for the `suffix` index of physical table `name` of `table`. The
+    template keeps the logical table's names (idx_listings_metro_key), which
+    _copy_schema renames for each new partition.
+    """
+    return f"idx_{table}_{suffix}" if name == template_name(table) else f"idx_{name}_{suffix}"
+
+
+def data_tables(conn, table):
+    """The tables holding table's rows (the partitions, or the table itself)."""
+    if not is_partitioned(conn, table):
+        return [table]
+    return [name for _, name in list_partitions(conn, table)]
+
+
+def route(conn, table, date):
+    """
+    Table to read table's `date = ?` rows from: its partition when table is
+    partitioned and that partition exists, otherwise table itself (the view,
+    which also covers attached archives).
+    """
+    gran = granularity(conn, table)
+    if gran is None:
+        return table
+    row = conn.execute(
+        "SELECT partition_name FROM partitions WHERE table_name = ? AND partition_key = ?",
+        (table, partition_key(date, gran))
+    ).fetchone()
+    return row[0] if row else table
+
+
+# --- schema ---------------------------------------------------------------------
+
+def _table_sql(conn, table):
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+
+
+def _index_sql(conn, table):
+    """CREATE INDEX statements of table (constraint indexes come with the table SQL)."""
+    return [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+
+
+def _copy_schema(conn, table, source, target):
+    """Create `target` with source's columns, constraints and indexes (renamed for target)."""
+    sql = re.sub(r'^CREATE TABLE\s+(?:IF NOT EXISTS\s+)?("?)[\w]+\1', f'CREATE TABLE IF NOT EXISTS {target}',
+                 _table_sql(conn, source), count=1)
+    conn.execute(sql)
+    for index_sql in _index_sql(conn, source):
+        parts = _index_parts(index_sql)
+        if not parts:
+            continue
+        unique, name, cols = parts
+        suffix = name[len(f"idx_{table}_"):] if name.startswith(f"idx_{table}_") else name
+        conn.execute(f"CREATE {unique or ''}INDEX IF NOT EXISTS idx_{target}_{suffix} ON {target} {cols}")
+
+
+def _index_parts(index_sql):
+    """(unique, name, column list) of a CREATE INDEX statement, or None."""
+    m = re.match(r'CREATE (UNIQUE )?INDEX (?:IF NOT EXISTS )?"?(\w+)"? ON "?\w+"?\s*(\(.*\))', index_sql, re.S | re.I)
+    return m.groups() if m else None
+
+
+def drop_duplicate_indexes(conn, table):
+    """
+    Replace indexes named after the template (idx_listings_template_metro_key
+    on the template, idx_listings_w20250307_template_metro_key on partitions
+    copied from it) with the normal name, dropping the duplicate. Returns the
+    number dropped. The caller commits.
+    """
+    if not is_partitioned(conn, table):
+        return 0
+    template = template_name(table)
+    dropped = 0
+    for name in [template] + data_tables(conn, table):
+        prefix = f"idx_{template}_" if name == template else f"idx_{name}_template_"
+        for index, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (name,)
+        ).fetchall():
+            parts = _index_parts(sql)
+            if not index.startswith(prefix) or not parts:
+                continue
+            unique, _, cols = parts
+            conn.execute(f"CREATE {unique or ''}INDEX IF NOT EXISTS "
+                         f"{index_name(table, name, index[len(prefix):])} ON {name} {cols}")
+            conn.execute(f"DROP INDEX {index}")
+            dropped += 1
+    return dropped
+
+
+def rebuild_view(conn, table):
+    """(Re)generate the UNION ALL view named `table` over its partitions."""
+    template = template_name(table)
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({template})")]
+    selects = []
+    for _, name in list_partitions(conn, table):
+        have = {r[1] for r in conn.execute(f"PRAGMA table_info({name})")}
+        selects.append(f"SELECT {','.join(c if c in have else f'NULL AS {c}' for c in cols)} FROM {name}")
+    if not selects:
+        selects = [f"SELECT {','.join(cols)} FROM {template}"]
+    conn.execute(f"DROP VIEW IF EXISTS main.{table}")
+    conn.execute(f"CREATE VIEW {table} AS " + " UNION ALL ".join(selects))
+
+
+def _drop_spatial(conn, table):
+    for suffix in ('insert', 'delete', 'update'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_geo_{suffix}")
+    conn.execute(f"DROP TABLE IF EXISTS {table}_geo")
+
+
+def partition_for(conn, table, date, create=True):
+    """Partition table for date (creating it, its indexes and R*Tree if needed). The caller commits."""
+    gran = granularity(conn, table)
+    key = partition_key(date, gran)
+    row = conn.execute(
+        "SELECT partition_name FROM partitions WHERE table_name = ? AND partition_key = ?", (table, key)
+    ).fetchone()
+    if row or not create:
+        return row[0] if row else None
+    # Imported here so delete_week_data (altos.py delete-week) stays free of pandas
+    from spatial_index import create_spatial_index
+    name = partition_name(table, key, gran)
+    # sqlite3 opens no transaction for DDL, so open one here: the partition
+    # then commits (or rolls back) with the caller's rows
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    _copy_schema(conn, table, template_name(table), name)
+    create_spatial_index(conn, name)
+    conn.execute(
+        "INSERT INTO partitions (table_name, partition_key, partition_name, created_at) VALUES (?, ?, ?, ?)",
+        (table, key, name, datetime.now().isoformat(timespec='seconds'))
+    )
+    rebuild_view(conn, table)
+    return name
+
+
+def split_by_partition(conn, table, df):
+    """[(target table, rows)] for an ingest chunk: one entry per partition, or the whole chunk unpartitioned."""
+    if not is_partitioned(conn, table) or 'date' not in df.columns:
+        return [(table, df)]
+    return [(partition_for(conn, table, d), rows) for d, rows in df.groupby('date', sort=True)]
+
+
+def drop_partition(conn, table, key):
+    """DROP a partition (its indexes, triggers and R*Tree go with it). Returns its row count. The caller commits."""
+    row = conn.execute(
+        "SELECT partition_name FROM partitions WHERE table_name = ? AND partition_key = ?", (table, key)
+    ).fetchone()
+    if not row:
+        return 0
+    name = row[0]
+    count = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    _drop_spatial(conn, name)
+    conn.execute(f"DROP TABLE {name}")
+    conn.execute("DELETE FROM partitions WHERE partition_name = ?", (name,))
+    rebuild_view(conn, table)
+    return count
+
+
+def delete_date(conn, table, date):
+    """
+    Remove one snapshot date from a partitioned table: drops a week partition,
+    or deletes the date's rows from a month partition (dropping it once empty).
+    Returns the number of rows removed. The caller commits.
+    """
+    gran = granularity(conn, table)
+    key = partition_key(date, gran)
+    if gran == 'week':
+        return drop_partition(conn, table, key)
+    name = partition_for(conn, table, date, create=False)
+    if name is None:
+        return 0
+    removed = conn.execute(f"DELETE FROM {name} WHERE date = ?", (date,)).rowcount
+    if conn.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone() is None:
+        drop_partition(conn, table, key)
+    return removed
+
+
+# --- switching layouts ------------------------------------------------------------
+
+def partition_table(table, gran='week', db_name='altos_one.db'):
+    """Switch table to the partitioned layout, moving its rows into per-week/month partitions."""
+    if gran not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {list(GRANULARITIES)}")
+    conn = connect(db_name)
+    create_registry(conn)
+    if is_partitioned(conn, table):
+        dropped = drop_duplicate_indexes(conn, table)
+        conn.commit()
+        print(f"'{table}' is already partitioned by {granularity(conn, table)}"
+              + (f"; dropped {dropped} duplicate indexes." if dropped else "."))
+        conn.close()
+        return
+    template = template_name(table)
+    conn.execute(f"ALTER TABLE {table} RENAME TO {template}")
+    _drop_spatial(conn, table)
+    conn.execute("INSERT INTO partitioned_tables (table_name, granularity) VALUES (?, ?)", (table, gran))
+
+    cols = ",".join(r[1] for r in conn.execute(f"PRAGMA table_info({template})"))
+    dates = [r[0] for r in conn.execute(f"SELECT DISTINCT date FROM {template} ORDER BY date")]
+    for d in dates:
+        name = partition_for(conn, table, d)
+        cursor = conn.execute(f"INSERT INTO {name} ({cols}) SELECT {cols} FROM {template} WHERE date = ?", (d,))
+        print(f"Moved {cursor.rowcount} rows of '{table}' for {d} into '{name}'.")
+    conn.execute(f"DELETE FROM {template}")
+    rebuild_view(conn, table)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ '{table}' is now partitioned by {gran} ({len(dates)} snapshot dates).")
+
+
+def unpartition_table(table, db_name='altos_one.db'):
+    """Move a partitioned table's rows back into a single table and drop the partitions."""
+    conn = connect(db_name)
+    if not is_partitioned(conn, table):
+        print(f"'{table}' is not partitioned.")
+        conn.close()
+        return
+    drop_duplicate_indexes(conn, table)
+    template = template_name(table)
+    partitions = list_partitions(conn, table)
+    cols = ",".join(r[1] for r in conn.execute(f"PRAGMA table_info({template})"))
+    conn.execute(f"DROP VIEW {table}")
+    conn.execute(f"ALTER TABLE {template} RENAME TO {table}")
+    for key, name in partitions:
+        conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {name}")
+        _drop_spatial(conn, name)
+        conn.execute(f"DROP TABLE {name}")
+    conn.execute("DELETE FROM partitions WHERE table_name = ?", (table,))
+    conn.execute("DELETE FROM partitioned_tables WHERE table_name = ?", (table,))
+    from spatial_index import create_spatial_index
+    create_spatial_index(conn, table)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ Merged {len(partitions)} partitions back into '{table}'.")
+
+
+def drop_partitioned(conn, table):
+    """Remove a partitioned table entirely (view, partitions, template); used before recreating it."""
+    if not is_partitioned(conn, table):
+        return
+    for key, name in list_partitions(conn, table):
+        _drop_spatial(conn, name)
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute(f"DROP VIEW IF EXISTS {table}")
+    conn.execute(f"DROP TABLE IF EXISTS {template_name(table)}")
+    conn.execute("DELETE FROM partitions WHERE table_name = ?", (table,))
+    conn.execute("DELETE FROM partitioned_tables WHERE table_name = ?", (table,))
+
+
+def main():
+    table = input("Table to change (listings or pendings): ").strip().lower()
+    if table not in PARTITION_TABLES:
+        print("Invalid table name. Please enter 'listings' or 'pendings'.")
+        return
+    action = input("Partition it (enter 'week' or 'month') or merge partitions back (enter 'merge')? ").strip().lower()
+    if action in GRANULARITIES:
+        partition_table(table, action)
+    elif action == 'merge':
+        unpartition_table(table)
+    else:
+        print("Nothing changed.")
+
+
+if __name__ == "__main__":
+    main()